@@ -0,0 +1,79 @@
+from collections import defaultdict
+import math
+
+"""
+bounds computes lower bounds on the objective of an instance, the arcs used added over every
+demand, without building a model.
+
+* A demand from s to T uses at least as many arcs as the distance from s to its farthest terminal,
+  and at least one arc entering every terminal.
+* Every arc has S slots, so the demands that must cross a node cut, the arcs entering a terminal or
+  leaving a source, cannot take more than S slots per arc of the cut. An instance that breaks one of
+  these cuts, or that has a demand larger than S, is infeasible and its bound is infinite.
+"""
+
+def distances(graph, s) -> dict[int, int]:
+    dist = {s: 0}
+    to_visit = [s]
+    for i in to_visit:
+        for j in graph[i]:
+            if j not in dist:
+                dist[j] = dist[i] + 1
+                to_visit.append(j)
+    return dist
+
+def demand_bound(graph, s, T) -> float:
+    """
+    demand_bound returns the minimum amount of arcs of an arborescence from s to T, inf if a terminal
+    cannot be reached.
+    """
+    dist = distances(graph, s)
+    terminals = set(T) - {s}
+    if any(t not in dist for t in terminals):
+        return math.inf
+    return max([len(terminals)] + [dist[t] for t in terminals])
+
+def capacity_violations(graph, S, demands) -> list[str]:
+    """
+    capacity_violations returns a message for every demand larger than S and every node cut whose
+    demands do not fit in the slots of its arcs.
+    """
+    violations = []
+    for d, (_, _, v) in enumerate(demands):
+        if v > S:
+            violations.append(f"demand {d} requires {v} slots, S={S}")
+
+    indegree = [0 for _ in graph]
+    for outgoing in graph:
+        for j in outgoing:
+            indegree[j] += 1
+
+    entering = defaultdict(int)
+    leaving = defaultdict(int)
+    for s, T, v in demands:
+        if len(set(T) - {s}) > 0:
+            leaving[s] += v
+        for t in set(T) - {s}:
+            entering[t] += v
+
+    for t, slots in sorted(entering.items()):
+        if slots > S * indegree[t]:
+            violations.append(f"demands to node {t} require {slots} slots, its {indegree[t]} entering arcs have {S * indegree[t]}")
+    for s, slots in sorted(leaving.items()):
+        if slots > S * len(graph[s]):
+            violations.append(f"demands from node {s} require {slots} slots, its {len(graph[s])} leaving arcs have {S * len(graph[s])}")
+
+    return violations
+
+def lower_bound(graph, S, demands) -> dict:
+    """
+    lower_bound returns the bound of every demand, their sum as the bound of the instance, and the
+    capacity violations found, the bound is inf if there is any.
+    """
+    per_demand = [demand_bound(graph, s, T) for s, T, _ in demands]
+    violations = capacity_violations(graph, S, demands)
+    return {
+        "demands": per_demand,
+        "violations": violations,
+        "arcs": math.inf if len(violations) > 0 else sum(per_demand),
+    }
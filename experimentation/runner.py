@@ -1,7 +1,9 @@
 import os
 import datetime
 import signal
+import subprocess
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 group_config = [
@@ -23,6 +25,33 @@ group = 1
 
 instances_folder = "../MRSAinstances/instances"
 topologies_folder = "../MRSAinstances/topologies"
+# cuts found for an instance are shared by every solver and group that runs it
+cut_pool_folder = "cut_pool"
+os.makedirs(cut_pool_folder, exist_ok=True)
+# the best solution found for an instance is the MIP start and cutoff of the next executions
+incumbent_folder = "incumbent"
+os.makedirs(incumbent_folder, exist_ok=True)
+# topologies are parsed once and shared by every execution
+topology_cache_folder = "topology_cache"
+os.makedirs(topology_cache_folder, exist_ok=True)
+
+# Executions run concurrently, each one in its own instance_solver.py process.
+# The amount of concurrent executions is limited by the cores and by the memory budget, every
+# execution can take up to job_memory (the RLIMIT_AS set by instance_solver.py), and the cores
+# are split evenly between them as cplex threads. 0 takes the whole machine.
+jobs = 0
+cores = 0
+memory_budget = 0
+job_memory = 6 * 1024 * 1024 * 1024
+
+if cores == 0:
+    cores = os.cpu_count()
+if memory_budget == 0:
+    memory_budget = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+if jobs == 0:
+    jobs = cores
+jobs = max(1, min(jobs, cores, memory_budget // job_memory))
+threads = max(1, cores // jobs)
 
 export_folder = group_config[group-1]["export_folder"]
 timeout = group_config[group-1]["timeout"]
@@ -38,8 +67,8 @@ for root, dirs, files in os.walk(instances_folder):
 instances = pd.read_csv("experimentation/instances.csv")
 instances = instances[instances["group"].str.contains(str(group), regex=False)]
 total = len(instances)*len(solvers)
-i = 1
 
+executions = []
 for instance_name in instances["instance"]:
     filtered_files = list(filter(lambda file: instance_name in file, instance_files))
     if len(filtered_files) != 1:
@@ -48,16 +77,11 @@ for instance_name in instances["instance"]:
     file_name = os.path.basename(file_path)
     
     for solver in solvers:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{timestamp} - Processing {i}/{total}")
-        i+=1
-
         execution_name = f"{solver.lower()}:{instance_name}"
 
         if f"{execution_name}_solution_details.json" in os.listdir(export_folder):
-            print(f"Skipping {file_name} as it already exists in the export folder")
+            print(f"Skipping {file_name} with solver {solver} as it already exists in the export folder")
             continue
-        print(f"Running instance loader for {file_name} with solver {solver}")
 
         solver_arguments = [
             "-t", topologies_folder, 
@@ -65,6 +89,23 @@ for instance_name in instances["instance"]:
             "-e", export_folder,
             "-v", "True",
             "-m", solver,
-            "-to", timeout]
-        os.system(f"python instance_solver.py {' '.join(solver_arguments)}")
-        print()
+            "-to", timeout,
+            "-cp", cut_pool_folder,
+            "-tc", topology_cache_folder,
+            "-ib", incumbent_folder,
+            "-th", str(threads)]
+        executions.append((execution_name, solver_arguments))
+
+def run(execution_name, solver_arguments):
+    # the output of every execution is kept next to its export, so concurrent ones do not mix
+    with open(os.path.join(export_folder, f"{execution_name}.log"), "w") as log:
+        return subprocess.run(["python", "instance_solver.py", *solver_arguments],
+                              stdout=log, stderr=subprocess.STDOUT).returncode
+
+print(f"Running {len(executions)}/{total} executions, {jobs} at a time with {threads} threads each")
+with ThreadPoolExecutor(max_workers=jobs) as pool:
+    running = {pool.submit(run, execution_name, solver_arguments): execution_name
+               for execution_name, solver_arguments in executions}
+    for i, finished in enumerate(as_completed(running), 1):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{timestamp} - Processed {i}/{len(executions)}: {running[finished]} exited with {finished.result()}")
@@ -1,12 +1,182 @@
+from collections import defaultdict
+from collections.abc import Sequence
+import numpy as np
+
+
 def dfs(graph, start):
     reached = []
-    
+    visited = set()
+
     to_visit = [start]
     while len(to_visit) > 0:
         u = to_visit.pop()
-        if u in reached:
+        if u in visited:
             continue
+        visited.add(u)
         reached.append(u)
-        to_visit =  to_visit + graph[u]
+        to_visit.extend(graph[u])
+
+    return reached
+
+class CSRGraph(Sequence):
+    """
+    CSRGraph is an adjacency list graph kept in compressed sparse rows, the nodes reached from i are
+    indices[indptr[i]:indptr[i+1]]. graph[i] is the list of those nodes, it is only built the first
+    time it is read, so the arrays are not turned into lists up front.
+    """
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self._rows: list = [None for _ in range(len(self.indptr) - 1)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        i = range(len(self))[i]
+        if self._rows[i] is None:
+            self._rows[i] = self.indices[self.indptr[i]:self.indptr[i+1]].tolist()
+        return self._rows[i]
+
+def to_csr(graph):
+    """
+    to_csr returns the indptr and indices arrays of graph.
+    """
+    indptr = np.zeros(len(graph) + 1, dtype=np.int64)
+    np.cumsum([len(outgoing) for outgoing in graph], out=indptr[1:])
+    indices = np.fromiter((j for outgoing in graph for j in outgoing), dtype=np.int64, count=int(indptr[-1]))
+    return indptr, indices
+
+def arc_arrays(graph):
+    """
+    arc_arrays returns the tails and heads of the arcs of graph in adjacency order, read from the
+    compressed sparse rows when graph is a CSRGraph.
+    """
+    if isinstance(graph, CSRGraph):
+        indptr, indices = graph.indptr, graph.indices
+    else:
+        indptr, indices = to_csr(graph)
+    return np.repeat(np.arange(len(graph)), np.diff(indptr)), indices
+
+def out_arcs(graph):
+    """
+    out_arcs numbers the arcs of graph in adjacency order, the order the solvers use to build
+    their edges list, out[i] lists the (arc, j) pairs for the arcs leaving i.
+    """
+    out = [[] for _ in range(len(graph))]
+    tails, heads = arc_arrays(graph)
+    for k, (i, j) in enumerate(zip(tails.tolist(), heads.tolist())):
+        out[i].append((k, j))
+
+    return out
+
+def reach(out, values, start, threshold=0.999):
+    """
+    reach returns the set of nodes reached from start using only the arcs whose value is
+    greater than threshold, values[k] is the value of arc k as numbered by out_arcs.
+    """
+    reached = {start}
+    to_visit = [start]
+    while len(to_visit) > 0:
+        i = to_visit.pop()
+        for k, j in out[i]:
+            if j not in reached and values[k] > threshold:
+                reached.add(j)
+                to_visit.append(j)
+
+    return reached
+
+def incidence(keys, arc=-2):
+    """
+    incidence indexes arc based variable keys by the node they leave and the node they enter.
+
+    keys[arc] and keys[arc+1] are the arc (i, j), the remaining elements of the key
+    (demand, terminal, slot...) form its group.
+    outgoing[(*group, i)] lists the keys of the arcs leaving i and incoming[(*group, j)]
+    the keys of the arcs entering j, so flow constraints are built without scanning every variable.
+    """
+    outgoing = defaultdict(list)
+    incoming = defaultdict(list)
+    for k in keys:
+        a = arc % len(k)
+        group = k[:a] + k[a+2:]
+        outgoing[group + (k[a],)].append(k)
+        incoming[group + (k[a+1],)].append(k)
+
+    return outgoing, incoming
+
+def reach_arcs(out, used, start):
+    """
+    reach_arcs returns the set of nodes reached from start using only the arcs in used, a set of
+    arc numbers as numbered by out_arcs.
+    """
+    reached = {start}
+    to_visit = [start]
+    while len(to_visit) > 0:
+        i = to_visit.pop()
+        for k, j in out[i]:
+            if j not in reached and k in used:
+                reached.add(j)
+                to_visit.append(j)
+
+    return reached
+
+def min_cut(out, capacity, s, t, limit=float("inf"), eps=1e-9):
+    """
+    min_cut computes a maximum flow from s to t with Dinic's algorithm, capacity[k] is the
+    capacity of arc k as numbered by out_arcs. The search stops once the flow reaches limit.
+
+    It returns the flow value and the set of nodes reached from s in the residual graph, which is
+    the source side of a minimum cut when the flow is lower than limit.
+    """
+    n = len(out)
+    flow = [0.0 for _ in capacity]
+
+    # residual arcs of every node, (arc, node, 1) uses arc forward and (arc, node, -1) backwards
+    residual = [[(k, j, 1) for k, j in out[i]] for i in range(n)]
+    for i in range(n):
+        for k, j in out[i]:
+            residual[j].append((k, i, -1))
+
+    def left(k, direction):
+        return capacity[k] - flow[k] if direction == 1 else flow[k]
+
+    def levels():
+        level = [-1 for _ in range(n)]
+        level[s] = 0
+        to_visit = [s]
+        for i in to_visit:
+            for k, j, direction in residual[i]:
+                if level[j] < 0 and left(k, direction) > eps:
+                    level[j] = level[i] + 1
+                    to_visit.append(j)
+        return level
+
+    def push(i, f, level, next_arc):
+        if i == t:
+            return f
+        while next_arc[i] < len(residual[i]):
+            k, j, direction = residual[i][next_arc[i]]
+            available = left(k, direction)
+            if available > eps and level[j] == level[i] + 1:
+                pushed = push(j, min(f, available), level, next_arc)
+                if pushed > eps:
+                    flow[k] += direction * pushed
+                    return pushed
+            next_arc[i] += 1
+        return 0.0
+
+    total = 0.0
+    level = levels()
+    while level[t] >= 0 and total < limit:
+        next_arc = [0 for _ in range(n)]
+        pushed = push(s, float("inf"), level, next_arc)
+        while pushed > eps and total + pushed < limit:
+            total += pushed
+            pushed = push(s, float("inf"), level, next_arc)
+        total += pushed
+        level = levels()
 
-    return reached
\ No newline at end of file
+    return total, {i for i in range(n) if level[i] >= 0}
@@ -1,35 +1,106 @@
+import hashlib
 import os
+from typing import Iterator
+import numpy as np
+from graph import CSRGraph, to_csr
 
 T_graph = list[list[int]]
 T_demand = tuple[int, set[int], int]
 
 
 class Loader:
+    # parsed topologies by file path and cache path, every instance loaded by the process shares them
+    _graphs: dict[tuple[str, str], T_graph] = {}
+
     @staticmethod
     def load(topologies_path="../RSAinstances/topologies",
              instance="",
+             cache_path="",
+             chunk_size=0,
              ) -> dict:
-        
+        """
+        load returns the problem of instance. If chunk_size is greater than 0 its demands are not
+        read, demands is None and chunks yields them from the file chunk_size at a time instead.
+        """
         if instance == "":
             raise ValueError("Instance file must be provided")
-        
-        graphs = {}
-        for root, _, files in os.walk(topologies_path):
-            for f in files:
-                with open(f"{root}/{f}", 'r') as file:
-                    graphs[f.replace(".txt", "")] = Loader.to_graph(file)
 
         with open(f"{instance}", 'r') as file:
             name = os.path.basename(instance)
             graph_name = name.split("_")[1]
             problem_name = name.replace("instance_", "").replace(".txt", "")
-            demands, S = Loader.to_demands(file)
-            return {
+            if chunk_size > 0:
+                demands, S = None, Loader.demands_header(file)
+            else:
+                demands, S = Loader.to_demands(file)
+            p = {
                 "name": problem_name,
-                "graph": graphs[graph_name],
+                "graph": Loader.topology(topologies_path, graph_name, cache_path),
                 "S": S,
                 "demands": demands,
             }
+        if chunk_size > 0:
+            p["chunks"] = Loader.chunks(instance, chunk_size)
+        return p
+
+    @staticmethod
+    def topology(topologies_path, graph_name, cache_path="") -> T_graph:
+        """
+        topology returns the graph of the topology file graph_name in topologies_path, it is only
+        parsed the first time.
+
+        If cache_path is not empty the graph is a CSRGraph, whose arrays are kept in
+        {cache_path}/{graph_name}.npz for the next processes.
+        """
+        for root, _, files in os.walk(topologies_path):
+            for f in files:
+                if f.replace(".txt", "") != graph_name:
+                    continue
+                path = f"{root}/{f}"
+                if (path, cache_path) not in Loader._graphs:
+                    if cache_path != "":
+                        Loader._graphs[path, cache_path] = Loader.cached_graph(path, f"{cache_path}/{graph_name}.npz")
+                    else:
+                        with open(path, 'r') as file:
+                            Loader._graphs[path, cache_path] = Loader.to_graph(file)
+                return Loader._graphs[path, cache_path]
+
+        raise KeyError(graph_name)
+
+    @staticmethod
+    def cached_graph(path, cache) -> CSRGraph:
+        """
+        cached_graph loads the topology file in path from its arrays in cache, they are rebuilt if
+        the file changed since they were saved, by modification time or, when only touched, by content.
+        """
+        mtime = os.stat(path).st_mtime_ns
+        if os.path.exists(cache):
+            with np.load(cache) as arrays:
+                indptr, indices = arrays["indptr"], arrays["indices"]
+                cached_mtime, cached_digest = int(arrays["mtime"]), str(arrays["digest"])
+            if cached_mtime == mtime:
+                return CSRGraph(indptr, indices)
+            digest = Loader.digest(path)
+            if cached_digest == digest:
+                Loader.save_csr(cache, indptr, indices, mtime, digest)
+                return CSRGraph(indptr, indices)
+
+        with open(path, 'r') as file:
+            indptr, indices = to_csr(Loader.to_graph(file))
+        Loader.save_csr(cache, indptr, indices, mtime, Loader.digest(path))
+        return CSRGraph(indptr, indices)
+
+    @staticmethod
+    def save_csr(cache, indptr, indices, mtime, digest):
+        # concurrent processes may save the same topology, the file is replaced only once complete
+        partial = f"{cache}.{os.getpid()}.npz"
+        np.savez(partial, indptr=indptr, indices=indices, mtime=mtime, digest=digest)
+        os.replace(partial, cache)
+
+    @staticmethod
+    def digest(path) -> str:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
 
     @staticmethod
     def to_graph(file) -> T_graph:
@@ -49,17 +120,47 @@ class Loader:
 
     @staticmethod
     def to_demands(file) -> tuple[list[T_demand], int]:
+        S = Loader.demands_header(file)
+
+        demands = []
+        for chunk in Loader.iter_demands(file):
+            demands.extend(chunk)
+
+        return demands, S
 
-        d = {}
+    @staticmethod
+    def demands_header(file) -> int:
+        """
+        demands_header reads the comments and the header of a demands file, which is left at its
+        first demand, and returns S.
+        """
         line = file.readline()
         while line.startswith("#"):
             line = file.readline()
         # S, |D|, ignore |D|
         S, _ = line.split()
+        return int(S)
 
-        demands = []
+    @staticmethod
+    def chunks(instance, chunk_size) -> Iterator[list[T_demand]]:
+        """
+        chunks yields the demands of the instance file in lists of up to chunk_size, the file is
+        read as they are consumed.
+        """
+        with open(f"{instance}", 'r') as file:
+            Loader.demands_header(file)
+            yield from Loader.iter_demands(file, chunk_size)
+
+    @staticmethod
+    def iter_demands(file, chunk_size=4096) -> Iterator[list[T_demand]]:
+        """
+        iter_demands yields the demands of file, after its header, in lists of up to chunk_size.
+        """
+        chunk = []
         for line in file:
             demand_line = line.split()
+            if len(demand_line) == 0:
+                continue
             source = int(demand_line[0])
             nT = int(demand_line[1])
             base = 2
@@ -69,6 +170,10 @@ class Loader:
             for i in range(2, 2 + nT):
                 terminals.append(int(demand_line[i]))
 
-            demands.append((int(source), set(terminals), slots))
+            chunk.append((int(source), set(terminals), slots))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
 
-        return demands, int(S)
+        if len(chunk) > 0:
+            yield chunk
@@ -1,105 +1,19 @@
 import argparse
+import csv
 import sys
 
 import resource
 
 resource.setrlimit(resource.RLIMIT_AS, (int(6 * 1024 * 1024 * 1024), int(6 * 1024 * 1024 * 1024)))
 
-import solve
-from sample_problems.problems import problems as def_problems
-from instance_loader import Loader
-
-from solvers.dr_bf_m import Solver as DR_BF_M
-from solvers.dr_bf_f import Solver as DR_BF_F
-from solvers.dr_bf_c import Solver as DR_BF_C
-
-from solvers.dr_ob_m import Solver as DR_OB_M
-from solvers.dr_ob_f import Solver as DR_OB_F
-from solvers.dr_ob_c import Solver as DR_OB_C
-
-from solvers.dr_bsa_m import Solver as DR_BSA_M
-from solvers.dr_bsa_f import Solver as DR_BSA_F
-from solvers.dr_bsa_c import Solver as DR_BSA_C
-
-from solvers.dr_sc_m import Solver as DR_SC_M
-from solvers.dr_sc_f import Solver as DR_SC_F
-from solvers.dr_sc_c import Solver as DR_SC_C
-
-from solvers.dr_aov_f import Solver as DR_AOV_F
-from solvers.dr_aov_m import Solver as DR_AOV_M
-from solvers.dr_aov_c import Solver as DR_AOV_C
-
-from solvers.ds_bf_m import Solver as DS_BF_M
-from solvers.ds_bf_f import Solver as DS_BF_F
-from solvers.ds_bf_c import Solver as DS_BF_C
-
-from solvers.ds_acc_m import Solver as DS_ACC_M
-from solvers.ds_acc_f import Solver as DS_ACC_F
-from solvers.ds_acc_c import Solver as DS_ACC_C
-
-from solvers.nls_f import Solver as NLS_F
-from solvers.nls_m import Solver as NLS_M
-from solvers.nls_c import Solver as NLS_C
-
-from solvers.ds_bf_m import Solver as DS_BF_M
-
-from solvers.dsl_bf_m import Solver as DSL_BF_M
-from solvers.dsl_bf_c import Solver as DSL_BF_C
-from solvers.dsl_ascc_c import Solver as DSL_ASCC_C
-from solvers.dsl_asb_c import Solver as DSL_ASB_C
-
-from solvers.drl_bf_m import Solver as DRL_BF_M
-from solvers.drl_bf_c import Solver as DRL_BF_C
-
-solvers = [
-    DR_BF_M,
-    DR_BF_F,
-    DR_BF_C,
-
-    DR_OB_M,
-    DR_OB_F,
-    DR_OB_C,
-
-    DR_BSA_M,
-    DR_BSA_F,
-    DR_BSA_C,
-
-    DR_SC_M,
-    DR_SC_F,
-    DR_SC_C,
-
-    DR_AOV_F,
-    DR_AOV_M,
-    DR_AOV_C,
-
-    DS_BF_F,
-    DS_BF_M,
-    DS_BF_C,
-
-    DS_ACC_M,
-    DS_ACC_F,
-    DS_ACC_C,
-
-    NLS_F,
-    NLS_M,
-    NLS_C,
-
-    DSL_BF_M,
-    DSL_BF_C,
-    DSL_ASCC_C,
-    DSL_ASB_C,
-
-    DRL_BF_M,
-    DRL_BF_C
-]
+# the modules that build models load cplex, they are imported by the options that use them
+from solvers import registry
 
 if __name__ == "__main__":
     
-    models_dict = dict(zip(map(lambda s: str(s.__module__.split(".")[1]).lower(), solvers), solvers))
-
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("-m", "--model", type=str, help=f"The model to execute \
-                    {','.join(models_dict.keys())}", default="dr_bf_m")
+                    {','.join(registry.models)}", default="dr_bf_m")
     parser.add_argument("-t", "--topology", type=str, help="The topologies "
                         "directory, there must be at least one compatible "
                         "topology with the instance file")
@@ -114,43 +28,228 @@ if __name__ == "__main__":
     parser.add_argument("-to", "--timeout", type=int, help="Indicates the timeout "
                         "in seconds for the solver, if 0, there is no timeout", 
                         default=60)
+    parser.add_argument("-in", "--ignore-names", type=bool, help="Skips variable "
+                        "and constraint names when building the model", default=False)
+    parser.add_argument("-mx", "--matrix", type=bool, help="Loads the larger constraint "
+                        "families as sparse matrices, where the model supports it", default=False)
+    parser.add_argument("-ms", "--mip-start", type=bool, help="Starts the solver from the "
+                        "first fit heuristic solution", default=False)
+    parser.add_argument("-uc", "--user-cuts", type=bool, help="Separates the cut based "
+                        "constraints on fractional solutions too", default=False)
+    parser.add_argument("-rd", "--reduce", type=bool, help="Fixes to 0 the arc variables "
+                        "of the arcs that cannot be used by each demand", default=False)
+    parser.add_argument("-sb", "--symmetry", type=bool, help="Orders identical demands "
+                        "by their allocation to break the symmetry between them", default=False)
+    parser.add_argument("-cp", "--cut-pool", type=str, help="Indicates the cut pool "
+                        "path, cuts found are saved there per instance and loaded on the next "
+                        "run, if empty there is no cut pool", default="")
+    parser.add_argument("-tc", "--topology-cache", type=str, help="Indicates the "
+                        "topology cache path, parsed topologies are saved there in compressed sparse "
+                        "rows and loaded on the next run, if empty there is no cache", default="")
+    parser.add_argument("-lb", "--lower-bound", type=bool, help="Only computes the lower "
+                        "bounds of the instance, without solving it", default=False)
+    parser.add_argument("-pf", "--portfolio", type=str, help="Indicates a comma separated "
+                        "list of models to race on the instance in parallel, the first to prove "
+                        "optimality stops the rest, if empty only --model is solved", default="")
+    parser.add_argument("-ln", "--lns", type=bool, help="Improves the first fit "
+                        "solution, or the incumbent, with a large neighbourhood search over --model "
+                        "until the timeout", default=False)
+    parser.add_argument("-rh", "--rolling", type=int, help="Indicates a batch size, "
+                        "demands are solved that many at a time around the slots taken by the previous "
+                        "batches, each batch with the timeout, if 0, the instance is solved at once", default=0)
+    parser.add_argument("-ro", "--rolling-order", type=str, help="Indicates the order of "
+                        "the demands when solving in batches, by slots, terminals or path, largest first, or file, "
+                        "as they appear in the instance file",
+                        default="slots")
+    parser.add_argument("-lm", "--list-models", type=bool, help="Lists the models "
+                        "that can be executed and exits", default=False)
+    parser.add_argument("-b", "--batch", type=str, help="Indicates a manifest csv "
+                        "file with a model and an instance column, every row is solved in this "
+                        "process with the same options, if empty only --model is solved", default="")
+    parser.add_argument("-ib", "--incumbent", type=str, help="Indicates the incumbent "
+                        "path, the best solution of each instance is saved there and used as MIP "
+                        "start and cutoff on the next run, if empty there is no incumbent", default="")
+    parser.add_argument("-th", "--threads", type=int, help="Indicates the number "
+                        "of threads for the solver, if 0, cplex decides", default=0)
     args = parser.parse_args()
 
+    if args.list_models:
+        print("\n".join(registry.models))
+        sys.exit()
+
     export = args.export != ""
     if args.test:
+        import solve
+        from sample_problems.problems import problems as def_problems
         # Running default problems
         for p in def_problems:
-            for s in solvers:
+            for s in registry.solvers():
                 solve.solve(
                     s,
                     p,
                     export=export,
                     export_path = args.export,
                     validate=args.validate,
+                    ignore_names=args.ignore_names,
+                    matrix=args.matrix,
+                    mip_start=args.mip_start,
+                    user_cuts=args.user_cuts,
+                    cut_pool_path=args.cut_pool,
+                    threads=args.threads,
+                    reduce=args.reduce,
+                    symmetry=args.symmetry,
+                    lower_bound_only=args.lower_bound,
+                    incumbent_path=args.incumbent,
                 )
         sys.exit()
 
+    if args.timeout < 0:
+        print("Timeout must be greater than 0")
+        sys.exit()
+    if args.threads < 0:
+        print("Threads must be greater than 0")
+        sys.exit()
+    timeout = args.timeout
+    if timeout == 0:
+        timeout = None
+
+    if args.batch != "":
+        import solve
+        from instance_loader import Loader
+        # Every row is isolated, a failure or timeout only ends its own solve
+        with open(args.batch, 'r', newline='') as file:
+            rows = list(csv.DictReader(file))
+        for row in rows:
+            model = row["model"].lower()
+            if model not in registry.models:
+                print(f"Model {model} not found")
+                continue
+            try:
+                p = Loader.load(args.topology, row["instance"], args.topology_cache)
+            except Exception as ex:
+                print(f"problem: {model}:{row['instance']}")
+                print(f"error:{ex.__class__}={str(ex)}")
+                continue
+            solve.solve(
+                registry.solver(model),
+                p,
+                export=export,
+                export_path = args.export,
+                validate=args.validate,
+                timeout_seconds=timeout,
+                ignore_names=args.ignore_names,
+                matrix=args.matrix,
+                mip_start=args.mip_start,
+                user_cuts=args.user_cuts,
+                cut_pool_path=args.cut_pool,
+                threads=args.threads,
+                reduce=args.reduce,
+                symmetry=args.symmetry,
+                lower_bound_only=args.lower_bound,
+                incumbent_path=args.incumbent,
+            )
+        sys.exit()
+
     model = args.model.lower()
-    if model not in models_dict.keys():
+    if model not in registry.models:
         print(f"Model {model} not found")
         sys.exit()
     if args.instance is None:
         print("If topology is set, instance file must be provided")
         sys.exit()
-    if args.timeout < 0:
-        print("Timeout must be greater than 0")
+
+    from instance_loader import Loader
+    # rolling in the order of the file reads the demands a batch at a time while solving
+    chunk_size = args.rolling if args.rolling > 0 and args.rolling_order == "file" else 0
+    p = Loader.load(args.topology, args.instance, args.topology_cache, chunk_size)
+    if args.portfolio != "":
+        import portfolio
+        models = args.portfolio.lower().split(",")
+        for model in models:
+            if model not in registry.models:
+                print(f"Model {model} not found")
+                sys.exit()
+        portfolio.race(
+            models,
+            p,
+            timeout_seconds=timeout,
+            export=export,
+            export_path = args.export,
+            validate=args.validate,
+            ignore_names=args.ignore_names,
+            matrix=args.matrix,
+            mip_start=args.mip_start,
+            user_cuts=args.user_cuts,
+            cut_pool_path=args.cut_pool,
+            threads=args.threads,
+            reduce=args.reduce,
+            symmetry=args.symmetry,
+            lower_bound_only=args.lower_bound,
+            incumbent_path=args.incumbent,
+        )
+        sys.exit()
+
+    if args.rolling > 0:
+        import rolling
+        if model not in registry.occupancy:
+            print(f"Model {model} does not support occupied slots, use one of {','.join(sorted(registry.occupancy))}")
+            sys.exit()
+        if args.rolling_order not in rolling.ORDERS:
+            print(f"Order {args.rolling_order} not found, use one of {','.join(rolling.ORDERS)}")
+            sys.exit()
+        rolling.solve(
+            registry.solver(model),
+            p,
+            args.rolling,
+            order=args.rolling_order,
+            timeout_seconds=timeout,
+            export=export,
+            export_path = args.export,
+            validate=args.validate,
+            ignore_names=args.ignore_names,
+            matrix=args.matrix,
+            mip_start=args.mip_start,
+            user_cuts=args.user_cuts,
+            threads=args.threads,
+            reduce=args.reduce,
+            symmetry=args.symmetry,
+        )
+        sys.exit()
+
+    if args.lns:
+        import lns
+        lns.search(
+            registry.solver(model),
+            p,
+            timeout_seconds=timeout,
+            export=export,
+            export_path = args.export,
+            validate=args.validate,
+            ignore_names=args.ignore_names,
+            matrix=args.matrix,
+            user_cuts=args.user_cuts,
+            threads=args.threads,
+            incumbent_path=args.incumbent,
+        )
         sys.exit()
-    timeout = args.timeout
-    if timeout == 0:
-        timeout = None
 
-    p = Loader.load(args.topology, args.instance)
+    import solve
     solve.solve(
-        models_dict[model],
+        registry.solver(model),
         p,
         export=export,
         export_path = args.export,
         validate=args.validate,
         timeout_seconds=timeout,
+        ignore_names=args.ignore_names,
+        matrix=args.matrix,
+        mip_start=args.mip_start,
+        user_cuts=args.user_cuts,
+        cut_pool_path=args.cut_pool,
+        threads=args.threads,
+        reduce=args.reduce,
+        symmetry=args.symmetry,
+        lower_bound_only=args.lower_bound,
+        incumbent_path=args.incumbent,
     )
     
\ No newline at end of file
@@ -0,0 +1,121 @@
+import random
+import time
+from solve import Hook, validation_report
+from wrappers import Export
+from bounds import lower_bound
+from solvers.heuristic import first_fit, sort_identical
+from solvers.incumbent import Incumbent, prune
+from solvers.solvers import Res
+
+"""
+lns improves a solution of an instance with a large neighbourhood search over any model.
+
+It starts from the first fit solution, or the incumbent of the instance. Every iteration destroys a
+few demands, the ones sharing arcs with a random demand first, and solves the instance again with
+the model under a short time limit: the destroyed demands are free, the rest keep their
+arborescences (the arcs outside them are removed through the reduction, see Hook routes) and any
+demand can move its slots. The current solution is the MIP start, so an iteration never finds a
+worse solution, and it is kept when it uses fewer arcs.
+
+Every improvement is recorded with the seconds elapsed, the iterations are solved without export
+and the search exports its best objective and that progress instead.
+"""
+
+# an iteration lasts at most this long
+ITERATION_SECONDS = 10
+# share of the demands destroyed on every iteration
+DESTROY = 0.2
+
+def search(s, p: dict, timeout_seconds=None, iterations=100, seed=0, export=False, export_path="", validate=False,
+           ignore_names=False, matrix=False, user_cuts=False, threads=0, incumbent_path="") -> Res:
+    """
+    search runs the large neighbourhood search of p with the solver class s for timeout_seconds, or
+    iterations when there is no timeout, and returns the best solution found.
+    """
+    g = p["graph"]
+    S = p["S"]
+    ds = p["demands"]
+    name = f"lns:{p['name']}"
+    model_name = s(g, S, ds, name=name)._name
+    rng = random.Random(seed)
+
+    bound = lower_bound(g, S, ds)
+    print(f"problem: {model_name}")
+    print(f"lower bound: {bound['arcs']}")
+
+    incumbent = None
+    current = None
+    if incumbent_path != "":
+        incumbent = Incumbent(f"{incumbent_path}/{p['name']}_incumbent.json")
+        if incumbent.solution is not None and len(validation_report(g, S, ds, incumbent.solution)) == 0:
+            current = incumbent.solution
+    if current is None:
+        current = first_fit(g, S, ds)
+    if current is None:
+        print("error:<class 'AssertionError'>=Solution not found: first fit could not allocate every demand")
+        return None
+    # identical demands are sorted as in the MIP start, so their routes match it
+    current = sort_identical(prune(current, ds), ds)
+    objective = arcs_used(current)
+
+    started = time.monotonic()
+    progress = [{"iteration": 0, "seconds": 0.0, "objective": objective}]
+    print(f"lns: iteration 0 objective {objective}")
+
+    # a single demand can rarely move while every other one keeps its arcs
+    k = min(len(ds), max(2, round(DESTROY * len(ds))))
+    iteration = 0
+    while objective > bound["arcs"]:
+        iteration += 1
+        elapsed = time.monotonic() - started
+        if timeout_seconds is None and iteration > iterations:
+            break
+        if timeout_seconds is not None and elapsed >= timeout_seconds:
+            break
+        seconds = ITERATION_SECONDS if timeout_seconds is None else max(1, min(ITERATION_SECONDS, int(timeout_seconds - elapsed)))
+
+        destroyed = destroy(current, k, rng)
+        routes = [None if d in destroyed else {(i, j) for i, outgoing in enumerate(current[d][0]) for j in outgoing}
+                  for d in range(len(ds))]
+
+        solver = s(g, S, ds, name=name)
+        solver.register_hook(Hook(False, "", seconds, ignore_names, matrix, True, user_cuts, None, threads,
+                                  True, False, bound, None, current, None, routes))
+        try:
+            solution = solver.solve()
+        except Exception as ex:
+            print(f"lns: iteration {iteration} error:{ex.__class__}={str(ex)}")
+            continue
+
+        if len(validation_report(g, S, ds, solution)) > 0:
+            continue
+        solution = sort_identical(prune(solution, ds), ds)
+        if arcs_used(solution) < objective:
+            current = solution
+            objective = arcs_used(solution)
+            progress.append({"iteration": iteration, "seconds": time.monotonic() - started, "objective": objective})
+            print(f"lns: iteration {iteration} objective {objective}")
+
+    print(f"lns: objective={objective} seconds={time.monotonic() - started}")
+    if export:
+        Export(export_path, bound).export_progress(model_name, objective, progress)
+    if validate and len(validation_report(g, S, ds, current)) == 0:
+        print("Validation: Ok")
+    if incumbent is not None and incumbent.update(current, ds, model_name):
+        incumbent.save()
+    return current
+
+def arcs_used(solution: Res) -> int:
+    return sum(len(outgoing) for demand_graph, _ in solution for outgoing in demand_graph)
+
+def destroy(solution: Res, k: int, rng: random.Random) -> set[int]:
+    """
+    destroy picks k demands to free, a random demand and the demands sharing arcs with it first.
+    """
+    arcs = [{(i, j) for i, outgoing in enumerate(demand_graph) for j in outgoing} for demand_graph, _ in solution]
+    first = rng.randrange(len(solution))
+    related = [d for d in range(len(solution)) if d != first and len(arcs[d] & arcs[first]) > 0]
+    others = [d for d in range(len(solution)) if d != first and len(arcs[d] & arcs[first]) == 0]
+    rng.shuffle(related)
+    rng.shuffle(others)
+    return set(([first] + related + others)[:k])
@@ -0,0 +1,57 @@
+import math
+import multiprocessing
+import time
+import solve
+from solvers import registry
+from wrappers import Portfolio
+
+"""
+portfolio races several models on the same instance, each one in its own process, with the same
+deadline.
+
+The best objective found is shared between them, a model stops as soon as its bound cannot improve
+it, and every model stops once one of them proves optimality. Each model exports and validates its
+own result as solve.solve does.
+"""
+
+# once a model proves optimality or the deadline passes, the rest have this long to stop and export
+# their results before being terminated
+GRACE_SECONDS = 5
+
+def race(models: list[str], p: dict, timeout_seconds=None, **options) -> tuple[str, float]:
+    """
+    race solves p with every model in models and returns the model with the best objective and the
+    objective, None and inf if no model found a solution.
+    """
+    incumbent = multiprocessing.Value('d', math.inf)
+    winner = multiprocessing.Value('i', -1)
+    optimal = multiprocessing.Event()
+
+    processes = []
+    for index, model in enumerate(models):
+        portfolio = Portfolio(index, incumbent, winner, optimal,
+                              share=model not in registry.averaged,
+                              prove=model not in registry.averaged and model not in registry.heuristics
+                                    and model not in registry.restricted)
+        process = multiprocessing.Process(target=_solve, args=(model, p, timeout_seconds, portfolio, options), name=model)
+        process.start()
+        processes.append(process)
+
+    deadline = math.inf if timeout_seconds is None else time.monotonic() + timeout_seconds + GRACE_SECONDS
+    while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+        if optimal.is_set():
+            deadline = min(deadline, time.monotonic() + GRACE_SECONDS)
+        time.sleep(0.1)
+
+    for process in processes:
+        if process.is_alive():
+            print(f"portfolio: terminating {process.name}")
+            process.terminate()
+        process.join()
+
+    best = models[winner.value] if winner.value >= 0 else None
+    print(f"portfolio: model={best} objective={incumbent.value} optimal={optimal.is_set()}")
+    return best, incumbent.value
+
+def _solve(model: str, p: dict, timeout_seconds, portfolio: Portfolio, options: dict):
+    solve.solve(registry.solver(model), p, timeout_seconds=timeout_seconds, portfolio=portfolio, **options)
@@ -0,0 +1,116 @@
+import time
+from solve import Hook, validation_report
+from wrappers import Export
+from bounds import lower_bound, demand_bound
+from solvers.solvers import Res
+from solvers import registry
+
+"""
+rolling solves an instance in batches of demands, for demand sets too large for a single model.
+
+Demands are sorted, the largest first, and solved a batch at a time with the model. With the file
+order they are taken as they appear in the instance file, which is read a batch at a time while
+solving (see Loader chunks), so the demands are never loaded nor sorted up front. The slots
+assigned to the previous batches are occupied on their arcs (see Hook occupied), so every batch fits
+around them, and the solutions of the batches are stitched into one solution of the instance.
+It gives up optimality for a model size that only depends on the batch. Only the models in
+registry.occupancy support it.
+
+Each batch is exported as a solve of its own, the instance exports its objective and the objective
+after every batch as progress.
+"""
+
+# the keys demands can be sorted by, largest first
+ORDERS = {
+    "slots": lambda graph, demand: demand[2],
+    "terminals": lambda graph, demand: len(demand[1]),
+    "path": lambda graph, demand: demand_bound(graph, demand[0], demand[1]),
+    # the order of the file, the problem yields its demands in chunks
+    "file": None,
+}
+
+def solve(s, p: dict, batch: int, order: str = "slots", timeout_seconds=None, export=False, export_path="",
+          validate=False, ignore_names=False, matrix=False, mip_start=False, user_cuts=False, threads=0,
+          reduce=False, symmetry=False) -> Res:
+    """
+    solve solves p with the solver class s in batches of batch demands, sorted by order, each one
+    with timeout_seconds, and returns the stitched solution, None if a batch is not solved. With the
+    file order the demands of p come from its chunks, of batch demands each.
+    """
+    g = p["graph"]
+    S = p["S"]
+    name = f"rolling:{p['name']}"
+    model_name = s(g, S, [], name=name)._name
+    print(f"problem: {model_name}")
+
+    # the batches export the objective of the model, the bound only applies to the arcs used
+    averaged = s.__module__.split(".")[-1] in registry.averaged
+
+    # the demands solved so far, in the order of the instance
+    ds = [] if order == "file" else p["demands"]
+    solution: list = [None for _ in ds]
+    occupied = {}
+    objective = 0
+    started = time.monotonic()
+    progress = []
+    for b, (indices, demands) in enumerate(batches(p, batch, order)):
+        if order == "file":
+            ds.extend(demands)
+            solution.extend(None for _ in demands)
+
+        solver = s(g, S, demands, name=f"{name}:{b}")
+        solver.register_hook(Hook(export, export_path, timeout_seconds, ignore_names, matrix, mip_start, user_cuts,
+                                  None, threads, reduce, symmetry, None if averaged else lower_bound(g, S, demands),
+                                  occupied=occupied))
+        try:
+            res = solver.solve()
+            if validate:
+                report = validation_report(g, S, demands, res)
+                if len(report) > 0:
+                    raise AssertionError(report[0]["message"])
+        except Exception as ex:
+            print(f"rolling: batch {b} error:{ex.__class__}={str(ex)}")
+            return None
+
+        for d, (demand_graph, (l, r)) in zip(indices, res):
+            solution[d] = (demand_graph, (l, r))
+            for i, outgoing in enumerate(demand_graph):
+                for j in outgoing:
+                    occupied.setdefault((i, j), []).append((l, r))
+                    objective += 1
+
+        progress.append({"batch": b, "demands": len(indices), "seconds": time.monotonic() - started, "objective": objective})
+        print(f"rolling: batch {b} demands {len(indices)} objective {objective}")
+
+    bound = lower_bound(g, S, ds)
+    print(f"lower bound: {bound['arcs']}")
+    print(f"rolling: objective={objective} seconds={time.monotonic() - started}")
+    if export:
+        Export(export_path, bound).export_progress(model_name, objective, progress)
+    if validate:
+        report = validation_report(g, S, ds, solution)
+        if len(report) > 0:
+            print(f"error:<class 'AssertionError'>={report[0]['message']}")
+        else:
+            print("Validation: Ok")
+    return solution
+
+def batches(p: dict, batch: int, order: str):
+    """
+    batches yields the indices in the instance and the demands of every batch, with the file order
+    they are the next chunk of p.
+    """
+    if order == "file":
+        offset = 0
+        for demands in p["chunks"]:
+            yield list(range(offset, offset + len(demands))), demands
+            offset += len(demands)
+        return
+
+    g = p["graph"]
+    ds = p["demands"]
+    key = ORDERS[order]
+    sorted_demands = sorted(range(len(ds)), key=lambda d: (-key(g, ds[d]), d))
+    for b in range(0, len(sorted_demands), batch):
+        indices = sorted_demands[b:b + batch]
+        yield indices, [ds[d] for d in indices]
@@ -2,12 +2,18 @@ from unittest.mock import Base
 
 from cplex import Aborter
 from docplex.mp.model import Model
-from graph import dfs
+from graph import dfs, arc_arrays
+from collections import defaultdict
+import heapq
 from solvers.solvers import BaseHook
-from wrappers import Export, Timeout, HookMIPInfoCallback
+from wrappers import Export, Timeout, Threads, Cutoff, HookMIPInfoCallback
 from datetime import timedelta,datetime
 from typing import Any, Callable
 from solvers.solvers import Res
+from solvers.cuts import CutPool
+from solvers.incumbent import Incumbent
+from solvers import registry
+from bounds import lower_bound
 
 def validate_solution(graph, S, demands, solution):
     """
@@ -18,69 +24,100 @@ def validate_solution(graph, S, demands, solution):
 
     * t1_i is the tree that satisfies the ith demand. Expressed as a list of ady.
     * t2_i is the slot allocation, it represented by [t2_i[0], t2_i[1])
-    """
 
+    It raises an AssertionError with the first violation of validation_report.
     """
-    We generate a graph that joins all solutions and indicates the demand the edge belongs to
+    report = validation_report(graph, S, demands, solution)
+    if len(report) == 1:
+        raise AssertionError(report[0]["message"])
+    if len(report) > 1:
+        raise AssertionError(f'{report[0]["message"]} (and {len(report) - 1} more violations)')
 
-    solcum_graph might be [[(1, [0, 1])], [(2, [0])], []]
-    edge (0, 1) is used for demands [0, 1]
-    edge (1, 2) is used for demands [0] 
+def validation_report(graph, S, demands, solution) -> list[dict]:
+    """
+    validation_report returns every violation of the solution, in the order validate_solution checks them.
+
+    A violation is a dict with its "type", "demands" and "edge" involved, and a "message":
+    * edge: the edge used by "demands" is not in the original graph
+    * volume: the demand does not allocate the required amount of slots
+    * capacity: the demand allocates over S
+    * overlap: the two demands overlap their slots on the edge
+    * reach: the demand does not reach a terminal, given in "node"
     """
-    solcum_graph = [[] for _ in range(len(graph))]
-    for d, s in enumerate(solution):
-        for i, outgoing in enumerate(s[0]):
-            for j in outgoing:
-                edge_exists = list(
-                    filter(lambda x: x[0] == j, solcum_graph[i]))
-                if len(edge_exists) > 0:
-                    edge = edge_exists[0]
-                    edge[1].append(d)
-                else:
-                    solcum_graph[i].append((j, [d]))
+    report = []
+
+    # users[i, j] lists the demands that use edge (i, j)
+    users = defaultdict(list)
+    for d, (demand_graph, _) in enumerate(solution):
+        for i, outgoing in enumerate(demand_graph):
+            for j in dict.fromkeys(outgoing):
+                users[i, j].append(d)
 
     # Verify original edge existence
-    for u, outgoing in enumerate(solcum_graph):
-        for v1 in outgoing:
-            # [0] is the outgoing node, [1] is the demand
-            if not any([v2 == v1[0] for v2 in graph[u]]):
-                raise AssertionError(
-                    f'edge {u}_{v1[0]} used in solution not found in original graph')
+    tails, heads = arc_arrays(graph)
+    edges = set(zip(tails.tolist(), heads.tolist()))
+    for (i, j), used_by_demands in users.items():
+        if (i, j) not in edges:
+            report.append({
+                "type": "edge", "demands": used_by_demands, "edge": (i, j),
+                "message": f'edge {i}_{j} used in solution not found in original graph'})
 
     # Verify that demands allocation have the required slots and that they don't go over S
-    for d, s in enumerate(solution):
-        (l, r) = s[1]
+    for d, (_, (l, r)) in enumerate(solution):
         required = demands[d][2]
         if r-l != required:
-            raise AssertionError(
-                f'demand {d} does not allocate the required amount: l={l}, r={r}, required={required}')
+            report.append({
+                "type": "volume", "demands": [d], "edge": None,
+                "message": f'demand {d} does not allocate the required amount: l={l}, r={r}, required={required}'})
         if r > S:
-            raise AssertionError(f'demand {d} allocates over S: r={r}, S={S}')
-
-    # Verify that demands allocation do 
-    # not overlap on the same edge
-    for outgoing in solcum_graph:
-        for (_, used_by_demands) in outgoing:
-            for d1 in used_by_demands:
-                for d2 in used_by_demands:
-                    if d1 == d2:
-                        continue
-                    (l1, r1) = solution[d1][1]
-                    (l2, r2) = solution[d2][1]
-                    if r1 > l2 and l1 < r2:
-                        raise AssertionError(
-                            f'overlap in allocation: demand_{d1}=({l1},{r1},v={demands[d1][2]}), demand_{d2}=({l2},{r2},v={demands[d2][2]})')
+            report.append({
+                "type": "capacity", "demands": [d], "edge": None,
+                "message": f'demand {d} allocates over S: r={r}, S={S}'})
+
+    # Verify that demands allocation do not overlap on the same edge, sweeping the allocations
+    # of the edge by left slot, every allocation still open when one starts overlaps with it
+    for (i, j), used_by_demands in users.items():
+        open_allocations = []
+        for l2, r2, d2 in sorted((solution[d][1][0], solution[d][1][1], d) for d in used_by_demands):
+            while len(open_allocations) > 0 and open_allocations[0][0] <= l2:
+                heapq.heappop(open_allocations)
+            for r1, d1 in sorted(open_allocations, key=lambda a: a[1]):
+                l1 = solution[d1][1][0]
+                if l1 >= r2:
+                    continue
+                report.append({
+                    "type": "overlap", "demands": [d1, d2], "edge": (i, j),
+                    "message": f'overlap in allocation: demand_{d1}=({l1},{r1},v={demands[d1][2]}), demand_{d2}=({l2},{r2},v={demands[d2][2]})'})
+            heapq.heappush(open_allocations, (r2, d2))
+
     for d in range(len(demands)):
         s = demands[d][0]
         T = demands[d][1]
-        reached = dfs(solution[d][0], s)
+        reached = set(dfs(solution[d][0], s))
         for t in T:
             if t not in reached:
-                raise AssertionError(f"cannot reach node {t} in demand solution {d}")
+                report.append({
+                    "type": "reach", "demands": [d], "edge": None, "node": t,
+                    "message": f"cannot reach node {t} in demand solution {d}"})
+
+    return report
 
 class Hook(BaseHook):
-    def __init__(self, export, export_path, timeout_seconds):
+    def __init__(self, export, export_path, timeout_seconds, ignore_names=False, matrix=False, mip_start=False, user_cuts=False, cut_pool=None, threads=0, reduce=False, symmetry=False, bound=None, portfolio=None, incumbent=None, cutoff=None, routes=None, occupied=None):
         BaseHook.__init__(self)
+        self.ignore_names = ignore_names
+        self.matrix = matrix
+        self.mip_start = mip_start
+        self.user_cuts = user_cuts
+        self.cut_pool = cut_pool
+        self.reduce = reduce
+        self.symmetry = symmetry
+        self.incumbent = incumbent
+        self.routes = routes
+        self.occupied = occupied
+        # the best known solution is always used as MIP start
+        if incumbent is not None:
+            self.mip_start = True
         self._before_solve = []
         self._export = export
         self._export_path = export_path
@@ -95,8 +132,18 @@ class Hook(BaseHook):
             hook_to = Timeout(timedelta(seconds=timeout_seconds))
             self.register_hook_before_solve(hook_to.hook_before_solve)
 
+        hook_co = None
+        if cutoff is not None:
+            hook_co = Cutoff(cutoff, incumbent)
+            self.register_hook_before_solve(hook_co.hook_before_solve)
+            self.register_wrap(hook_co.wrap)
+
+        if threads > 0:
+            hook_th = Threads(threads)
+            self.register_hook_before_solve(hook_th.hook_before_solve)
+
         if export:
-            hook_ex = Export(export_path)
+            hook_ex = Export(export_path, bound)
             hook_cb.register_call(hook_ex.call())
             self.register_hook_before_solve(hook_ex.print_information)
 
@@ -107,12 +154,33 @@ class Hook(BaseHook):
                     hook_ex.export(e, m)
                     hook_ex.print_solution_information(m)
                     raise e
+                if hook_co is not None and hook_co.proved:
+                    hook_ex.known_objective = hook_co.objective
                 hook_ex.export(None, m)
                 hook_ex.print_solution_information(m)
                 return res
             
             self.register_wrap(_export_wrap)
 
+        if portfolio is not None:
+            hook_cb.register_call(portfolio.call())
+
+            def _portfolio_wrap(m: Model, f: Callable[[], Res]):
+                res = f()
+                portfolio.solved(m)
+                return res
+
+            self.register_wrap(_portfolio_wrap)
+
+        if cut_pool is not None:
+            def _cut_pool_wrap(m: Model, f: Callable[[], Res]):
+                try:
+                    return f()
+                finally:
+                    cut_pool.save()
+
+            self.register_wrap(_cut_pool_wrap)
+
     def register_hook_before_solve(self, f: Callable[[Model], None]):
         self._before_solve.append(f)
 
@@ -130,21 +198,55 @@ class Hook(BaseHook):
     def wrap_solve(self, m: Model, func: Callable[[], Res]):
         return self._wrap(m, func)
 
-def solve(s: Any, p: dict, export = False, export_path = "", validate = False, timeout_seconds = None):
+def solve(s: Any, p: dict, export = False, export_path = "", validate = False, timeout_seconds = None, ignore_names = False, matrix = False, mip_start = False, user_cuts = False, cut_pool_path = "", threads = 0, reduce = False, symmetry = False, lower_bound_only = False, portfolio = None, incumbent_path = ""):
 
     g = p["graph"]
     S = p["S"]
     ds = p["demands"]
     solver = s(g, S, ds, name=p["name"])
 
-    hook = Hook(export, export_path, timeout_seconds)
+    bound = lower_bound(g, S, ds)
+    model = s.__module__.split(".")[-1]
+    # the bound counts arcs, it is not exported for the models whose objective is not the arcs used
+    model_bound = bound if model not in registry.averaged else None
+
+    incumbent = None
+    known = None
+    cutoff = None
+    if incumbent_path != "":
+        incumbent = Incumbent(f"{incumbent_path}/{p['name']}_incumbent.json")
+        if incumbent.solution is not None and len(validation_report(g, S, ds, incumbent.solution)) == 0:
+            known = incumbent.solution
+            # only models whose objective is the arcs used and that can represent the incumbent take
+            # the cutoff, objectives are integer so solutions as good as the incumbent are let through
+            if model not in registry.averaged and model not in registry.heuristics and model not in registry.restricted:
+                cutoff = incumbent.objective + 0.5
+
+    cut_pool = None
+    if cut_pool_path != "":
+        # an unreadable pool only loses its cuts, the instance is solved without it
+        try:
+            cut_pool = CutPool(f"{cut_pool_path}/{p['name']}_cuts.json")
+        except Exception as ex:
+            print(f"cut pool: {ex.__class__}={str(ex)}")
+
+    hook = Hook(export, export_path, timeout_seconds, ignore_names, matrix, mip_start, user_cuts, cut_pool, threads, reduce, symmetry, model_bound, portfolio, known, cutoff)
     solver.register_hook(hook)
 
     print(f"problem: {solver._name}")
+    print(f"lower bound: {bound['arcs']}")
+    for violation in bound["violations"]:
+        print(f"infeasible: {violation}")
+    if lower_bound_only:
+        return
+
     try:
         solution = solver.solve()
         if validate:
             validate_solution(g, S, ds, solution)
             print("Validation: Ok")
+        if incumbent is not None and len(validation_report(g, S, ds, solution)) == 0:
+            if incumbent.update(solution, ds, solver._name):
+                incumbent.save()
     except Exception as ex:
         print(f"error:{ex.__class__}={str(ex)}")
@@ -0,0 +1,314 @@
+from docplex.mp.model import Model
+from cplex.callbacks import LazyConstraintCallback
+from docplex.mp.callbacks.cb_mixin import *
+from graph import out_arcs, reach
+from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.cuts import CutPool, add_pool_cuts, register_user_cuts
+from solvers.heuristic import initial_solution, add_mip_start, arcs
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import taken
+
+"""
+bd_c is a Benders decomposition that separates routing from spectrum assignment.
+
+The master only has the y_de variables, the arborescences are guaranteed with the same cuts as
+ds_bf_c and no arc carries more slots than S. There are no slot variables and no big-M.
+
+Every integer solution of the master is checked by a combinatorial subproblem: demands sharing an
+arc conflict, and they must get non overlapping slot ranges inside [0, S). It is solved per
+connected component of the conflict graph with first fit over permutations of the demands. If a
+component does not fit, it is shrunk to a minimal set of demands that does not fit either, and the
+no-good cut over the arcs those demands share is added: at least one of them must not be used.
+Occupied slots are fixed ranges on their arcs, the demands routed over them fit around them and
+those arcs are part of the cut as well.
+
+Every solution that fits can be assigned by first fit, taking the demands by their left slot in that
+solution, so the search only tries orders with non decreasing left slots. When it exceeds
+SEARCH_LIMIT nodes, the component is taken as not fitting and the cut may remove feasible routes.
+"""
+
+# nodes explored by the spectrum search of a component before giving up
+SEARCH_LIMIT = 100000
+
+class Solver():
+
+    def __init__(self, graph: T_graph, S: int, demands: list[tuple[int, set[int], int]], name: str = "") -> None:
+        self._graph = graph
+
+        if name != "":
+            self._name = "{}:{}".format("bd_c", name)
+        else:
+            self._name = "bd_c"
+
+        self._demands = demands
+        self._S = S
+        self._hook: BaseHook
+
+    def register_hook(self, hook: BaseHook):
+        self._hook = hook
+
+    def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
+            return self._solve(m)
+
+    @solve_hook
+    def _solve(self, m: Model) -> Res:
+
+        demands = self._demands
+        S = self._S
+        graph = self._graph
+
+        # y_de variables
+        edges = []
+        for u, outgoing in enumerate(graph):
+            for v in outgoing:
+                edges.append((u, v))
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
+
+        # cut based constraints
+        m.add_constraints(m.sum_vars(y[di, d[0], o] for o in graph[d[0]]) >= 1
+                          for di, d in enumerate(demands))
+
+        m.add_constraints((m.sum_vars(y[d, i, j] for i, j in edges if j == t) >= 1
+                           for d, (s, T, _) in enumerate(demands)
+                           for t in T if t != s),
+                          names="terminals are entered")
+
+        occupied = self._hook.occupied or {}
+        m.add_constraints((m.sum(y[d, i, j] * v for d, (_, _, v) in enumerate(demands)) <= S - len(taken(occupied, i, j, S))
+                           for i, j in edges),
+                          names="arcs do not carry more than S slots")
+
+        cb = m.register_callback(DOLazyCallback)
+        cb._S = S
+        cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = [y[d, i, j].index for d in range(len(demands)) for i, j in edges]
+        cb._occupied = [occupied.get(e, []) for e in edges]
+
+        if self._hook.cut_pool is not None:
+            cb._pool = self._hook.cut_pool
+            add_pool_cuts(m, self._hook.cut_pool, graph, demands, lambda d, i, j: [y[d, i, j]])
+
+        if self._hook.user_cuts:
+            register_user_cuts(m, graph, demands, [[[y[d, i, j].index] for i, j in edges] for d in range(len(demands))],
+                               self._hook.cut_pool)
+
+        m.set_objective("min", m.sum_vars(y.values()))
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [(y, arcs(start))])
+
+        self._hook.hook_before_solve(m)
+        solution = m.solve()
+
+        if solution == None:
+            raise AssertionError(f"Solution not found: {m.solve_details}")
+
+        values = solution.get_value_dict(y)
+        demand_graphs = [[[] for _ in range(len(graph))] for _ in range(len(demands))]
+        routes = [set() for _ in demands]
+        for k, (i, j) in enumerate(edges):
+            for d in range(len(demands)):
+                if values.get((d, i, j), 0) > 0.5:
+                    demand_graphs[d][i].append(j)
+                    routes[d].add(k)
+
+        volumes = [v for _, _, v in demands]
+        neighbours = conflicts(routes)
+        blocked = [[(l, r) for k in route for l, r in occupied.get(edges[k], [])] for route in routes]
+        starts = {}
+        for component in components(neighbours):
+            fit, _ = assign(component, volumes, neighbours, S, blocked)
+            if fit is None:
+                raise AssertionError("Solution not found: the routes found do not fit in the spectrum")
+            starts.update(fit)
+
+        return [(demand_graphs[d], (starts[d], starts[d] + volumes[d])) for d in range(len(demands))]
+
+    def name(self):
+        return self._name
+
+def conflicts(routes: list[set[int]]) -> list[set[int]]:
+    """
+    conflicts returns the neighbours of every demand in the conflict graph, the demands it shares an
+    arc with, routes[d] being the arcs used by d.
+    """
+    users = {}
+    for d, route in enumerate(routes):
+        for k in route:
+            users.setdefault(k, []).append(d)
+
+    neighbours = [set() for _ in routes]
+    for ds in users.values():
+        for d in ds:
+            neighbours[d].update(ds)
+    for d in range(len(routes)):
+        neighbours[d].discard(d)
+    return neighbours
+
+def components(neighbours: list[set[int]]) -> list[list[int]]:
+    seen = set()
+    res = []
+    for d in range(len(neighbours)):
+        if d in seen:
+            continue
+        component = []
+        to_visit = [d]
+        seen.add(d)
+        while len(to_visit) > 0:
+            i = to_visit.pop()
+            component.append(i)
+            for j in neighbours[i]:
+                if j not in seen:
+                    seen.add(j)
+                    to_visit.append(j)
+        res.append(sorted(component))
+    return res
+
+def lowest_fit(d: int, starts: dict, volumes: list[int], neighbours: list[set[int]], blocked: list = None) -> int:
+    """
+    lowest_fit returns the lowest left slot where d does not overlap its neighbours already in starts,
+    nor the ranges in blocked[d].
+    """
+    used = [(starts[o], starts[o] + volumes[o]) for o in neighbours[d] if o in starts]
+    if blocked is not None:
+        used += blocked[d]
+    l = 0
+    for a, b in sorted(used):
+        if a >= l + volumes[d]:
+            break
+        l = max(l, b)
+    return l
+
+def assign(demands: list[int], volumes: list[int], neighbours: list[set[int]], S: int, blocked: list = None,
+           limit: int = SEARCH_LIMIT):
+    """
+    assign returns the left slot of every demand so that neighbours do not overlap, or None if they
+    do not fit in S slots, and whether the search was complete. demands are the ones to assign,
+    neighbours the conflict graph and blocked[d], if given, the slot ranges d cannot use.
+    """
+    demands = sorted(demands, key=lambda d: (-volumes[d], -len(neighbours[d]), d))
+
+    # the largest demands first is usually enough
+    starts = {}
+    for d in demands:
+        starts[d] = lowest_fit(d, starts, volumes, neighbours, blocked)
+    if all(starts[d] + volumes[d] <= S for d in demands):
+        return starts, True
+
+    starts = {}
+    explored = 0
+
+    def search(last) -> bool:
+        nonlocal explored
+        explored += 1
+        if len(starts) == len(demands):
+            return True
+        if explored > limit:
+            return False
+
+        fits = {}
+        for d in demands:
+            if d not in starts:
+                fits[d] = lowest_fit(d, starts, volumes, neighbours, blocked)
+                # the lowest fit only grows as demands are assigned
+                if fits[d] + volumes[d] > S:
+                    return False
+
+        for d, l in fits.items():
+            # left slots do not decrease, demands with the same left slot are taken by index
+            if (l, d) < last:
+                continue
+            starts[d] = l
+            if search((l, d)):
+                return True
+            del starts[d]
+        return False
+
+    if search((0, -1)):
+        return dict(starts), True
+    return None, explored <= limit
+
+def minimal_conflict(demands: list[int], volumes: list[int], neighbours: list[set[int]], S: int, blocked: list = None) -> list[int]:
+    """
+    minimal_conflict removes, one at a time, the demands that are not needed for demands not to fit.
+    """
+    kept = list(demands)
+    for d in demands:
+        rest = [o for o in kept if o != d]
+        fit, complete = assign(rest, volumes, neighbours, S, blocked)
+        if fit is None and complete:
+            kept = rest
+    return kept
+
+class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
+
+    def __init__(self, env):
+        self._S: int
+        self._demands: list[tuple[int, set[int], int]]
+        self._out: list[list[tuple[int, int]]]
+        self._columns: list[int]
+        self._occupied: list[list[tuple[int, int]]]
+        self._pool: CutPool = None
+        self._export: bool = False
+        LazyConstraintCallback.__init__(self, env)
+        ConstraintCallbackMixin.__init__(self)
+
+    def __call__(self):
+        # y_de values, demand by demand with the edges numbered as in out_arcs
+        values = self.get_values(self._columns)
+        E = len(values) // len(self._demands)
+
+        connected = True
+        for di, d in enumerate(self._demands):
+            y = values[di*E:(di+1)*E]
+            reached = reach(self._out, y, d[0])
+            T = d[1]
+            t_diff = T.difference(reached)
+            if len(t_diff) > 0:
+                connected = False
+                outgoing_edges = set()
+                for r in reached:
+                    for k, outgoing in self._out[r]:
+                        if outgoing not in reached:
+                            outgoing_edges.add(k)
+                # only unsatisfied cuts are added
+                if sum(y[k] for k in outgoing_edges) >= 1 - 1e-6:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, reached)
+                if self._export:
+                    print(f"Demand {di} not reaching some terminals: reached={reached}, diff={t_diff}")
+                ind = sorted(set(self._columns[di*E + k] for k in outgoing_edges))
+                self.add(constraint=[ind, [1.0] * len(ind)], sense="G", rhs=1.0)
+
+        # the spectrum is only checked once every demand is routed
+        if not connected:
+            return
+
+        routes = [{k for k in range(E) if values[di*E + k] > 0.5} for di in range(len(self._demands))]
+        neighbours = conflicts(routes)
+        volumes = [v for _, _, v in self._demands]
+        blocked = [[r for k in route for r in self._occupied[k]] for route in routes]
+        for component in components(neighbours):
+            fit, complete = assign(component, volumes, neighbours, self._S, blocked)
+            if fit is not None:
+                continue
+
+            if complete:
+                component = minimal_conflict(component, volumes, neighbours, self._S, blocked)
+            members = set(component)
+            # the arcs each demand shares with the others in the conflict, or occupied
+            shared = sorted(set(self._columns[di*E + k]
+                                for di in component
+                                for k in routes[di]
+                                if len(self._occupied[k]) > 0 or any(k in routes[o] for o in neighbours[di] & members)))
+            if self._export:
+                print(f"Demands {component} do not fit in the spectrum, complete search={complete}")
+            self.add(constraint=[shared, [1.0] * len(shared)], sense="L", rhs=len(shared) - 1.0)
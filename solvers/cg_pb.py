@@ -0,0 +1,314 @@
+from docplex.mp.model import Model
+from graph import out_arcs
+from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arborescence
+from solvers.occupancy import taken
+
+import heapq
+import math
+import time
+
+"""
+cg_pb is a column generation model, price and branch: the restricted master is solved as a linear
+program adding columns until none improves it, then as a MIP over the columns generated.
+
+A column is a demand d routed over an arborescence A starting at slot s, x_c = 1 if c is used.
+* every demand uses exactly one column (dual π_d)
+* every (arc, slot) is used by at most one column (dual μ_es <= 0)
+the objective is the arcs used.
+
+Pricing: routing d over A starting at s has a reduced cost of sum_{e in A} w_e - π_d, with
+w_e = 1 - sum_{s <= σ < s+v} μ_eσ, so for every demand and starting slot the cheapest arborescence
+over the weights w is searched. It is exact (Dreyfus-Wagner) for up to EXACT_TERMINALS terminals and
+the shortest path heuristic otherwise, which joins the closest terminal to the tree until every one
+is reached.
+
+Every demand has an artificial column, more expensive than any solution, so the master is always
+feasible. The columns of the heuristic solution are in the master from the start. Arcs are priced
+at infinity for the starting slots that overlap their occupied slots, or when they are outside a
+fixed route.
+"""
+
+# column generation stops after this many rounds, even if columns are still found
+MAX_ROUNDS = 200
+# a column is added if its reduced cost is lower than -EPS
+EPS = 1e-6
+# the exact pricing is used for demands with at most this many terminals
+EXACT_TERMINALS = 4
+
+class Solver():
+
+    def __init__(self, graph: T_graph, S: int, demands: list[tuple[int, set[int], int]], name: str = "") -> None:
+        self._graph = graph
+
+        if name != "":
+            self._name = "{}:{}".format("cg_pb", name)
+        else:
+            self._name = "cg_pb"
+
+        self._demands = demands
+        self._S = S
+        self._hook: BaseHook
+
+    def register_hook(self, hook: BaseHook):
+        self._hook = hook
+
+    def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
+            return self._solve(m)
+
+    @solve_hook
+    def _solve(self, m: Model) -> Res:
+        demands = self._demands
+        S = self._S
+        graph = self._graph
+
+        edges = []
+        for u, outgoing in enumerate(graph):
+            for v in outgoing:
+                edges.append((u, v))
+        index = {e: k for k, e in enumerate(edges)}
+        out = out_arcs(graph)
+
+        # a_d artificial variables, using one of them costs more than routing every demand over every edge
+        a = m.continuous_var_dict(keys=range(len(demands)), lb=0, ub=1, name="a")
+        objective = m.linear_expr(m.sum(a[d] * (len(demands) * len(edges) + 1) for d in a))
+        m.minimize(objective)
+
+        demand_cts = [m.add_constraint(m.linear_expr(a[d]) == 1, ctname=f"demand {d} is allocated")
+                      for d in range(len(demands))]
+        # the (arc, slot) constraints are added with the first column that uses them
+        slot_cts = {}
+
+        # x_c variables, columns[c] = (d, arcs, start)
+        x = {}
+        columns = []
+        def add_column(d: int, column_arcs: list[int], start: int):
+            c = len(columns)
+            var = m.continuous_var(lb=0, ub=1, name=f"x_{c}")
+            objective.add_term(var, len(column_arcs))
+            demand_cts[d].left_expr.add_term(var, 1)
+            for k in column_arcs:
+                for sl in range(start, start + demands[d][2]):
+                    if (k, sl) in slot_cts:
+                        slot_cts[k, sl].left_expr.add_term(var, 1)
+                    else:
+                        slot_cts[k, sl] = m.add_constraint(m.linear_expr(var) <= 1, ctname=f"arc {k} slot {sl} is used once")
+            columns.append((d, column_arcs, start))
+            x[c] = var
+
+        start = initial_solution(self._hook, graph, S, demands)
+        if start is not None:
+            for d, (demand_graph, (l, _)) in enumerate(start):
+                add_column(d, [index[i, j] for i, outgoing in enumerate(demand_graph) for j in outgoing], l)
+
+        self._hook.hook_before_solve(m)
+
+        # busy[k][sl] is the amount of slots lower than sl occupied on arc k, a column cannot use them
+        busy = []
+        for i, j in edges:
+            occupied = set(taken(self._hook.occupied or {}, i, j, S))
+            sums = [0]
+            for sl in range(S):
+                sums.append(sums[-1] + (sl in occupied))
+            busy.append(sums)
+
+        # the linear programs take at most half of the time limit, the rest is left to the MIP
+        time_limit = m.parameters.timelimit.get()
+        started = time.monotonic()
+        for _ in range(MAX_ROUNDS):
+            if time.monotonic() - started > time_limit / 2:
+                break
+            if m.solve() is None:
+                raise AssertionError(f"Solution not found: {m.solve_details}")
+
+            pi = m.dual_values(demand_cts)
+            mu = [[0.0 for _ in range(S)] for _ in edges]
+            for (k, sl), dual in zip(slot_cts, m.dual_values(slot_cts.values())):
+                mu[k][sl] = dual
+
+            # prefix[k][sl] is the sum of the duals of arc k for the slots lower than sl
+            prefix = []
+            for duals in mu:
+                sums = [0.0]
+                for dual in duals:
+                    sums.append(sums[-1] + dual)
+                prefix.append(sums)
+
+            added = 0
+            for d, (s, T, v) in enumerate(demands):
+                # the arcs outside the route of d, when it is fixed, cannot be used
+                blocked = set()
+                if self._hook.routes is not None and self._hook.routes[d] is not None:
+                    blocked = {k for k, e in enumerate(edges) if e not in self._hook.routes[d]}
+                best = None
+                # starting slots whose arcs weigh the same have the same arborescence
+                priced = {}
+                for sl in range(S - v + 1):
+                    weights = tuple(math.inf if k in blocked or busy[k][sl + v] > busy[k][sl]
+                                    else 1 - (prefix[k][sl + v] - prefix[k][sl])
+                                    for k in range(len(edges)))
+                    if weights not in priced:
+                        priced[weights] = steiner(graph, out, weights, s, T, index)
+                    tree = priced[weights]
+                    if tree is None:
+                        continue
+                    cost = sum(weights[k] for k in tree)
+                    if cost - pi[d] < -EPS and (best is None or cost < best[0]):
+                        best = (cost, tree, sl)
+
+                if best is not None:
+                    add_column(d, best[1], best[2])
+                    added += 1
+
+            if added == 0:
+                break
+
+        for var in list(a.values()) + list(x.values()):
+            var.set_vartype(m.binary_vartype)
+
+        if self._hook.mip_start and start is not None:
+            add_mip_start(m, [(x, {c: 1 for c in range(len(demands))})])
+
+        if time_limit < 1e75:
+            m.set_time_limit(max(time_limit - (time.monotonic() - started), 1))
+        solution = m.solve()
+
+        if solution == None:
+            raise AssertionError(f"Solution not found: {m.solve_details}")
+        if any(solution.get_value(a[d]) > 0.5 for d in a):
+            raise AssertionError("Solution not found: the columns generated do not allocate every demand")
+
+        res: list = [None for _ in demands]
+        for c, (d, column_arcs, sl) in enumerate(columns):
+            if solution.get_value(x[c]) > 0.5:
+                demand_graph = [[] for _ in range(len(graph))]
+                for k in column_arcs:
+                    i, j = edges[k]
+                    demand_graph[i].append(j)
+                res[d] = (demand_graph, (sl, sl + demands[d][2]))
+
+        return res
+
+    def name(self):
+        return self._name
+
+def steiner(graph: T_graph, out, weights, s: int, T: set[int], index) -> list[int]:
+    """
+    steiner returns the arcs, as numbered by out_arcs, of a cheap arborescence from s to every
+    terminal in T with weights[k] as the cost of arc k, or None if a terminal cannot be reached.
+    """
+    terminals = sorted(set(T) - {s})
+    if len(terminals) <= EXACT_TERMINALS:
+        used = dreyfus_wagner(out, weights, s, terminals)
+    else:
+        used = shortest_paths(out, weights, s, terminals)
+    if used is None:
+        return None
+
+    # the arcs found may reach a node twice, only an arborescence inside them is kept
+    pairs = {(i, j) for i in range(len(out)) for k, j in out[i] if k in used}
+    tree = arborescence(graph, s, T, lambda i, j: (i, j) in pairs)
+    return [index[e] for e in tree]
+
+def dreyfus_wagner(out, weights, s: int, terminals: list[int]) -> set[int]:
+    """
+    dreyfus_wagner computes the cheapest arborescence from s to the terminals. cost[X][i] is the cost
+    of reaching the terminals in X from i, either splitting X at i or taking an arc out of i.
+    """
+    n = len(out)
+    incoming = [[] for _ in range(n)]
+    for i in range(n):
+        for k, j in out[i]:
+            incoming[j].append((k, i))
+
+    full = (1 << len(terminals)) - 1
+    cost = [None for _ in range(full + 1)]
+    back = [None for _ in range(full + 1)]
+    for X in range(1, full + 1):
+        label = [math.inf for _ in range(n)]
+        pointer = [None for _ in range(n)]
+        if X & (X - 1) == 0:
+            label[terminals[X.bit_length() - 1]] = 0
+        else:
+            for i in range(n):
+                sub = (X - 1) & X
+                while sub > 0:
+                    value = cost[sub][i] + cost[X ^ sub][i]
+                    if value < label[i]:
+                        label[i] = value
+                        pointer[i] = ("split", sub)
+                    sub = (sub - 1) & X
+
+        to_visit = [(value, i) for i, value in enumerate(label) if value < math.inf]
+        heapq.heapify(to_visit)
+        while len(to_visit) > 0:
+            value, j = heapq.heappop(to_visit)
+            if value > label[j]:
+                continue
+            for k, i in incoming[j]:
+                if value + weights[k] < label[i]:
+                    label[i] = value + weights[k]
+                    pointer[i] = ("arc", k, j)
+                    heapq.heappush(to_visit, (label[i], i))
+
+        cost[X] = label
+        back[X] = pointer
+
+    if full == 0:
+        return set()
+    if cost[full][s] == math.inf:
+        return None
+
+    used = set()
+    to_visit = [(full, s)]
+    while len(to_visit) > 0:
+        X, i = to_visit.pop()
+        pointer = back[X][i]
+        if pointer is None:
+            continue
+        if pointer[0] == "arc":
+            used.add(pointer[1])
+            to_visit.append((X, pointer[2]))
+        else:
+            to_visit.append((pointer[1], i))
+            to_visit.append((X ^ pointer[1], i))
+    return used
+
+def shortest_paths(out, weights, s: int, terminals: list[int]) -> set[int]:
+    """
+    shortest_paths builds an arborescence from s joining the closest terminal to the tree, by the
+    shortest path from any of its nodes, until every terminal is reached.
+    """
+    tree = {s}
+    used = set()
+    remaining = set(terminals)
+    while len(remaining) > 0:
+        distance = {i: 0 for i in tree}
+        parent = {}
+        to_visit = [(0, i) for i in tree]
+        reached = None
+        while len(to_visit) > 0:
+            value, i = heapq.heappop(to_visit)
+            if value > distance[i]:
+                continue
+            if i in remaining:
+                reached = i
+                break
+            for k, j in out[i]:
+                if value + weights[k] < distance.get(j, math.inf):
+                    distance[j] = value + weights[k]
+                    parent[j] = (k, i)
+                    heapq.heappush(to_visit, (distance[j], j))
+
+        if reached is None:
+            return None
+
+        j = reached
+        while j not in tree:
+            k, i = parent[j]
+            used.add(k)
+            tree.add(j)
+            j = i
+        remaining -= tree
+    return used
@@ -0,0 +1,146 @@
+from docplex.mp.model import Model
+from cplex.callbacks import UserCutCallback
+from docplex.mp.callbacks.cb_mixin import *
+from graph import out_arcs, min_cut
+import json
+import os
+
+"""
+cuts separates the arborescence cuts of the cut based solvers on fractional solutions.
+
+The lazy callbacks only see integer solutions. Here, for every demand d and terminal t, a minimum
+s-t cut is computed with the fractional values of the edges of d as capacities, if it is lower
+than 1, the edges leaving the source side of the cut must add up to at least 1.
+
+Every cut found, lazy or fractional, can be kept in a CutPool, which is saved per instance and
+loaded as initial constraints the next time the instance is solved. Models solving the same instance
+at the same time share the file, every save merges the cuts found with the ones on disk.
+"""
+
+# a cut is added if the minimum cut is lower than 1 - VIOLATION
+VIOLATION = 1e-3
+
+class CutPool:
+    """
+    CutPool keeps the arborescence cuts of an instance without duplicates. A cut is identified by
+    its demand and the nodes on its source side, and counts how many times it was found violated.
+    """
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._cuts: dict[tuple[int, frozenset[int]], int] = {}
+        # violations found since the pool was loaded or saved, merged into the file on save
+        self._found: dict[tuple[int, frozenset[int]], int] = {}
+        if path != "" and os.path.exists(path):
+            self.load()
+
+    def add(self, d: int, source_side) -> bool:
+        """
+        add records a violation of the cut and returns whether it was not in the pool yet.
+        """
+        key = (d, frozenset(source_side))
+        violated = self._cuts.get(key, 0)
+        self._cuts[key] = violated + 1
+        self._found[key] = self._found.get(key, 0) + 1
+        return violated == 0
+
+    def violated(self, d: int, source_side) -> int:
+        return self._cuts.get((d, frozenset(source_side)), 0)
+
+    def __iter__(self):
+        return iter(list(self._cuts))
+
+    def __len__(self):
+        return len(self._cuts)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            for cut in json.load(f):
+                key = (cut["demand"], frozenset(cut["nodes"]))
+                self._cuts[key] = self._cuts.get(key, 0) + cut["violated"]
+
+    def save(self):
+        if self.path == "":
+            return
+        # other runs may have saved cuts meanwhile
+        merged = CutPool(self.path)._cuts
+        for key, violated in self._found.items():
+            merged[key] = merged.get(key, 0) + violated
+        self._cuts = merged
+        self._found = {}
+
+        cuts = [{"demand": d, "nodes": sorted(nodes), "violated": violated}
+                for (d, nodes), violated in sorted(self._cuts.items(), key=lambda c: (c[0][0], sorted(c[0][1])))]
+        partial = f"{self.path}.{os.getpid()}"
+        with open(partial, "w") as f:
+            json.dump(cuts, f)
+        os.replace(partial, self.path)
+
+def add_pool_cuts(m: Model, pool: CutPool, graph, demands, edge_vars):
+    """
+    add_pool_cuts adds every cut of the pool to m as a constraint, edge_vars(d, i, j) lists the
+    variables that add up to the value of edge (i, j) for demand d.
+    """
+    m.add_constraints((m.sum_vars(set(var
+                                      for i in nodes
+                                      for j in graph[i] if j not in nodes
+                                      for var in edge_vars(d, i, j))) >= 1
+                       for d, nodes in pool
+                       if d < len(demands) and all(i < len(graph) for i in nodes)),
+                      names="pooled cut")
+
+def register_user_cuts(m: Model, graph, demands, columns: list[list[list[int]]], pool: CutPool = None):
+    """
+    register_user_cuts adds the user cut callback to m, columns[d][k] lists the columns whose values
+    add up to the value of edge k (numbered as in out_arcs) for demand d.
+    """
+    cb = m.register_callback(DOUserCutCallback)
+    cb._out = out_arcs(graph)
+    cb._demands = demands
+    cb._columns = columns
+    cb._pool = pool
+    cb._columns_list = [c for demand_columns in columns for edge_columns in demand_columns for c in edge_columns]
+    return cb
+
+class DOUserCutCallback(ConstraintCallbackMixin, UserCutCallback):
+
+    def __init__(self, env):
+        self._out: list[list[tuple[int, int]]]
+        self._demands: list[tuple[int, set[int], int]]
+        self._columns: list[list[list[int]]]
+        self._columns_list: list[int]
+        self._pool: CutPool = None
+        self._export: bool = False
+        UserCutCallback.__init__(self, env)
+        ConstraintCallbackMixin.__init__(self)
+
+    def __call__(self):
+        values = self.get_values(self._columns_list)
+
+        offset = 0
+        for di, (s, T, _) in enumerate(self._demands):
+            capacity = []
+            for edge_columns in self._columns[di]:
+                capacity.append(sum(values[offset:offset + len(edge_columns)]))
+                offset += len(edge_columns)
+
+            cuts = []
+            for t in T:
+                # a cut already added for this demand may separate t as well
+                if any(t not in source_side for source_side in cuts):
+                    continue
+
+                value, source_side = min_cut(self._out, capacity, s, t, limit=1)
+                if value >= 1 - VIOLATION:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, source_side)
+
+                if self._export:
+                    print(f"Demand {di} terminal {t} fractional cut: value={value}, source side={source_side}")
+
+                ind = sorted(set(c
+                                 for i in source_side
+                                 for k, j in self._out[i] if j not in source_side
+                                 for c in self._columns[di][k]))
+                self.add(cut=[ind, [1.0] * len(ind)], sense="G", rhs=1.0, use=self.use_cut.purge)
+                cuts.append(source_side)
@@ -1,6 +1,10 @@
 from docplex.mp.model import Model
+from graph import incidence
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, before, flows, left, right
+from solvers.reduction import conflicts, kept, Reduced
+from solvers.symmetry import break_symmetry
 
 """
 dr_aov_f is a draov constraints system that uses integer variables to mantain flow constraints.
@@ -30,7 +34,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -47,70 +51,82 @@ class Solver():
                 edges.append((u, v))
 
         # y_de variables
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         #f_de variables
-        f = m.integer_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], lb=0, name="f")
+        f_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            f_keys = kept(f_keys, graph, demands, routes=self._hook.routes)
+        f = Reduced(m, m.integer_var_dict(keys=f_keys, lb=0, name="f"))
         for d, i, j in f:
             f[d, i, j].ub = len(demands[d][1])
 
 
         # n_dd' variables, n_dd' = 1 means that r_d < l_d' and there's an overlap over a path between demands
-        n = m.binary_var_dict(keys=[(d, d2) for d2 in range(len(demands)) for d in range(len(demands)) if d != d2], name="n")
+        # only the pairs that can share an arc are ordered when reducing, see reduction.conflicts
+        edge_set = set(edges)
+        ordered = {(d, d2): edge_set for d2 in range(len(demands)) for d in range(len(demands)) if d != d2}
+        disjoint = {}
+        if self._hook.reduce:
+            ordered, disjoint = conflicts(graph, S, demands)
+        n = m.binary_var_dict(keys=list(ordered), name="n")
 
         # r_d variables and l_d variables (right and left slot allocation), if r_d = 200 then freq allocation for d starts at 200
         r = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, ub=S-1, name="r")
         l = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, ub=S-1, name="l")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                inputs = []
-                outputs = []
-                for d2, u, v in f:
-                    if d2 != d:
-                        continue
-                    # incoming edge to j
-                    if v == j:
-                        inputs.append(f[d, u, v])
-                    # outgoing edge from j
-                    if u == j:
-                        outputs.append(f[d, u, v])
-
-                if j == s:
-                    # source input - output = - |T(d)|
-                    m.add_constraint(sum(inputs) - sum(outputs) == -len(T), ctname=f"source {j} input - output is -{len(T)}")
-                elif j in T:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 1, ctname=f"terminal {j} input - output equals 1")
-                else:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 0, ctname=f"node {j} input - output equals 0")
-
-        for d, i, j in f:
-            m.add_constraint(y[d,i,j]*len(demands[d][1]) >= f[d,i,j], ctname="if f_e is set, y_e must be set")
+        f_out, f_in = incidence(f)
+        # source input - output = - |T(d)|, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(f[k] for k in f_in[d, j]) - m.sum_vars(f[k] for k in f_out[d, j]) ==
+             (-len(T) if j == s else 1 if j in T else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for j in range(len(graph))),
+            names="flow conservation")
+
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= f[d,i,j] for d, i, j in f),
+                          names="if f_e is set, y_e must be set")
 
         # slot constraints
-        for d1, i, j in y:
-            for d2 in range(len(demands)):
-                if d1 <= d2:
-                    continue
-                m.add_constraint(n[d1,d2] + n[d2,d1] >= y[d1,i,j] + y[d2,i,j]- 1, ctname="if d, d' share an arc then either n_dd' or n_d'd = 1")
+        m.add_constraints((n[d1,d2] + n[d2,d1] >= y[d1,i,j] + y[d2,i,j]- 1
+                           for d1, i, j in y
+                           for d2 in range(d1) if (i, j) in ordered.get((d1, d2), ())),
+                          names="if d, d' share an arc then either n_dd' or n_d'd = 1")
 
         # demands do not overlap
-        for d1, d2 in n:
-            for i, j in edges:
-                m.add_constraint(r[d1] + 1 <= l[d2] + S*(1-n[d1,d2]), ctname="avoid overlap between demands")
+        m.add_constraints((r[d1] + 1 <= l[d2] + S*(1-n[d1,d2]) for d1, d2 in n),
+                          names="avoid overlap between demands")
+
+        m.add_constraints((y[d1,i,j] + y[d2,i,j] <= 1
+                           for (d1, d2), shared in disjoint.items()
+                           for i, j in edges if (i, j) in shared),
+                          names="demands that do not fit together use different arcs")
         
         # difference between right and left is slots required per demand
-        for d in range(len(demands)):
-            m.add_constraint(r[d] - l[d] + 1 == demands[d][2], ctname="slots are the required amount")
-
-        for d in range(len(demands)):
-            m.add_constraint(l[d] <= r[d], ctname="right is greater than left")
-
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((r[d] - l[d] + 1 == demands[d][2] for d in range(len(demands))),
+                          names="slots are the required amount")
+
+        m.add_constraints((l[d] <= r[d] for d in range(len(demands))),
+                          names="right is greater than left")
+
+        m.set_objective("min", m.sum_vars(y.values()))
+
+        if self._hook.symmetry:
+            break_symmetry(m, demands, l)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (f, flows(start, demands)),
+                    (n, before(start)),
+                    (l, left(start)),
+                    (r, right(start))])
 
         self._hook.hook_before_solve(m)
         solution = m.solve()
@@ -1,5 +1,9 @@
 from docplex.mp.model import Model
+from graph import incidence
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, left, order, paths, right
+from solvers.reduction import conflicts, kept, Reduced
+from solvers.symmetry import break_symmetry
 
 import math
 
@@ -25,7 +29,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -41,67 +45,82 @@ class Solver():
             for v in outgoing:
                 edges.append((u, v))
 
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
-        yp = m.binary_var_dict(keys=[(d, t, i, j) for d in range(len(demands)) for t in demands[d][1] for i, j in edges], name="y'")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
+        yp_keys = [(d, t, i, j) for d in range(len(demands)) for t in demands[d][1] for i, j in edges]
+        if self._hook.reduce:
+            yp_keys = kept(yp_keys, graph, demands, arc=2, terminal=1, routes=self._hook.routes)
+        yp = Reduced(m, m.binary_var_dict(keys=yp_keys, name="y'"))
 
 
         # p_dd' variables, p_dd' = 1 means that r_d < l_d'
-        p = m.binary_var_dict(keys=[(d, d2) for d2 in range(len(demands)) for d in range(len(demands)) if d != d2], name="p")
+        # only the pairs that can share an arc are ordered when reducing, see reduction.conflicts
+        edge_set = set(edges)
+        ordered = {(d, d2): edge_set for d2 in range(len(demands)) for d in range(len(demands)) if d != d2}
+        disjoint = {}
+        if self._hook.reduce:
+            ordered, disjoint = conflicts(graph, S, demands)
+        p = m.binary_var_dict(keys=list(ordered), name="p")
 
         # r_d variables and l_d variables (right and left slot allocation), if r_d = 200 then freq allocation for d starts at 200    
         r = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, ub=S-1, name="r")
         l = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, ub=S-1, name="l")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                for t in T:    
-                    incoming = []
-                    outgoing = []
-                    
-                    for d2, t2, u, v in yp:
-                        if d != d2 or t != t2:
-                            continue
-                        if u == j:
-                            outgoing.append(yp[d2,t2,u,v])
-                        if v == j:
-                            incoming.append(yp[d2,t2,u,v])
-                    if j == s:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == -1, ctname="at least one more outgoing than incoming for source")
-                    elif j == t:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == 1, ctname="at least one more incoming than outgoing for terminal")
-                    else:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == 0, ctname="same incoming as outgoing for non source/terminal")
-            for i, j in edges:
-                yps = []
-                for d2, t, u, v in yp:
-                    if u == i and v == j and d2 == d:
-                        yps.append(yp[d2, t, u, v])
-                m.add_constraint(y[d,i,j]*len(T) >= sum(yps), ctname="if one yp is set, y must be set")
+        yp_out, yp_in = incidence(yp)
+        # source input - output = -1, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(yp[k] for k in yp_in[d, t, j]) - m.sum_vars(yp[k] for k in yp_out[d, t, j]) ==
+             (-1 if j == s else 1 if j == t else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for t in T
+             for j in range(len(graph))),
+            names="flow conservation per terminal")
+
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= m.sum_vars(yp[d, t, i, j] for t in demands[d][1])
+                           for d, i, j in y),
+                          names="if one yp is set, y must be set")
                 
         # slot constraints
-        for d1, d2 in p:
-            if d1 > d2:
-                m.add_constraint(p[d1,d2] + p[d2,d1] == 1, ctname="either d1 is before d2 or d2 is before d1")
+        m.add_constraints((p[d1,d2] + p[d2,d1] == 1 for d1, d2 in p if d1 > d2),
+                          names="either d1 is before d2 or d2 is before d1")
 
 
         # demands do not overlap
-        for d1, d2 in p:
-            for i, j in edges:
-                m.add_constraint(r[d1] + 1 <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2, i, j]), ctname="avoid overlap between demands")     
+        m.add_constraints((r[d1] + 1 <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2,i,j])
+                           for d1, d2 in p
+                           for i, j in edges if (i, j) in ordered[d1, d2]),
+                          names="avoid overlap between demands")
+
+        m.add_constraints((y[d1,i,j] + y[d2,i,j] <= 1
+                           for (d1, d2), shared in disjoint.items()
+                           for i, j in edges if (i, j) in shared),
+                          names="demands that do not fit together use different arcs")
         
         # difference between right and left is slots required per demand
-        for d in range(len(demands)):
-            m.add_constraint(r[d] - l[d] + 1 == demands[d][2], ctname="slots are the required amount")
+        m.add_constraints((r[d] - l[d] + 1 == demands[d][2] for d in range(len(demands))),
+                          names="slots are the required amount")
 
-        for d in range(len(demands)):
-            m.add_constraint(l[d] <= r[d], ctname="right is greater than left")
+        m.add_constraints((l[d] <= r[d] for d in range(len(demands))),
+                          names="right is greater than left")
 
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, l)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (yp, paths(start, demands)),
+                    (p, order(start)),
+                    (l, left(start)),
+                    (r, right(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -1,5 +1,9 @@
 from docplex.mp.model import Model
+from graph import incidence
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, flows, starts
+from solvers.reduction import kept, Reduced
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 dr_bsa_f is a drbr constraints system that uses integer variables to mantain flow constraints.
@@ -29,7 +33,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -46,10 +50,16 @@ class Solver():
                 edges.append((u, v))
 
         # y_de variables
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         #f_de variables
-        f = m.integer_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], lb=0, name="f")
+        f_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            f_keys = kept(f_keys, graph, demands, routes=self._hook.routes)
+        f = Reduced(m, m.integer_var_dict(keys=f_keys, lb=0, name="f"))
         for d, i, j in f:
             f[d, i, j].ub = len(demands[d][1])
 
@@ -57,47 +67,41 @@ class Solver():
         l = m.binary_var_dict(keys=[(d, s) for d in range(len(demands)) for s in range(S)], name="l")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                inputs = []
-                outputs = []
-                for d2, u, v in f:
-                    if d2 != d:
-                        continue
-                    # incoming edge to j
-                    if v == j:
-                        inputs.append(f[d, u, v])
-                    # outgoing edge from j
-                    if u == j:
-                        outputs.append(f[d, u, v])
-
-                if j == s:
-                    # source input - output = - |T(d)|
-                    m.add_constraint(sum(inputs) - sum(outputs) == -len(T), ctname=f"source {j} input - output is -{len(T)}")
-                elif j in T:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 1, ctname=f"terminal {j} input - output equals 1")
-                else:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 0, ctname=f"node {j} input - output equals 0")
-
-        for d, i, j in f:
-            m.add_constraint(y[d,i,j]*len(demands[d][1]) >= f[d,i,j], ctname="if f_e is set, y_e must be set")
+        f_out, f_in = incidence(f)
+        # source input - output = - |T(d)|, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(f[k] for k in f_in[d, j]) - m.sum_vars(f[k] for k in f_out[d, j]) ==
+             (-len(T) if j == s else 1 if j in T else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for j in range(len(graph))),
+            names="flow conservation")
+
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= f[d,i,j] for d, i, j in f),
+                          names="if f_e is set, y_e must be set")
         # demands have a left slot assignation
-        for d in range(len(demands)):
-            m.add_constraint(sum([l[d,s] for s in range(S-demands[d][2]+1)]) == 1, ctname="every demand must have a left binary slot assignation")
+        m.add_constraints((m.sum_vars(l[d,s] for s in range(S-demands[d][2]+1)) == 1 for d in range(len(demands))),
+                          names="every demand must have a left binary slot assignation")
         
-        for d1,d2,i,j,s in [(d1,d2, e[0], e[1], s) 
-                for d1 in range(len(demands))
-                for d2 in range(len(demands)) if d1 != d2
-                for e in edges
-                for s in range(S-demands[d1][2]+1)]:
-            lsum = sum([l[d2,s2] for s2 in range(s, s+demands[d1][2])])
-            m.add_constraint(lsum <= 3 - y[d1,i,j] - y[d2,i,j] - l[d1,s], ctname="avoid overlapping between demand slots")
-
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((m.sum_vars(l[d2,s2] for s2 in range(s, s+demands[d1][2])) <= 3 - y[d1,i,j] - y[d2,i,j] - l[d1,s]
+                           for d1 in range(len(demands))
+                           for d2 in range(len(demands)) if d1 != d2
+                           for i, j in edges
+                           for s in range(S-demands[d1][2]+1)),
+                          names="avoid overlapping between demand slots")
+
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, l))
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (f, flows(start, demands)),
+                    (l, starts(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -1,6 +1,10 @@
 from docplex.mp.model import Model
+from graph import incidence
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, paths, starts
+from solvers.reduction import kept, Reduced
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 dr_bsa_m is a drbr constraints system that generates a specific path per pair (demand, terminal) and then joins them all together.
@@ -24,7 +28,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -41,56 +45,57 @@ class Solver():
             for v in outgoing:
                 edges.append((u, v))
 
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
-        yp = m.binary_var_dict(keys=[(d, t, i, j) for d in range(len(demands)) for t in demands[d][1] for i, j in edges], name="y'")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
+        yp_keys = [(d, t, i, j) for d in range(len(demands)) for t in demands[d][1] for i, j in edges]
+        if self._hook.reduce:
+            yp_keys = kept(yp_keys, graph, demands, arc=2, terminal=1, routes=self._hook.routes)
+        yp = Reduced(m, m.binary_var_dict(keys=yp_keys, name="y'"))
 
         # l_ds variables (left slot allocation), if l_ds = 1 then freq allocation for d starts at s    
         l = m.binary_var_dict(keys=[(d, s) for d in range(len(demands)) for s in range(S)], name="l")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                for t in T:    
-                    incoming = []
-                    outgoing = []
-                    
-                    for d2, t2, u, v in yp:
-                        if d != d2 or t != t2:
-                            continue
-                        if u == j:
-                            outgoing.append(yp[d2,t2,u,v])
-                        if v == j:
-                            incoming.append(yp[d2,t2,u,v])
-                    if j == s:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == -1, ctname="at least one more outgoing than incoming for source")
-                    elif j == t:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == 1, ctname="at least one more incoming than outgoing for terminal")
-                    else:
-                        m.add_constraint(sum(incoming) - sum(outgoing) == 0, ctname="same incoming as outgoing for non source/terminal")
-            for i, j in edges:
-                yps = []
-                for d2, t, u, v in yp:
-                    if u == i and v == j and d2 == d:
-                        yps.append(yp[d2, t, u, v])
-                m.add_constraint(y[d,i,j]*len(T) >= sum(yps), ctname="if one yp is set, y must be set")
+        yp_out, yp_in = incidence(yp)
+        # source input - output = -1, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(yp[k] for k in yp_in[d, t, j]) - m.sum_vars(yp[k] for k in yp_out[d, t, j]) ==
+             (-1 if j == s else 1 if j == t else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for t in T
+             for j in range(len(graph))),
+            names="flow conservation per terminal")
+
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= m.sum_vars(yp[d, t, i, j] for t in demands[d][1])
+                           for d, i, j in y),
+                          names="if one yp is set, y must be set")
                 
         # demands have a left slot assignation
-        for d in range(len(demands)):
-            m.add_constraint(sum([l[d,s] for s in range(S-demands[d][2]+1)]) == 1, ctname="every demand must have a left binary slot assignation")
+        m.add_constraints((m.sum_vars(l[d,s] for s in range(S-demands[d][2]+1)) == 1 for d in range(len(demands))),
+                          names="every demand must have a left binary slot assignation")
         
-        for d1,d2,i,j,s in [(d1,d2, e[0], e[1], s) 
-                for d1 in range(len(demands))
-                for d2 in range(len(demands)) if d1 != d2
-                for e in edges
-                for s in range(S-demands[d1][2]+1)]:
-            lsum = sum([l[d2,s2] for s2 in range(s, s+demands[d1][2])])
-            m.add_constraint(lsum <= 3 - y[d1,i,j] - y[d2,i,j] - l[d1,s], ctname="avoid overlapping between demand slots")
-
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((m.sum_vars(l[d2,s2] for s2 in range(s, s+demands[d1][2])) <= 3 - y[d1,i,j] - y[d2,i,j] - l[d1,s]
+                           for d1 in range(len(demands))
+                           for d2 in range(len(demands)) if d1 != d2
+                           for i, j in edges
+                           for s in range(S-demands[d1][2]+1)),
+                          names="avoid overlapping between demand slots")
+
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, l))
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (yp, paths(start, demands)),
+                    (l, starts(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -1,8 +1,12 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import out_arcs, reach
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.cuts import CutPool, add_pool_cuts, register_user_cuts
+from solvers.heuristic import initial_solution, add_mip_start, arcs, left, order
+from solvers.reduction import conflicts, kept, Reduced
+from solvers.symmetry import break_symmetry
 
 """
 dr_ob_c is a drbr constraints system which adds a cut based approach to guarantee the demands arborescense.
@@ -27,7 +31,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -43,40 +47,73 @@ class Solver():
         for u, outgoing in enumerate(iterable=self._graph):
             for v in outgoing:
                 edges.append((u, v))
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
-
-        p = m.binary_var_dict(keys=[(d, d2) for d2 in range(len(demands)) for d in range(len(demands)) if d != d2], name="p")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
+
+        # only the pairs that can share an arc are ordered when reducing, see reduction.conflicts
+        edge_set = set(edges)
+        ordered = {(d, d2): edge_set for d2 in range(len(demands)) for d in range(len(demands)) if d != d2}
+        disjoint = {}
+        if self._hook.reduce:
+            ordered, disjoint = conflicts(graph, S, demands)
+        p = m.binary_var_dict(keys=list(ordered), name="p")
 
         # l_d variables (left slot allocation), if l_d = 200 then freq allocation for d starts at 200
         l = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, name="l")
 
         # cut based constraints
-        for di, d in enumerate(demands):
-            s = d[0]
-            m.add_constraint(sum([y[di, s, o] for o in graph[s]]) >= 1)
+        m.add_constraints(m.sum_vars(y[di, d[0], o] for o in graph[d[0]]) >= 1
+                          for di, d in enumerate(demands))
 
         cb = m.register_callback(DOLazyCallback)
         cb._y = y
         cb._l = l
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = [y[d, i, j].index for d in range(len(demands)) for i, j in edges]
+
+        if self._hook.cut_pool is not None:
+            cb._pool = self._hook.cut_pool
+            add_pool_cuts(m, self._hook.cut_pool, graph, demands, lambda d, i, j: [y[d, i, j]])
+
+        if self._hook.user_cuts:
+            register_user_cuts(m, graph, demands, [[[y[d, i, j].index] for i, j in edges] for d in range(len(demands))],
+                               self._hook.cut_pool)
 
         # l_d <= S - v(d) - 1
-        for d in range(len(demands)):
-            m.add_constraint(l[d] <= S - demands[d][2] - 1)
+        m.add_constraints(l[d] <= S - demands[d][2] - 1 for d in range(len(demands)))
 
         # slot constraints
-        for d1, d2 in p:
-            if d1 > d2:
-                m.add_constraint(p[d1,d2] + p[d2,d1] == 1, ctname="either d1 is before d2 or d2 is before d1")
+        m.add_constraints((p[d1,d2] + p[d2,d1] == 1 for d1, d2 in p if d1 > d2),
+                          names="either d1 is before d2 or d2 is before d1")
 
         # demands do not overlap
-        for d1, d2 in p:
-            for i, j in edges:
-                m.add_constraint(demands[d1][2] + l[d1] <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2,i,j]), ctname="avoid overlap between demands")
+        m.add_constraints((demands[d1][2] + l[d1] <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2,i,j])
+                           for d1, d2 in p
+                           for i, j in edges if (i, j) in ordered[d1, d2]),
+                          names="avoid overlap between demands")
+
+        m.add_constraints((y[d1,i,j] + y[d2,i,j] <= 1
+                           for (d1, d2), shared in disjoint.items()
+                           for i, j in edges if (i, j) in shared),
+                          names="demands that do not fit together use different arcs")
         
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, l)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (p, order(start)),
+                    (l, left(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -121,32 +158,35 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._demands: list[tuple[int, set[int], int]]
         self._y: dict
         self._l: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: list[int]
+        self._pool: CutPool = None
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
     
     def __call__(self):
-        sol = self.make_complete_solution() 
-        
-        y = sol.get_value_dict(self._y)
-        l = sol.get_value_dict(self._l)
+        # y_de values, demand by demand with the edges numbered as in out_arcs
+        values = self.get_values(self._columns)
+        E = len(values) // len(self._demands)
 
-        res = to_res(y, l, len(self._graph), self._demands)
-        new_constraints = []
         for di, d in enumerate(self._demands):
-            reached = set(dfs(res[di][0], d[0]))
+            y = values[di*E:(di+1)*E]
+            reached = reach(self._out, y, d[0])
             T = d[1]
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
                 outgoing_edges = set()
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges.add(self._y[di, r, outgoing])
+                            outgoing_edges.add(k)
+                # only unsatisfied cuts are added
+                if sum(y[k] for k in outgoing_edges) >= 1 - 1e-6:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, reached)
                 if self._export:
                     print(f"Demand {di} not reaching some terminals: reached={reached}, diff={t_diff}")
-                new_constraints.append(sum(outgoing_edges) >= 1)
-
-        unsats = self.get_cpx_unsatisfied_cts(new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
\ No newline at end of file
+                ind = sorted(set(self._columns[di*E + k] for k in outgoing_edges))
+                self.add(constraint=[ind, [1.0] * len(ind)], sense="G", rhs=1.0)
@@ -1,6 +1,10 @@
 from docplex.mp.model import Model
+from graph import incidence
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, flows, left, order
+from solvers.reduction import conflicts, kept, Reduced
+from solvers.symmetry import break_symmetry
 
 """
 dr_ob_f is a drbr constraints system that uses integer variables to mantain flow constraints.
@@ -24,7 +28,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -41,67 +45,78 @@ class Solver():
                 edges.append((u, v))
 
         # y_de variables
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         #f_de variables
-        f = m.integer_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], lb=0, name="f")
+        f_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            f_keys = kept(f_keys, graph, demands, routes=self._hook.routes)
+        f = Reduced(m, m.integer_var_dict(keys=f_keys, lb=0, name="f"))
         for d, i, j in f:
             f[d, i, j].ub = len(demands[d][1])
 
         # p_dd' variables, p_dd' = 1 means that r_d < l_d'
-        p = m.binary_var_dict(keys=[(d, d2) for d2 in range(len(demands)) for d in range(len(demands)) if d != d2], name="p")
+        # only the pairs that can share an arc are ordered when reducing, see reduction.conflicts
+        edge_set = set(edges)
+        ordered = {(d, d2): edge_set for d2 in range(len(demands)) for d in range(len(demands)) if d != d2}
+        disjoint = {}
+        if self._hook.reduce:
+            ordered, disjoint = conflicts(graph, S, demands)
+        p = m.binary_var_dict(keys=list(ordered), name="p")
 
         # l_d variables (left slot allocation), if l_d = 200 then freq allocation for d starts at 200
         l = m.integer_var_dict(keys=[d for d in range(len(demands))], lb=0, name="l")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                inputs = []
-                outputs = []
-                for d2, u, v in f:
-                    if d2 != d:
-                        continue
-                    # incoming edge to j
-                    if v == j:
-                        inputs.append(f[d, u, v])
-                    # outgoing edge from j
-                    if u == j:
-                        outputs.append(f[d, u, v])
-
-                if j == s:
-                    # source input - output = - |T(d)|
-                    m.add_constraint(sum(inputs) - sum(outputs) == -len(T), ctname=f"source {j} input - output is -{len(T)}")
-                elif j in T:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 1, ctname=f"terminal {j} input - output equals 1")
-                else:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 0, ctname=f"node {j} input - output equals 0")
+        f_out, f_in = incidence(f)
+        # source input - output = - |T(d)|, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(f[k] for k in f_in[d, j]) - m.sum_vars(f[k] for k in f_out[d, j]) ==
+             (-len(T) if j == s else 1 if j in T else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for j in range(len(graph))),
+            names="flow conservation")
 
         # l_d <= S - v(d) - 1
-        for d in range(len(demands)):
-            m.add_constraint(l[d] <= S - demands[d][2] - 1)
+        m.add_constraints(l[d] <= S - demands[d][2] - 1 for d in range(len(demands)))
 
-        for d, i, j in f:
-            m.add_constraint(y[d,i,j]*len(demands[d][1]) >= f[d,i,j], ctname="if f_e is set, y_e must be set")
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= f[d,i,j] for d, i, j in f),
+                          names="if f_e is set, y_e must be set")
 
         # slot constraints
-        for d1, d2 in p:
-            if d1 > d2:
-                m.add_constraint(p[d1,d2] + p[d2,d1] == 1, ctname="either d1 is before d2 or d2 is before d1")
+        m.add_constraints((p[d1,d2] + p[d2,d1] == 1 for d1, d2 in p if d1 > d2),
+                          names="either d1 is before d2 or d2 is before d1")
 
         # demands do not overlap
-        for d1, d2 in p:
-            for i, j in edges:
-                m.add_constraint(demands[d1][2] + l[d1] <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2, i, j]), ctname="avoid overlap between demands")     
+        m.add_constraints((demands[d1][2] + l[d1] <= l[d2] + S*(3-p[d1,d2] - y[d1,i,j] - y[d2,i,j])
+                           for d1, d2 in p
+                           for i, j in edges if (i, j) in ordered[d1, d2]),
+                          names="avoid overlap between demands")
+
+        m.add_constraints((y[d1,i,j] + y[d2,i,j] <= 1
+                           for (d1, d2), shared in disjoint.items()
+                           for i, j in edges if (i, j) in shared),
+                          names="demands that do not fit together use different arcs")
         
-        for d in l:
-            m.add_constraint(l[d] + demands[d][2] <= S)
+        m.add_constraints(l[d] + demands[d][2] <= S for d in l)
 
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, l)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (f, flows(start, demands)),
+                    (p, order(start)),
+                    (l, left(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
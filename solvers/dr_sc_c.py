@@ -1,9 +1,13 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import out_arcs, reach
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.cuts import CutPool, add_pool_cuts, register_user_cuts
+from solvers.heuristic import initial_solution, add_mip_start, arcs, starts
+from solvers.reduction import kept, Reduced
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 dr_sc_c is a drbr constraints system which adds a cut based approach to guarantee the demands arborescense.
@@ -29,7 +33,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -45,36 +49,58 @@ class Solver():
         for u, outgoing in enumerate(iterable=self._graph):
             for v in outgoing:
                 edges.append((u, v))
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         # l_ds variables (left slot allocation), if l_ds = 1 then freq allocation for d starts at s    
         l = m.binary_var_dict(keys=[(d, s) for d in range(len(demands)) for s in range(S)], name="l")
 
         # cut based constraints
-        for di, d in enumerate(demands):
-            s = d[0]
-            m.add_constraint(sum([y[di, s, o] for o in graph[s]]) >= 1)
+        m.add_constraints(m.sum_vars(y[di, d[0], o] for o in graph[d[0]]) >= 1
+                          for di, d in enumerate(demands))
 
         cb = m.register_callback(DOLazyCallback)
         cb._y = y
         cb._l = l
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = [y[d, i, j].index for d in range(len(demands)) for i, j in edges]
+
+        if self._hook.cut_pool is not None:
+            cb._pool = self._hook.cut_pool
+            add_pool_cuts(m, self._hook.cut_pool, graph, demands, lambda d, i, j: [y[d, i, j]])
+
+        if self._hook.user_cuts:
+            register_user_cuts(m, graph, demands, [[[y[d, i, j].index] for i, j in edges] for d in range(len(demands))],
+                               self._hook.cut_pool)
 
         # demands have a left slot assignation
-        for d in range(len(demands)):
-            m.add_constraint(sum([l[d,s] for s in range(S-demands[d][2]+1)]) == 1, ctname="every demand must have a left binary slot assignation")
+        m.add_constraints((m.sum_vars(l[d,s] for s in range(S-demands[d][2]+1)) == 1 for d in range(len(demands))),
+                          names="every demand must have a left binary slot assignation")
         
-        for d1,d2,e,s,i in [(d1,d2, e, s, i) 
-                for d1 in range(len(demands))
-                for d2 in range(len(demands)) if d1 != d2
-                for e in edges
-                for s in range(S-demands[d1][2]+1)
-                for i in range(demands[d1][2])]:
-            m.add_constraint(l[d2,s+i] <= 3 - y[d1,e[0],e[1]] - y[d2,e[0],e[1]] - l[d1,s], ctname="avoid overlapping between demand slots")
-
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((l[d2,s+i] <= 3 - y[d1,e[0],e[1]] - y[d2,e[0],e[1]] - l[d1,s]
+                           for d1 in range(len(demands))
+                           for d2 in range(len(demands)) if d1 != d2
+                           for e in edges
+                           for s in range(S-demands[d1][2]+1)
+                           for i in range(demands[d1][2])),
+                          names="avoid overlapping between demand slots")
+
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, l))
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (l, starts(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -121,31 +147,35 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._demands: list[tuple[int, set[int], int]]
         self._y: dict
         self._l: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: list[int]
+        self._pool: CutPool = None
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
     
     def __call__(self):
-        sol = self.make_complete_solution() 
-        y = sol.get_value_dict(self._y)
-        l = sol.get_value_dict(self._l)
+        # y_de values, demand by demand with the edges numbered as in out_arcs
+        values = self.get_values(self._columns)
+        E = len(values) // len(self._demands)
 
-        res = to_res(y, l, len(self._graph), self._demands)
-        new_constraints = []
         for di, d in enumerate(self._demands):
-            reached = set(dfs(res[di][0], d[0]))
+            y = values[di*E:(di+1)*E]
+            reached = reach(self._out, y, d[0])
             T = d[1]
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
                 outgoing_edges = set()
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges.add(self._y[di, r, outgoing])
+                            outgoing_edges.add(k)
+                # only unsatisfied cuts are added
+                if sum(y[k] for k in outgoing_edges) >= 1 - 1e-6:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, reached)
                 if self._export:
                     print(f"Demand {di} not reaching some terminals: reached={reached}, diff={t_diff}")
-                new_constraints.append(sum(outgoing_edges) >= 1)
-
-        unsats = self.get_cpx_unsatisfied_cts(new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
\ No newline at end of file
+                ind = sorted(set(self._columns[di*E + k] for k in outgoing_edges))
+                self.add(constraint=[ind, [1.0] * len(ind)], sense="G", rhs=1.0)
@@ -1,8 +1,14 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import dfs, out_arcs, reach
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.cuts import CutPool, add_pool_cuts, register_user_cuts
+from solvers.heuristic import initial_solution, add_mip_start, arc_starts
+from solvers.reduction import kept, Reduced
+from solvers.symmetry import break_symmetry, weighted_slots
+from solvers.matrix import Rows, columns
+import numpy as np
 
 """
 drl_bf_c
@@ -26,7 +32,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -48,51 +54,52 @@ class Solver():
             S_L[d] = S - v
 
         # U_dets variables
-        l = m.binary_var_dict(keys=[(d, i, j, s)
-                                    for d in range(len(demands))
-                                    for i, j in edges
-                                    for s in range(0, S_L[d] + 1)], name="l")
+        l_keys = [(d, i, j, s)
+                  for d in range(len(demands))
+                  for i, j in edges
+                  for s in range(0, S_L[d] + 1)]
+        if self._hook.reduce:
+            l_keys = kept(l_keys, graph, demands, routes=self._hook.routes)
+        l = Reduced(m, m.binary_var_dict(keys=l_keys, name="l"))
 
         cb = m.register_callback(DOLazyCallback)
         cb._l = l
         cb._S_L = S_L
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = [l[d, i, j, s].index
+                       for d in range(len(demands))
+                       for i, j in edges
+                       for s in range(0, S_L[d] + 1)]
+
+        if self._hook.cut_pool is not None:
+            cb._pool = self._hook.cut_pool
+            add_pool_cuts(m, self._hook.cut_pool, graph, demands,
+                          lambda d, i, j: [l[d, i, j, s] for s in range(0, S_L[d] + 1)])
+
+        if self._hook.user_cuts:
+            register_user_cuts(m, graph, demands, [[[l[d, i, j, s].index for s in range(0, S_L[d] + 1)]
+                                                    for i, j in edges]
+                                                   for d in range(len(demands))],
+                               self._hook.cut_pool)
+
+        if self._hook.matrix:
+            matrix_constraints(m, graph, edges, demands, S, S_L, l)
+        else:
+            model_constraints(m, graph, edges, demands, S, S_L, l)
 
-        for d, j, e1, e2, sl in [
-            (d, j, e1, e2, sl)
-            for d in range(len(demands))
-            for j in range(len(graph))
-            for e1 in edges if e1[0] == j or e1[1] == j
-            for e2 in edges if e2[0] == j or e2[1] == j
-            for sl in range(S_L[d] + 1)
-        ]:
-            lsum = sum([
-                l[d, e1[0], e1[1], sl2]
-                for sl2 in range(S_L[d])
-            ])
-
-            m.add_constraint(lsum <= 1 - (l[d, e2[0], e2[1], sl] - l[d, e1[0], e1[1], sl]),
-                             ctname="same slot is used on formed paths")
-
-        for d, e, sl in [
-            (d, e, sl)
-            for d in range(len(demands))
-            for e in edges
-            for sl in range(S_L[d] + 1)
-        ]:
-            i, j = e[0], e[1]
-            v = demands[d][2]
-            lsum = sum([
-                l[d2, i, j, sl2]
-                for d2 in range(len(demands)) if d != d2
-                for sl2 in range(sl, min(S_L[d2] + 1, sl+v))
-            ])
-            m.add_constraint(
-                lsum <= S*(1-l[d, i, j, sl]), ctname="avoid overlap")
+        m.set_objective("min", m.sum_vars(l.values()))
+
+        if self._hook.symmetry:
+            # the allocation of d is weighted on the arcs entering its lowest terminal
+            break_symmetry(m, demands, weighted_slots(m, l, lambda k: k[2] == min(demands[k[0]][1])))
 
-        m.set_objective("min",
-                        sum([l[d, i, j, sl] for d, i, j, sl in l]))
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (l, arc_starts(start))])
 
         self._hook.hook_before_solve(m)
         solution = m.solve()
@@ -111,6 +118,68 @@ class Solver():
         return self._name
 
 
+def model_constraints(m: Model, graph, edges, demands, S, S_L, l):
+    m.add_constraints((
+        m.sum_vars(l[d, e1[0], e1[1], sl2] for sl2 in range(S_L[d])) <=
+        1 - (l[d, e2[0], e2[1], sl] - l[d, e1[0], e1[1], sl])
+        for d in range(len(demands))
+        for j in range(len(graph))
+        for e1 in edges if e1[0] == j or e1[1] == j
+        for e2 in edges if e2[0] == j or e2[1] == j
+        for sl in range(S_L[d] + 1)),
+        names="same slot is used on formed paths")
+
+    m.add_constraints((
+        m.sum_vars(
+            l[d2, i, j, sl2]
+            for d2 in range(len(demands)) if d != d2
+            for sl2 in range(sl, min(S_L[d2] + 1, sl+demands[d][2]))
+        ) <= S*(1-l[d, i, j, sl])
+        for d in range(len(demands))
+        for i, j in edges
+        for sl in range(S_L[d] + 1)),
+        names="avoid overlap")
+
+def matrix_constraints(m: Model, graph, edges, demands, S, S_L, l):
+    D, E = len(demands), len(edges)
+    last = np.array([S_L[d] for d in range(D)])
+    width = last.max() + 1
+
+    # l_de is only defined up to S_L[d], the rest of the slots are padded with column 0
+    L = np.zeros((D, E, width), dtype=np.int64)
+    for d in range(D):
+        L[d, :, :S_L[d]+1] = columns(m, l, [(d, i, j, s) for i, j in edges for s in range(S_L[d]+1)], (E, S_L[d]+1))
+    rows = Rows(m)
+
+    # same slot is used on formed paths, rows ((e1, e2), sl) for e1 and e2 touching j
+    tail = np.array([i for i, _ in edges])
+    head = np.array([j for _, j in edges])
+    pairs = [(e1, e2)
+             for j in range(len(graph))
+             for e1 in np.flatnonzero((tail == j) | (head == j))
+             for e2 in np.flatnonzero((tail == j) | (head == j))]
+    e1, e2 = np.array(pairs, dtype=np.int64).reshape(-1, 2).T
+    for d in range(D):
+        n = S_L[d] + 1
+        cols = np.concatenate([
+            np.broadcast_to(L[d, e1, None, :S_L[d]], (len(e1), n, S_L[d])),
+            L[d, e2, :n, None],
+            L[d, e1, :n, None]], axis=2)
+        rows.add(cols, [1] * S_L[d] + [1, -1], "L", 1, name="same slot is used on formed paths")
+
+    # avoid overlap, rows (e, sl), the window of d2 goes from sl to sl+v_d or its last slot
+    for d, (_, _, v) in enumerate(demands):
+        n = S_L[d] + 1
+        window = np.arange(n)[:, None] + np.arange(v)[None, :]
+        others = (window[None, :, :] <= last[:, None, None]) & (np.arange(D) != d)[:, None, None]
+        cols = np.concatenate([
+            L[:, :, np.minimum(window, width-1)].transpose(1, 2, 0, 3).reshape(E, n, D*v),
+            L[d, :, :n, None]], axis=2)
+        vals = np.concatenate([
+            others.transpose(1, 0, 2).reshape(n, D*v),
+            np.full((n, 1), S)], axis=1)
+        rows.add(cols, vals, "L", S, name="avoid overlap")
+
 def to_res(graph, l, demands) -> list[tuple[T_graph, tuple[int, int]]]:
     n = len(graph)
     demand_graphs = [[[] for _ in range(n)] for _ in range(len(demands))]
@@ -139,19 +208,6 @@ def to_res(graph, l, demands) -> list[tuple[T_graph, tuple[int, int]]]:
         res.append((demand_graphs[d], slot_assignations[d]))
     return res
 
-def filter_graph(graph, l, d_filter, S_L) -> T_graph:
-    n = len(graph)
-    demand_graph = [[] for _ in range(n)]
-    for i, outgoing in enumerate(graph):
-        for j in outgoing:
-            if j in demand_graph[i]:
-                continue
-            if any([abs(l[d_filter,i,j,s] - 1) < 0.001 for s in range(S_L + 1)]):
-                demand_graph[i].append(j)
-
-    return demand_graph
-
-
 class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
 
     def __init__(self, env):
@@ -161,37 +217,42 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._S_L: dict[int, int]
         self._demands: list[tuple[int, set[int], int]]
         self._l: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: list[int]
+        self._pool: CutPool = None
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
 
     def __call__(self):
-        sol = self.make_complete_solution()
+        # l_des values, demand by demand with the edges numbered as in out_arcs
+        values = self.get_values(self._columns)
+        E = sum(len(outgoing) for outgoing in self._out)
 
-        l = sol.get_value_dict(self._l)
-
-        new_constraints = []
+        offset = 0
         for di, d in enumerate(self._demands):
-            res = filter_graph(self._graph, l, di, self._S_L[di])
+            w = self._S_L[di] + 1
+            start, offset = offset, offset + E*w
+            l = values[start:offset]
 
-            reached = set(dfs(res, d[0]))
+            # an edge is used by the demand if it is used starting at any slot
+            y = [max(l[k*w:(k+1)*w]) for k in range(E)]
+            reached = reach(self._out, y, d[0])
             T = d[1]
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
                 outgoing_edges = set()
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges |= set([
-                                self._l[di, r, outgoing, sl]
-                                for sl in range(self._S_L[di] + 1)
-                            ])
+                            outgoing_edges |= set(range(k*w, (k+1)*w))
+                # only unsatisfied cuts are added
+                if sum(l[k] for k in outgoing_edges) >= 1 - 1e-6:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, reached)
                 if self._export:
                     print(
                         f"Demand {di} not reaching some terminals: reached={reached}, diff={t_diff}")
-                new_constraints.append(sum(outgoing_edges) >= 1)
-
-        unsats = self.get_cpx_unsatisfied_cts(
-            new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
+                ind = sorted(set(self._columns[start + k] for k in outgoing_edges))
+                self.add(constraint=[ind, [1.0] * len(ind)], sense="G", rhs=1.0)
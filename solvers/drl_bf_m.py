@@ -1,7 +1,10 @@
 from re import L
 from docplex.mp.model import Model
-from graph import dfs
+from graph import dfs, incidence
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, path_starts
+from solvers.reduction import kept, Reduced
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 drl_bf_m
@@ -25,7 +28,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -46,85 +49,76 @@ class Solver():
             S_L[d] = S - v
 
         # U_dets variables
-        l = m.binary_var_dict(keys=[(d, i, j, t, s)
-                                    for d in range(len(demands))
-                                    for i, j in edges
-                                    for t in demands[d][1]
-                                    for s in range(0, S_L[d] + 1)], name="l")
+        l_keys = [(d, i, j, t, s)
+                  for d in range(len(demands))
+                  for i, j in edges
+                  for t in demands[d][1]
+                  for s in range(0, S_L[d] + 1)]
+        if self._hook.reduce:
+            l_keys = kept(l_keys, graph, demands, terminal=3, routes=self._hook.routes)
+        l = Reduced(m, m.binary_var_dict(keys=l_keys, name="l"))
         # flow constraints
-        for d, t in [(d, t)
-                     for d in range(len(demands))
-                     for t in demands[d][1]
-                     ]:
-            s = demands[d][0]
-            T = demands[d][1]
-
-            m.add_constraint(sum([
-                l[d, e[0], e[1], t, sl]
-                for e in edges if e[0] == s
-                for sl in range(S_L[d] + 1)
-            ]) == 1, ctname="one outgoing from source")
-
-            m.add_constraint(sum([
-                l[d, e[0], e[1], t, sl]
-                for e in edges if e[1] == s
-                for sl in range(S_L[d] + 1)
-            ]) == 0, ctname="none incoming to source")
-
-        for d, j, t, sl in [
-            (d, j, t, sl)
+        l_out, l_in = incidence(l, arc=1)
+        m.add_constraints((
+            m.sum_vars(l[k] for sl in range(S_L[d] + 1) for k in l_out[d, t, sl, s]) == 1
+            for d, (s, T, _) in enumerate(demands)
+            for t in T),
+            names="one outgoing from source")
+
+        m.add_constraints((
+            m.sum_vars(l[k] for sl in range(S_L[d] + 1) for k in l_in[d, t, sl, s]) == 0
+            for d, (s, T, _) in enumerate(demands)
+            for t in T
+            # without arcs into the source the constraint would be empty
+            if any(len(l_in[d, t, sl, s]) > 0 for sl in range(S_L[d] + 1))),
+            names="none incoming to source")
+
+        m.add_constraints((
+            m.sum_vars(l[k] for k in l_in[d, t, sl, j]) - m.sum_vars(l[k] for k in l_out[d, t, sl, j]) == 0
             for d in range(len(demands))
             for t in demands[d][1]
             for j in range(len(graph)) if j != demands[d][0] and j != t
             for sl in range(S_L[d] + 1)
-        ]:
-            incoming_sum = sum([
-                l[d, e[0], e[1], t, sl]
-                for e in edges if e[1] == j
-            ])
-
-            outgoing_sum = sum([
-                l[d, e[0], e[1], t, sl]
-                for e in edges if e[0] == j
-            ])
-
-            m.add_constraint(incoming_sum - outgoing_sum == 0,
-                             ctname="flow is conserved on internal nodes")
-
-        for d, e1, e2, t1, t2, sl in [
-            (d, e1, e2, t1, t2, sl)
+            # a node without arcs at sl has no flow to conserve
+            if len(l_in[d, t, sl, j]) + len(l_out[d, t, sl, j]) > 0),
+            names="flow is conserved on internal nodes")
+
+        m.add_constraints((
+            m.sum_vars(l[d, e1[0], e1[1], t1, sl2] for sl2 in range(S_L[d] + 1)) <=
+            1 - (l[d, e2[0], e2[1], t2, sl] - l[d, e1[0], e1[1], t1, sl])
             for d in range(len(demands))
             for e1 in edges if demands[d][0] == e1[0]
             for e2 in edges if demands[d][0] == e2[0]
             for t1 in demands[d][1]
             for t2 in demands[d][1] if t1 != t2
-            for sl in range(S_L[d] + 1)
-        ]:
-            lsum = sum([l[d, e1[0], e1[1], t1, sl2] for sl2 in range(S_L[d] + 1)])
-            m.add_constraint(lsum <= 1 - (l[d, e2[0], e2[1], t2, sl] - l[d, e1[0],
-                             e1[1], t1, sl]), ctname="paths with same demands use the same slots")
+            for sl in range(S_L[d] + 1)),
+            names="paths with same demands use the same slots")
 
-        for d, e, t, sl in [
-            (d, e, t, sl)
-            for d in range(len(demands))
-            for e in edges
-            for t in demands[d][1]
-            for sl in range(S_L[d] + 1)
-        ]:
-            i, j = e[0], e[1]
-            v = demands[d][2]
-            lsum = sum([
+        m.add_constraints((
+            m.sum_vars(
                 l[d2, i, j, t2, sl2]
                 for d2 in range(len(demands)) if d != d2
                 for t2 in demands[d2][1]
-                for sl2 in range(sl, min(S_L[d2] + 1, sl+v))
-            ])
-            m.add_constraint(
-                lsum <= S*(1-l[d, i, j, t, sl]), ctname="avoid overlap")
-
-        m.set_objective("min",
-                        sum([l[d, i, j, t, sl]/len(demands[d][1])
-                             for d, i, j, t, sl in l]))
+                for sl2 in range(sl, min(S_L[d2] + 1, sl+demands[d][2]))
+            ) <= S*(1-l[d, i, j, t, sl])
+            for d in range(len(demands))
+            for i, j in edges
+            for t in demands[d][1]
+            for sl in range(S_L[d] + 1)),
+            names="avoid overlap")
+
+        m.set_objective("min", m.sum(l[d, i, j, t, sl]/len(demands[d][1])
+                                     for d, i, j, t, sl in l))
+
+        if self._hook.symmetry:
+            # the allocation of d is weighted on the arcs entering its lowest terminal
+            break_symmetry(m, demands, weighted_slots(m, l, lambda k: k[2] == k[3] == min(demands[k[0]][1])))
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (l, path_starts(start, demands))])
 
         self._hook.hook_before_solve(m)
         solution = m.solve()
@@ -1,5 +1,10 @@
 from docplex.mp.model import Model
+from graph import incidence
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arcs, flows, slots
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import forbid_occupied
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 ds_acc_f is a constraints system that uses integer variables to mantain flow constraints.
@@ -27,7 +32,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -44,10 +49,16 @@ class Solver():
                 edges.append((u, v))
 
         # y_de variables
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         #f_de variables
-        f = m.integer_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], lb=0, name="f")
+        f_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            f_keys = kept(f_keys, graph, demands, routes=self._hook.routes)
+        f = Reduced(m, m.integer_var_dict(keys=f_keys, lb=0, name="f"))
         for d, i, j in f:
             f[d, i, j].ub = len(demands[d][1])
 
@@ -56,59 +67,53 @@ class Solver():
                                     for s in range(0, S+1)], name="x")
 
         # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-
-            for j, _ in enumerate(graph):
-                inputs = []
-                outputs = []
-                for d2, u, v in f:
-                    if d2 != d:
-                        continue
-                    # incoming edge to j
-                    if v == j:
-                        inputs.append(f[d, u, v])
-                    # outgoing edge from j
-                    if u == j:
-                        outputs.append(f[d, u, v])
-
-                if j == s:
-                    # source input - output = - |T(d)|
-                    m.add_constraint(sum(inputs) - sum(outputs) == -len(T), ctname=f"source {j} input - output is -{len(T)}")
-                elif j in T:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 1, ctname=f"terminal {j} input - output equals 1")
-                else:
-                    m.add_constraint(sum(inputs) - sum(outputs) == 0, ctname=f"node {j} input - output equals 0")
-
-        for d, i, j in f:
-            m.add_constraint(y[d,i,j]*len(demands[d][1]) >= f[d,i,j], ctname="if f_e is set, y_e must be set")
+        f_out, f_in = incidence(f)
+        # source input - output = - |T(d)|, terminal input - output = 1, any other node input - output = 0
+        m.add_constraints(
+            (m.sum_vars(f[k] for k in f_in[d, j]) - m.sum_vars(f[k] for k in f_out[d, j]) ==
+             (-len(T) if j == s else 1 if j in T else 0)
+             for d, (s, T, _) in enumerate(demands)
+             for j in range(len(graph))),
+            names="flow conservation")
+
+        m.add_constraints((y[d,i,j]*len(demands[d][1]) >= f[d,i,j] for d, i, j in f),
+                          names="if f_e is set, y_e must be set")
 
         # slot constraints
-        for d1, d2 in [(d1, d2) 
-                       for d1 in range(len(demands)) 
-                       for d2 in range(len(demands)) if d1 != d2]:
-            for i, j in edges:
-                for s in range(S):
-                    m.add_constraint(x[d1, s] + y[d1, i, j] + x[d2, s] + y[d2, i, j] <= 3,
-                                     ctname="demands do not overlap slots")
-
-        for d in range(len(demands)):
-            m.add_constraint(x[d,S] == 0)
-
-        for d, s1, s2 in [(d, s1, s2)
-                          for d in range(len(demands))
-                          for s1 in range(S)
-                          for s2 in range(S) if s2 > s1]:            
-            m.add_constraint(x[d,s1] + x[d,s2] <= x[d,s1+1] + 1, ctname="slots are continuous")
-
-
-        for d in range(len(demands)):
-            v = demands[d][2]
-            m.add_constraint(sum([x[d,s] for s in range(0, S)]) == v, 
-                             ctname="slots accumulate to demand")
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((x[d1, s] + y[d1, i, j] + x[d2, s] + y[d2, i, j] <= 3
+                           for d1 in range(len(demands))
+                           for d2 in range(len(demands)) if d1 != d2
+                           for i, j in edges
+                           for s in range(S)),
+                          names="demands do not overlap slots")
+
+        m.add_constraints(x[d,S] == 0 for d in range(len(demands)))
+
+        m.add_constraints((x[d,s1] + x[d,s2] <= x[d,s1+1] + 1
+                           for d in range(len(demands))
+                           for s1 in range(S)
+                           for s2 in range(S) if s2 > s1),
+                          names="slots are continuous")
+
+
+        m.add_constraints((m.sum_vars(x[d,s] for s in range(0, S)) == v for d, (_, _, v) in enumerate(demands)),
+                          names="slots accumulate to demand")
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, x))
+
+        if self._hook.occupied is not None:
+            forbid_occupied(m, x, y, self._hook.occupied, S)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (f, flows(start, demands)),
+                    (x, slots(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -1,9 +1,14 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import out_arcs, reach
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.cuts import CutPool, add_pool_cuts, register_user_cuts
+from solvers.heuristic import initial_solution, add_mip_start, arcs, slots
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import forbid_occupied
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 ds_bf_c is a constraints system which adds a cut based approach to guarantee the demands arborescense.
@@ -29,7 +34,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -45,15 +50,17 @@ class Solver():
         for u, outgoing in enumerate(iterable=self._graph):
             for v in outgoing:
                 edges.append((u, v))
-        y = m.binary_var_dict(keys=[(d, i, j) for d in range(len(demands)) for i, j in edges], name="y")
+        y_keys = [(d, i, j) for d in range(len(demands)) for i, j in edges]
+        if self._hook.reduce:
+            y_keys = kept(y_keys, graph, demands, routes=self._hook.routes)
+        y = Reduced(m, m.binary_var_dict(keys=y_keys, name="y"))
 
         x = m.binary_var_dict(keys=[(d, s) 
                                     for d in range(len(demands))
                                     for s in range(0, S+1)], name="x")
         # cut based constraints
-        for di, d in enumerate(demands):
-            s = d[0]
-            m.add_constraint(sum([y[di, s, o] for o in graph[s]]) >= 1)
+        m.add_constraints(m.sum_vars(y[di, d[0], o] for o in graph[d[0]]) >= 1
+                          for di, d in enumerate(demands))
 
         cb = m.register_callback(DOLazyCallback)
         cb._y = y
@@ -61,34 +68,51 @@ class Solver():
         cb._S = S
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = [y[d, i, j].index for d in range(len(demands)) for i, j in edges]
+
+        if self._hook.cut_pool is not None:
+            cb._pool = self._hook.cut_pool
+            add_pool_cuts(m, self._hook.cut_pool, graph, demands, lambda d, i, j: [y[d, i, j]])
+
+        if self._hook.user_cuts:
+            register_user_cuts(m, graph, demands, [[[y[d, i, j].index] for i, j in edges] for d in range(len(demands))],
+                               self._hook.cut_pool)
 
         # slot constraints
-        for d1, d2 in [(d1, d2) 
-                       for d1 in range(len(demands)) 
-                       for d2 in range(len(demands)) if d1 != d2]:
-            for i, j in edges:
-                for s in range(S):
-                    m.add_constraint(x[d1, s] + y[d1, i, j] + x[d2, s] + y[d2, i, j] <= 3,
-                                     ctname="demands do not overlap slots")
-
-        for d in range(len(demands)):
-            m.add_constraint(x[d,S] == 0)
-
-        for d in range(len(demands)):
-            v = demands[d][2]
-            for s in range(v-1, S):
-                m.add_constraint(
-                    sum([x[d, s2] for s2 in range(s - v + 1, s + 1)]) >= 
-                    v*(x[d, s] - x[d, s+1]), 
-                    ctname="slots are contiguous")
-
-        for d in range(len(demands)):
-            v = demands[d][2]
-            m.add_constraint(sum([x[d,s] for s in range(0, S)]) == v, 
-                             ctname="slots accumulate to demand")
-
-        m.set_objective("min", sum([y[d, u, v] for d, u, v in y]))
+        m.add_constraints((x[d1, s] + y[d1, i, j] + x[d2, s] + y[d2, i, j] <= 3
+                           for d1 in range(len(demands))
+                           for d2 in range(len(demands)) if d1 != d2
+                           for i, j in edges
+                           for s in range(S)),
+                          names="demands do not overlap slots")
+
+        m.add_constraints(x[d,S] == 0 for d in range(len(demands)))
+
+        m.add_constraints((m.sum_vars(x[d, s2] for s2 in range(s - v + 1, s + 1)) >=
+                           v*(x[d, s] - x[d, s+1])
+                           for d, (_, _, v) in enumerate(demands)
+                           for s in range(v-1, S)),
+                          names="slots are contiguous")
+
+        m.add_constraints((m.sum_vars(x[d,s] for s in range(0, S)) == v for d, (_, _, v) in enumerate(demands)),
+                          names="slots accumulate to demand")
+
+        m.set_objective("min", m.sum_vars(y.values()))
         
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, x))
+
+        if self._hook.occupied is not None:
+            forbid_occupied(m, x, y, self._hook.occupied, S)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (y, arcs(start)),
+                    (x, slots(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -140,32 +164,35 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._demands: list[tuple[int, set[int], int]]
         self._y: dict
         self._x: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: list[int]
+        self._pool: CutPool = None
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
     
     def __call__(self):
-        sol = self.make_complete_solution() 
-        
-        y = sol.get_value_dict(self._y)
-        x = sol.get_value_dict(self._x)
+        # y_de values, demand by demand with the edges numbered as in out_arcs
+        values = self.get_values(self._columns)
+        E = len(values) // len(self._demands)
 
-        res = to_res(y, x, len(self._graph), self._demands, self._S)
-        new_constraints = []
         for di, d in enumerate(self._demands):
-            reached = set(dfs(res[di][0], d[0]))
+            y = values[di*E:(di+1)*E]
+            reached = reach(self._out, y, d[0])
             T = d[1]
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
                 outgoing_edges = set()
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges.add(self._y[di, r, outgoing])
+                            outgoing_edges.add(k)
+                # only unsatisfied cuts are added
+                if sum(y[k] for k in outgoing_edges) >= 1 - 1e-6:
+                    continue
+                if self._pool is not None:
+                    self._pool.add(di, reached)
                 if self._export:
                     print(f"Demand {di} not reaching some terminals: reached={reached}, diff={t_diff}")
-                new_constraints.append(sum(outgoing_edges) >= 1)
-
-        unsats = self.get_cpx_unsatisfied_cts(new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
\ No newline at end of file
+                ind = sorted(set(self._columns[di*E + k] for k in outgoing_edges))
+                self.add(constraint=[ind, [1.0] * len(ind)], sense="G", rhs=1.0)
@@ -1,9 +1,16 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import dfs, out_arcs, reach_arcs
+from collections import defaultdict
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, arc_slots, ends, starts
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import fix_occupied
+from solvers.symmetry import break_symmetry, weighted_slots
+from solvers.matrix import Rows, columns
+import numpy as np
 
 """
 dsl_asb_c is a single family variable constraints system which adds a cut based approach to guarantee the demands arborescense.
@@ -29,7 +36,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -45,11 +52,14 @@ class Solver():
         for u, outgoing in enumerate(iterable=self._graph):
             for v in outgoing:
                 edges.append((u, v))
-        u = m.binary_var_dict(keys=[
+        u_keys = [
             (d, i, j, s)
             for d in range(len(demands))
             for i, j in edges
-            for s in range(S+1)], name="u")
+            for s in range(S+1)]
+        if self._hook.reduce:
+            u_keys = kept(u_keys, graph, demands, routes=self._hook.routes)
+        u = Reduced(m, m.binary_var_dict(keys=u_keys, name="u"))
         
         l = m.binary_var_dict(keys=[
             (d, s)
@@ -66,69 +76,48 @@ class Solver():
         )
 
         # cut based constraints
-        for d in range(len(demands)):
-            i = demands[d][0]
-            v = demands[d][2]
-            T = demands[d][1]
-            m.add_constraint(sum([u[d, i, j, s]
-                                  for j in graph[i]
-                                  for s in range(S)]) >= v, ctname="initial cut based constraint")
+        m.add_constraints((m.sum_vars(u[d, i, j, s]
+                                      for j in graph[i]
+                                      for s in range(S)) >= v
+                           for d, (i, _, v) in enumerate(demands)),
+                          names="initial cut based constraint")
 
         cb = m.register_callback(DOLazyCallback)
         cb._u = u
         cb._S = S
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = np.array([u[d, i, j, s].index
+                                for d in range(len(demands))
+                                for i, j in edges
+                                for s in range(S+1)]).reshape(len(demands), len(edges), S+1)
+        cb._columns_list = cb._columns.ravel().tolist()
 
         # slot constraints
-        for e, s in [(e, s)
-                     for e in edges
-                     for s in range(S)]:
-            m.add_constraint(sum([u[d, e[0], e[1], s] for d in range(
-                len(demands))]) <= 1, ctname="demands do not overlap")
-
-        for e in edges:
-            m.add_constraint(sum([u[d, e[0], e[1], S] for d in range(
-                len(demands))]) == 0, ctname="u_deS is 0 for all d,e")
-
-        for d, e1, e2, s in [(d, e1, e2, s)
-                             for d in range(len(demands))
-                             for n in range(len(graph))
-                             for e1 in edges if e1[0] == n or e1[1] == n
-                             for e2 in edges if e2[1] == n or e2[1] == n and e1 != e2
-                             for s in range(S)]:
-            v = demands[d][2]
-            m.add_constraint(sum([u[d, e1[0], e1[1], s2] for s2 in range(S)]) <= v*(1-u[d, e2[0], e2[1], s]+u[d, e1[0], e1[1], s]),
-                             ctname="node edges slots must match")
-
-        for d, e, s in [(d, e, s)
-                        for d in range(len(demands))
-                        for e in edges
-                        for s in range(S)]:
-            v = demands[d][2]
-            i,j = e[0], e[1]
-            m.add_constraint(v*u[d,i,j,s] <= sum([u[d,i,j,s2] for s2 in range(S)]), ctname="demand is satisfied")
-
-        for d in range(len(demands)):
-            v = demands[d][2]
-            m.add_constraint(sum([s*(r[d,s] - l[d,s]) for s in range(S+1)]) == v, ctname="right minus left should be v")
-
-        for d in range(len(demands)):
-            m.add_constraint(sum([l[d,s] for s in range(S+1)]) == 1, ctname = "only one l should be set")
-            m.add_constraint(sum([r[d,s] for s in range(S+1)]) == 1, ctname = "only one r should be set")
-
-        for d, e, s in [(d, e, s)
-                        for d in range(len(demands))
-                        for e in edges
-                        for s in range(S+1)]:
-            i,j = e[0], e[1]
-            m.add_constraint(u[d,i,j,s] <= sum([l[d,s2] for s2 in range(s+1)]), ctname="all u_des lower than selected l_ds should be 0")
-            m.add_constraint(u[d,i,j,s] <= sum([r[d,s2] for s2 in range(s+1, S+1)]), ctname="all u_des higher than selected r_ds should be 0")
-
-        m.set_objective("min", sum([u[d, e[0], e[1], s]/demands[d][2]
-                                    for d in range(len(demands))
-                                    for e in edges
-                                    for s in range(S)]))
+        if self._hook.matrix:
+            matrix_constraints(m, graph, edges, demands, S, u, l, r)
+        else:
+            model_constraints(m, graph, edges, demands, S, u, l, r)
+
+        m.set_objective("min", m.sum(u[d, e[0], e[1], s]/demands[d][2]
+                                     for d in range(len(demands))
+                                     for e in edges
+                                     for s in range(S)))
+
+        if self._hook.symmetry:
+            break_symmetry(m, demands, weighted_slots(m, l))
+
+        if self._hook.occupied is not None:
+            fix_occupied(m, u, self._hook.occupied)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (u, arc_slots(start)),
+                    (l, starts(start)),
+                    (r, ends(start))])
 
         self._hook.hook_before_solve(m)
         solution = m.solve()
@@ -146,6 +135,106 @@ class Solver():
         return self._name
 
 
+def model_constraints(m: Model, graph, edges, demands, S, u, l, r):
+    m.add_constraints((m.sum_vars(u[d, e[0], e[1], s] for d in range(len(demands))) <= 1
+                       for e in edges
+                       for s in range(S)),
+                      names="demands do not overlap")
+
+    m.add_constraints((m.sum_vars(u[d, e[0], e[1], S] for d in range(len(demands))) == 0
+                       for e in edges),
+                      names="u_deS is 0 for all d,e")
+
+    m.add_constraints((m.sum_vars(u[d, e1[0], e1[1], s2] for s2 in range(S)) <=
+                       demands[d][2]*(1-u[d, e2[0], e2[1], s]+u[d, e1[0], e1[1], s])
+                       for d in range(len(demands))
+                       for n in range(len(graph))
+                       for e1 in edges if e1[0] == n or e1[1] == n
+                       for e2 in edges if e2[1] == n or e2[1] == n and e1 != e2
+                       for s in range(S)),
+                      names="node edges slots must match")
+
+    m.add_constraints((demands[d][2]*u[d,i,j,s] <= m.sum_vars(u[d,i,j,s2] for s2 in range(S))
+                       for d in range(len(demands))
+                       for i, j in edges
+                       for s in range(S)),
+                      names="demand is satisfied")
+
+    m.add_constraints((m.sum(s*(r[d,s] - l[d,s]) for s in range(S+1)) == v for d, (_, _, v) in enumerate(demands)),
+                      names="right minus left should be v")
+
+    m.add_constraints((m.sum_vars(l[d,s] for s in range(S+1)) == 1 for d in range(len(demands))),
+                      names="only one l should be set")
+    m.add_constraints((m.sum_vars(r[d,s] for s in range(S+1)) == 1 for d in range(len(demands))),
+                      names="only one r should be set")
+
+    m.add_constraints((u[d,i,j,s] <= m.sum_vars(l[d,s2] for s2 in range(s+1))
+                       for d in range(len(demands))
+                       for i, j in edges
+                       for s in range(S+1)),
+                      names="all u_des lower than selected l_ds should be 0")
+    m.add_constraints((u[d,i,j,s] <= m.sum_vars(r[d,s2] for s2 in range(s+1, S+1))
+                       for d in range(len(demands))
+                       for i, j in edges
+                       for s in range(S+1)),
+                      names="all u_des higher than selected r_ds should be 0")
+
+def matrix_constraints(m: Model, graph, edges, demands, S, u, l, r):
+    D, E = len(demands), len(edges)
+    v = np.array([d[2] for d in demands])
+    U = columns(m, u, [(d, i, j, s) for d in range(D) for i, j in edges for s in range(S+1)], (D, E, S+1))
+    L = columns(m, l, [(d, s) for d in range(D) for s in range(S+1)], (D, S+1))
+    R = columns(m, r, [(d, s) for d in range(D) for s in range(S+1)], (D, S+1))
+    rows = Rows(m)
+
+    # demands do not overlap, rows (e, s)
+    rows.add(U[:, :, :S].transpose(1, 2, 0), 1, "L", 1, name="demands do not overlap")
+    rows.add(U[:, :, S].T, 1, "E", 0, name="u_deS is 0 for all d,e")
+
+    # node edges slots must match, rows (d, (e1, e2), s) for e1 touching n and e2 entering n
+    tail = np.array([i for i, _ in edges])
+    head = np.array([j for _, j in edges])
+    pairs = [(e1, e2)
+             for n in range(len(graph))
+             for e1 in np.flatnonzero((tail == n) | (head == n))
+             for e2 in np.flatnonzero(head == n)]
+    e1, e2 = np.array(pairs, dtype=np.int64).reshape(-1, 2).T
+    shape = (D, len(e1), S)
+    cols = np.concatenate([
+        np.broadcast_to(U[:, e1, None, :S], shape + (S,)),
+        U[:, e2, :S, None],
+        U[:, e1, :S, None]], axis=3)
+    vals = np.concatenate([
+        np.ones((D, S)),
+        v[:, None],
+        -v[:, None]], axis=1)[:, None, None, :]
+    rows.add(cols, vals, "L", v[:, None, None], name="node edges slots must match")
+
+    # demand is satisfied, rows (d, e, s)
+    cols = np.concatenate([
+        U[:, :, :S, None],
+        np.broadcast_to(U[:, :, None, :S], (D, E, S, S))], axis=3)
+    vals = np.concatenate([
+        v[:, None],
+        -np.ones((D, S))], axis=1)[:, None, None, :]
+    rows.add(cols, vals, "L", 0, name="demand is satisfied")
+
+    slots = np.arange(S+1)
+    rows.add(np.concatenate([R, L], axis=1), np.concatenate([slots, -slots]), "E", v, name="right minus left should be v")
+    rows.add(L, 1, "E", 1, name="only one l should be set")
+    rows.add(R, 1, "E", 1, name="only one r should be set")
+
+    # u_des <= sum of l_ds2 for s2 <= s and u_des <= sum of r_ds2 for s2 > s, rows (d, e, s)
+    for X, selected, ctname in [
+            (L, slots[None, :] <= slots[:, None], "all u_des lower than selected l_ds should be 0"),
+            (R, slots[None, :] > slots[:, None], "all u_des higher than selected r_ds should be 0")]:
+        cols = np.concatenate([
+            U[:, :, :, None],
+            np.broadcast_to(X[:, None, None, :], (D, E, S+1, S+1))], axis=3)
+        vals = np.concatenate([np.ones((S+1, 1)), -selected.astype(np.float64)], axis=1)
+        rows.add(cols, vals, "L", 0, name=ctname)
+
+
 def to_res(u, n, demands, S) -> list[tuple[T_graph, tuple[int, int]]]:
 
     slot_assignations = [(int(S), int(S)) for _ in range(len(demands))]
@@ -177,21 +266,6 @@ def to_res(u, n, demands, S) -> list[tuple[T_graph, tuple[int, int]]]:
     return res
 
 
-def to_graph(u, n, d_filter, s_filter) -> T_graph:
-
-    demand_graph = [[] for _ in range(n)]
-    for d, i, j, s in u:
-        if d != d_filter:
-            continue
-        if s_filter != None and s_filter != s:
-            continue
-        if abs(u[d, i, j, s] - 1) < 0.001:
-            if j not in demand_graph[i]:
-                demand_graph[i].append(j)
-
-    return demand_graph
-
-
 class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
 
 
@@ -201,46 +275,49 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._S: int
         self._demands: list[tuple[int, set[int], int]]
         self._u: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: np.ndarray
+        self._columns_list: list[int]
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
 
     def __call__(self):
-        sol = self.make_complete_solution()
+        # u_des values as a (demand, edge, slot) array, edges numbered as in out_arcs
+        cols = self._columns
+        u = np.asarray(self.get_values(self._columns_list)).reshape(cols.shape)
 
-        u = sol.get_value_dict(self._u)
-
-        new_constraints = []
-        for d, s in [(d, s)
-                     for d in range(len(self._demands))
-                     for s in range(self._S)]:
+        # set u_des are bucketed by (d, s) in a single pass, the (d, s) pairs without any
+        # edge set can not violate a cut
+        used = defaultdict(set)
+        for d, k, s in zip(*np.nonzero(u[:, :, :self._S] > 0.999)):
+            used[d, s].add(k)
 
+        for (d, s), arcs in used.items():
             demand = self._demands[d]
-
-            res = to_graph(u, len(self._graph), d, s)
-            reached = set(dfs(res, demand[0]))
+            reached = reach_arcs(self._out, arcs, demand[0])
             T = demand[1]
 
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
-                outgoing_edges = set()
-                inside_edges = set()
+                outgoing_edges = {}
+                inside_edges = {}
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges |= set([self._u[d, r, outgoing, s]])
+                            outgoing_edges[cols[d, k, s]] = u[d, k, s]
                         else:
-                            inside_edges |= set([self._u[d, r, outgoing, s]])
+                            inside_edges[cols[d, k, s]] = u[d, k, s]
 
-                lsum = sum(outgoing_edges)
-                rsum = sum(inside_edges)
-                new_constraints.append(lsum*len(inside_edges) >= rsum)
+                # lsum*len(inside_edges) >= rsum, only unsatisfied cuts are added
+                n = len(inside_edges)
+                if n*sum(outgoing_edges.values()) - sum(inside_edges.values()) >= -1e-6:
+                    continue
 
                 if self._export:
                     print(
                         f"demand:{d} slot:{s} not reaching some terminals: reached={reached}, diff={t_diff}")
 
-        unsats = self.get_cpx_unsatisfied_cts(
-            new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
+                ind = [int(c) for c in outgoing_edges] + [int(c) for c in inside_edges]
+                val = [float(n)] * len(outgoing_edges) + [-1.0] * n
+                self.add(constraint=[ind, val], sense="G", rhs=0.0)
@@ -1,9 +1,15 @@
 from docplex.mp.model import Model
 from cplex.callbacks import LazyConstraintCallback
 from docplex.mp.callbacks.cb_mixin import *
-from graph import dfs
+from graph import dfs, out_arcs, reach_arcs
+from collections import defaultdict
 import math
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+import numpy as np
+from solvers.heuristic import initial_solution, add_mip_start, arc_slots
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import fix_occupied
+from solvers.symmetry import break_symmetry, weighted_slots
 
 """
 dsl_bf_c is a single family variable constraints system which adds a cut based approach to guarantee the demands arborescense.
@@ -29,7 +35,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -45,69 +51,83 @@ class Solver():
         for u, outgoing in enumerate(iterable=self._graph):
             for v in outgoing:
                 edges.append((u, v))
-        u = m.binary_var_dict(keys=[
+        u_keys = [
             (d, i, j, s) 
             for d in range(len(demands)) 
             for i, j in edges
-            for s in range(S+1)], name="u")
+            for s in range(S+1)]
+        if self._hook.reduce:
+            u_keys = kept(u_keys, graph, demands, routes=self._hook.routes)
+        u = Reduced(m, m.binary_var_dict(keys=u_keys, name="u"))
 
         # cut based constraints
-        for d in range(len(demands)):
-            i = demands[d][0]
-            v = demands[d][2]
-            T = demands[d][1]
-            m.add_constraint(sum([u[d, i, j, s] 
-                                  for j in graph[i]
-                                  for s in range(S)]) >= v, ctname="initial cut based constraint")
+        m.add_constraints((m.sum_vars(u[d, i, j, s]
+                                      for j in graph[i]
+                                      for s in range(S)) >= v
+                           for d, (i, _, v) in enumerate(demands)),
+                          names="initial cut based constraint")
 
         cb = m.register_callback(DOLazyCallback)
         cb._u = u
         cb._S = S
         cb._graph = graph
         cb._demands = demands
+        cb._out = out_arcs(graph)
+        cb._columns = np.array([u[d, i, j, s].index
+                                for d in range(len(demands))
+                                for i, j in edges
+                                for s in range(S+1)]).reshape(len(demands), len(edges), S+1)
+        cb._columns_list = cb._columns.ravel().tolist()
 
         # slot constraints
-        for e, s in [(e, s)
-                      for e in edges
-                      for s in range(S)]:
-              m.add_constraint(sum([u[d,e[0],e[1],s] for d in range(len(demands))]) <= 1, ctname="demands do not overlap")
-
-        for e in edges:
-             m.add_constraint(sum([u[d,e[0],e[1],S] for d in range(len(demands))]) == 0, ctname="u_deS is 0 for all d,e")
+        m.add_constraints((m.sum_vars(u[d, e[0], e[1], s] for d in range(len(demands))) <= 1
+                           for e in edges
+                           for s in range(S)),
+                          names="demands do not overlap")
+
+        m.add_constraints((m.sum_vars(u[d, e[0], e[1], S] for d in range(len(demands))) == 0
+                           for e in edges),
+                          names="u_deS is 0 for all d,e")
         
-        for d,e1,e2,s in [(d,e1,e2,s)
-                    for d in range(len(demands))
-                    for n in range(len(graph))
-                    for e1 in edges if e1[0] == n or e1[1] == n
-                    for e2 in edges if e2[1] == n or e2[1] == n and e1 != e2
-                    for s in range(S)]:
-            v = demands[d][2]
-            m.add_constraint(sum([u[d,e1[0],e1[1],s2] for s2 in range(S)]) <= v*(1-u[d,e2[0],e2[1],s]+u[d,e1[0],e1[1],s]), 
-                             ctname="node edges slots must match")
-
-        for d, e, s in [(d, e, s)
-                         for d in range(len(demands))
-                         for e in edges
-                         for s in range(demands[d][2]-1, S)]:
-             v: int = demands[d][2]
-             lsum = sum([u[d,e[0],e[1],s2] for s2 in range(s-v+1, s+1)])
-             m.add_constraint(lsum >= v*(u[d,e[0],e[1],s] - u[d,e[0],e[1],s+1]),
-                                   ctname=f"slots are contiguous and demand satisfied from {s-v+1}, s {s}")
-            
-        for d, e, s in [(d, e, s)
-                        for d in range(len(demands))
-                        for e in edges
-                        for s in range(0, demands[d][2])]:
-            v: int = demands[d][2]
-            lsum = sum([u[d,e[0],e[1],s2] for s2 in range(0, v)])
-            m.add_constraint(lsum >= v*(u[d,e[0],e[1],s] - u[d,e[0],e[1],s+1]),
-                                  ctname=f"base slots are contiguous and demand satisfied from {0}, s {s}")
-
-        m.set_objective("min", sum([u[d,e[0],e[1],s]/demands[d][2]
-                                    for d in range(len(demands))
-                                    for e in edges
-                                    for s in range(S)]))
+        m.add_constraints((m.sum_vars(u[d, e1[0], e1[1], s2] for s2 in range(S)) <=
+                           demands[d][2]*(1-u[d, e2[0], e2[1], s]+u[d, e1[0], e1[1], s])
+                           for d in range(len(demands))
+                           for n in range(len(graph))
+                           for e1 in edges if e1[0] == n or e1[1] == n
+                           for e2 in edges if e2[1] == n or e2[1] == n and e1 != e2
+                           for s in range(S)),
+                          names="node edges slots must match")
+
+        m.add_constraints((m.sum_vars(u[d,e[0],e[1],s2] for s2 in range(s-v+1, s+1)) >= v*(u[d,e[0],e[1],s] - u[d,e[0],e[1],s+1])
+                           for d, (_, _, v) in enumerate(demands)
+                           for e in edges
+                           for s in range(v-1, S)),
+                          names="slots are contiguous and demand satisfied")
+
+        m.add_constraints((m.sum_vars(u[d,e[0],e[1],s2] for s2 in range(0, v)) >= v*(u[d,e[0],e[1],s] - u[d,e[0],e[1],s+1])
+                           for d, (_, _, v) in enumerate(demands)
+                           for e in edges
+                           for s in range(0, v)),
+                          names="base slots are contiguous and demand satisfied")
+
+        m.set_objective("min", m.sum(u[d, e[0], e[1], s]/demands[d][2]
+                                     for d in range(len(demands))
+                                     for e in edges
+                                     for s in range(S)))
         
+        if self._hook.symmetry:
+            # the allocation of d is weighted on the arcs entering its lowest terminal
+            break_symmetry(m, demands, weighted_slots(m, u, lambda k: k[2] == min(demands[k[0]][1])))
+
+        if self._hook.occupied is not None:
+            fix_occupied(m, u, self._hook.occupied)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (u, arc_slots(start))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -155,20 +175,6 @@ def to_res(u, n, demands, S) -> list[tuple[T_graph, tuple[int, int]]]:
         res.append((demand_graphs[i], slot_assignations[i]))
     return res
 
-def to_graph(u, n, d_filter, s_filter) -> T_graph:
-    
-    demand_graph = [[] for _ in range(n)]
-    for d, i, j, s in u:
-        if d != d_filter:
-            continue
-        if s_filter != None and s_filter != s:
-            continue
-        if abs(u[d, i, j, s] - 1) < 0.001:
-            if j not in demand_graph[i]:
-                demand_graph[i].append(j)
-
-    return demand_graph
-
 class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
     
 
@@ -178,45 +184,49 @@ class DOLazyCallback(ConstraintCallbackMixin, LazyConstraintCallback):
         self._S: int
         self._demands: list[tuple[int, set[int], int]]
         self._u: dict
+        self._out: list[list[tuple[int, int]]]
+        self._columns: np.ndarray
+        self._columns_list: list[int]
         self._export: bool = False
         LazyConstraintCallback.__init__(self, env)
         ConstraintCallbackMixin.__init__(self)
     
     def __call__(self):
-        sol = self.make_complete_solution() 
-        
-        u = sol.get_value_dict(self._u)
+        # u_des values as a (demand, edge, slot) array, edges numbered as in out_arcs
+        cols = self._columns
+        u = np.asarray(self.get_values(self._columns_list)).reshape(cols.shape)
 
-        
-        new_constraints = []
-        for d, s in [(d, s) 
-                     for d in range(len(self._demands))
-                     for s in range(self._S)]:
-            
-            demand = self._demands[d]
+        # set u_des are bucketed by (d, s) in a single pass, the (d, s) pairs without any
+        # edge set can not violate a cut
+        used = defaultdict(set)
+        for d, k, s in zip(*np.nonzero(u[:, :, :self._S] > 0.999)):
+            used[d, s].add(k)
 
-            res = to_graph(u, len(self._graph), d, s)
-            reached = set(dfs(res, demand[0]))
+        for (d, s), arcs in used.items():
+            demand = self._demands[d]
+            reached = reach_arcs(self._out, arcs, demand[0])
             T = demand[1]
 
             t_diff = T.difference(reached)
             if len(t_diff) > 0:
-                outgoing_edges = set()
-                inside_edges = set()
+                outgoing_edges = {}
+                inside_edges = {}
                 for r in reached:
-                    for outgoing in self._graph[r]:
+                    for k, outgoing in self._out[r]:
                         if outgoing not in reached:
-                            outgoing_edges |= set([self._u[d, r, outgoing, s]])
+                            outgoing_edges[cols[d, k, s]] = u[d, k, s]
                         else:
-                            inside_edges |= set([self._u[d, r, outgoing, s]])
+                            inside_edges[cols[d, k, s]] = u[d, k, s]
 
-                lsum = sum(outgoing_edges)
-                rsum = sum(inside_edges)
-                new_constraints.append(lsum*len(inside_edges) >= rsum)
+                # lsum*len(inside_edges) >= rsum, only unsatisfied cuts are added
+                n = len(inside_edges)
+                if n*sum(outgoing_edges.values()) - sum(inside_edges.values()) >= -1e-6:
+                    continue
 
                 if self._export:
-                    print(f"demand:{d} slot:{s} not reaching some terminals: reached={reached}, diff={t_diff}")
+                    print(
+                        f"demand:{d} slot:{s} not reaching some terminals: reached={reached}, diff={t_diff}")
 
-        unsats = self.get_cpx_unsatisfied_cts(new_constraints, sol, tolerance=1e-6)
-        for _, cpx_lhs, sense, cpx_rhs in unsats:
-            self.add(cpx_lhs, sense, cpx_rhs)
\ No newline at end of file
+                ind = [int(c) for c in outgoing_edges] + [int(c) for c in inside_edges]
+                val = [float(n)] * len(outgoing_edges) + [-1.0] * n
+                self.add(constraint=[ind, val], sense="G", rhs=0.0)
@@ -1,6 +1,12 @@
 from docplex.mp.model import Model
-from graph import dfs
+from graph import dfs, incidence
 from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import initial_solution, add_mip_start, path_slots
+from solvers.reduction import kept, Reduced
+from solvers.occupancy import fix_occupied
+from solvers.symmetry import break_symmetry, weighted_slots
+from solvers.matrix import Rows, columns, node_arcs
+import numpy as np
 
 """
 dsl_bf_m
@@ -28,7 +34,7 @@ class Solver():
         self._hook = hook
 
     def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
-        with Model(name=self._name) as m:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
             return self._solve(m)
 
     @solve_hook
@@ -44,109 +50,35 @@ class Solver():
                 edges.append((u, v))
 
         # U_dets variables
-        u = m.binary_var_dict(keys=[(d, i, j, t, s) 
-                                    for d in range(len(demands)) 
-                                    for i, j in edges
-                                    for t in demands[d][1]
-                                    for s in range(0, S+1)], name="u")
-        # flow constraints
-        for d, _ in enumerate(demands):
-            s = demands[d][0]
-            T = demands[d][1]
-            v = demands[d][2]
-            for j, _ in enumerate(graph):
-                for t in T:
-                    outgoing_sl = dict([(i, []) for i in range(0, S+1)])
-                    incoming_sl = dict([(i, []) for i in range(0, S+1)])
-                    for d2, i2, j2, t2, sl in u:
-                        if d != d2 or t != t2:
-                            continue
-                        if i2 == j:
-                            outgoing_sl[sl].append(u[d2,i2,j2,t2,sl])
-                        if j2 == j:
-                            incoming_sl[sl].append(u[d2,i2,j2,t2,sl])
-                    if j == s:
-                        m.add_constraint(sum(sum(incoming_sl.values(), [])) - sum(sum(outgoing_sl.values(), [])) == -v, ctname="source has v outgoing")
-                    elif j == t:
-                        m.add_constraint(sum(sum(incoming_sl.values(), [])) - sum(sum(outgoing_sl.values(), [])) == v, ctname="terminal has v incoming")
-                    else:
-                        for sl in range(0, S):
-                            m.add_constraint(ct=sum(incoming_sl[sl]) - sum(outgoing_sl[sl]) == 0, ctname="same incoming as outgoing for non source/terminal")
-
-        # demands do not overlap sots
-        for d, d2, e, t, t2, sl in [(d, d2, e, t, t2, sl)
-                                    for d in range(len(demands))
-                                    for d2 in range(len(demands)) if d != d2
-                                    for e in edges
-                                    for t in demands[d][1]
-                                    for t2 in demands[d2][1]
-                                    for sl in range(0, S)]:
-            m.add_constraint(u[d,e[0],e[1],t,sl] + u[d2,e[0],e[1],t2,sl] <= 1,
-                             ctname="demands do not overlap slots")
-        
-        for d, i, j, t in [(d, i, j, t)
-                           for d in range(len(demands))
-                           for i, j in edges
-                           for t in demands[d][1]]:
-            m.add_constraint(u[d, i, j, t, S] == 0, ctname="s+1 is set to zero")
-
-        for d, e, t, sl in [(d, e, t, sl)
-                           for d in range(len(demands))
-                           for e in edges
-                           for t in demands[d][1]
-                           for sl in range(demands[d][2]-1, S)]:
-            v = demands[d][2]
-            i = e[0]
-            j = e[1]
-            m.add_constraint(
-                sum(u[d,i,j,t,sl2] for sl2 in range(sl-v+1, sl+1)) >= 
-                v*(u[d,i,j,t,sl] - u[d,i,j,t,sl+1]),
-                ctname="slots are contiguous")
-            
-        for d, e, t, sl in [(d, e, t, sl)
-                    for d in range(len(demands))
-                    for e in edges
-                    for t in demands[d][1]
-                    for sl in range(0, demands[d][2])]:
-            v = demands[d][2]
-            i = e[0]
-            j = e[1]
-            m.add_constraint(
-                sum(u[d,i,j,t,sl2] for sl2 in range(0, v)) >= 
-                v*(u[d,i,j,t,sl] - u[d,i,j,t,sl+1]),
-                ctname="base slots are contiguous")
-
-
-        for d, e, e2, t, t2, sl in [(d, e, e2, t, t2, sl)
-                           for d in range(len(demands))
-                           for e in edges if e[0] == demands[d][0] or e[1] == demands[d][0]
-                           for e2 in edges if e2[0] == demands[d][0] or e2[1] == demands[d][0]
-                           for t in demands[d][1]
-                           for t2 in demands[d][1] if t != t2
-                           for sl in range(0, S)]:
-            v = demands[d][2]
-            m.add_constraint(
-                sum(u[d,e[0],e[1],t,sl2] for sl2 in range(0, S)) <= 
-                v*(1 - u[d,e2[0],e2[1],t2,sl] + u[d,e[0],e[1],t,sl]),
-                ctname="demand/terminal pair path use the same slots")
-            
-        # for d, e, e2, t, t2, sl in [(d, e, e2, t, t2, sl)
-        #                    for d in range(len(demands))
-        #                    for e in edges
-        #                    for e2 in edges
-        #                    for t in demands[d][1]
-        #                    for t2 in demands[d][1] if t != t2
-        #                    for sl in range(0, S)]:
-        #     v = demands[d][2]
-        #     m.add_constraint(
-        #         sum(u[d,e[0],e[1],t,sl2] for sl2 in range(0, S)) <= 
-        #         v*(1 - u[d,e2[0],e2[1],t2,sl] + u[d,e[0],e[1],t,sl]),
-        #         ctname="demand/terminal pair path use the same slots")
-            
-        m.set_objective("min",
-                        sum([u[d, i, j, t, sl]/(demands[d][2]*len(demands[d][1]))
-                             for d, i, j, t, sl in u]))
+        u_keys = [(d, i, j, t, s) 
+                  for d in range(len(demands)) 
+                  for i, j in edges
+                  for t in demands[d][1]
+                  for s in range(0, S+1)]
+        if self._hook.reduce:
+            u_keys = kept(u_keys, graph, demands, terminal=3, routes=self._hook.routes)
+        u = Reduced(m, m.binary_var_dict(keys=u_keys, name="u"))
+        if self._hook.matrix:
+            matrix_constraints(m, graph, edges, demands, S, u)
+        else:
+            model_constraints(m, graph, edges, demands, S, u)
+
+        m.set_objective("min", m.sum(u[d, i, j, t, sl]/(demands[d][2]*len(demands[d][1]))
+                                     for d, i, j, t, sl in u))
         
+        if self._hook.symmetry:
+            # the allocation of d is weighted on the arcs entering its lowest terminal
+            break_symmetry(m, demands, weighted_slots(m, u, lambda k: k[2] == k[3] == min(demands[k[0]][1])))
+
+        if self._hook.occupied is not None:
+            fix_occupied(m, u, self._hook.occupied)
+
+        if self._hook.mip_start:
+            start = initial_solution(self._hook, graph, S, demands)
+            if start is not None:
+                add_mip_start(m, [
+                    (u, path_slots(start, demands))])
+
         self._hook.hook_before_solve(m)
         solution = m.solve()
 
@@ -165,6 +97,151 @@ class Solver():
     def name(self):
         return self._name
 
+def model_constraints(m: Model, graph, edges, demands, S, u):
+    # flow constraints
+    u_out, u_in = incidence(u, arc=1)
+    # source has v outgoing and terminal has v incoming over the whole spectrum
+    m.add_constraints((
+        m.sum_vars(u[k] for sl in range(0, S+1) for k in u_in[d, t, sl, j]) -
+        m.sum_vars(u[k] for sl in range(0, S+1) for k in u_out[d, t, sl, j]) == (-v if j == s else v)
+        for d, (s, T, v) in enumerate(demands)
+        for t in T
+        for j in (s, t)),
+        names="source has v outgoing, terminal has v incoming")
+
+    m.add_constraints((
+        m.sum_vars(u[k] for k in u_in[d, t, sl, j]) - m.sum_vars(u[k] for k in u_out[d, t, sl, j]) == 0
+        for d, (s, T, _) in enumerate(demands)
+        for t in T
+        for j in range(len(graph)) if j != s and j != t
+        for sl in range(0, S)),
+        names="same incoming as outgoing for non source/terminal")
+
+    # demands do not overlap sots
+    m.add_constraints((u[d,e[0],e[1],t,sl] + u[d2,e[0],e[1],t2,sl] <= 1
+                       for d in range(len(demands))
+                       for d2 in range(len(demands)) if d != d2
+                       for e in edges
+                       for t in demands[d][1]
+                       for t2 in demands[d2][1]
+                       for sl in range(0, S)),
+                      names="demands do not overlap slots")
+
+    m.add_constraints((u[d, i, j, t, S] == 0
+                       for d in range(len(demands))
+                       for i, j in edges
+                       for t in demands[d][1]),
+                      names="s+1 is set to zero")
+
+    m.add_constraints((m.sum_vars(u[d,i,j,t,sl2] for sl2 in range(sl-v+1, sl+1)) >=
+                       v*(u[d,i,j,t,sl] - u[d,i,j,t,sl+1])
+                       for d, (_, T, v) in enumerate(demands)
+                       for i, j in edges
+                       for t in T
+                       for sl in range(v-1, S)),
+                      names="slots are contiguous")
+
+    m.add_constraints((m.sum_vars(u[d,i,j,t,sl2] for sl2 in range(0, v)) >=
+                       v*(u[d,i,j,t,sl] - u[d,i,j,t,sl+1])
+                       for d, (_, T, v) in enumerate(demands)
+                       for i, j in edges
+                       for t in T
+                       for sl in range(0, v)),
+                      names="base slots are contiguous")
+
+
+    m.add_constraints((m.sum_vars(u[d,e[0],e[1],t,sl2] for sl2 in range(0, S)) <=
+                       demands[d][2]*(1 - u[d,e2[0],e2[1],t2,sl] + u[d,e[0],e[1],t,sl])
+                       for d in range(len(demands))
+                       for e in edges if e[0] == demands[d][0] or e[1] == demands[d][0]
+                       for e2 in edges if e2[0] == demands[d][0] or e2[1] == demands[d][0]
+                       for t in demands[d][1]
+                       for t2 in demands[d][1] if t != t2
+                       for sl in range(0, S)),
+                      names="demand/terminal pair path use the same slots")
+
+    # for d, e, e2, t, t2, sl in [(d, e, e2, t, t2, sl)
+    #                    for d in range(len(demands))
+    #                    for e in edges
+    #                    for e2 in edges
+    #                    for t in demands[d][1]
+    #                    for t2 in demands[d][1] if t != t2
+    #                    for sl in range(0, S)]:
+    #     v = demands[d][2]
+    #     m.add_constraint(
+    #         sum(u[d,e[0],e[1],t,sl2] for sl2 in range(0, S)) <= 
+    #         v*(1 - u[d,e2[0],e2[1],t2,sl] + u[d,e[0],e[1],t,sl]),
+    #         ctname="demand/terminal pair path use the same slots")
+
+def matrix_constraints(m: Model, graph, edges, demands, S, u):
+    E = len(edges)
+    tail = np.array([i for i, _ in edges])
+    head = np.array([j for _, j in edges])
+    arcs, coefs = node_arcs(edges, len(graph))
+    rows = Rows(m)
+
+    # U[d] holds the columns of u_d, (e, t, s) with t in the order of terminals[d]
+    terminals = [list(T) for _, T, _ in demands]
+    U = [columns(m, u, [(d, i, j, t, s) for i, j in edges for t in terminals[d] for s in range(S+1)],
+                 (E, len(terminals[d]), S+1))
+         for d in range(len(demands))]
+
+    for d, (s, _, v) in enumerate(demands):
+        Ud, T = U[d], np.array(terminals[d])
+        t_idx = np.arange(len(T))
+
+        # flow constraints, rows (t, j) for j in (s, t) over the whole spectrum
+        js = np.stack([np.full(len(T), s), T], axis=1)
+        cols = Ud[arcs[js], t_idx[:, None, None], :]
+        vals = np.broadcast_to(coefs[js][..., None], cols.shape)
+        rows.add(cols.reshape(len(T), 2, -1), vals.reshape(len(T), 2, -1), "E", [-v, v],
+                 name="source has v outgoing, terminal has v incoming")
+
+        # rows (j, sl) for every j other than s and t
+        for ti, t in enumerate(T):
+            js = np.array([j for j in range(len(graph)) if j != s and j != t], dtype=np.int64)
+            cols = Ud[arcs[js], ti, :S].transpose(0, 2, 1)
+            rows.add(cols, coefs[js][:, None, :], "E", 0,
+                     name="same incoming as outgoing for non source/terminal")
+
+        # demands do not overlap slots, rows (e, t, t2, sl) for every d2 other than d
+        for d2 in range(len(demands)):
+            if d == d2:
+                continue
+            Ud2 = U[d2]
+            shape = (E, len(T), Ud2.shape[1], S)
+            cols = np.stack([
+                np.broadcast_to(Ud[:, :, None, :S], shape),
+                np.broadcast_to(Ud2[:, None, :, :S], shape)], axis=4)
+            rows.add(cols, 1, "L", 1, name="demands do not overlap slots")
+
+        rows.add(Ud[:, :, S, None], 1, "E", 0, name="s+1 is set to zero")
+
+        # slots are contiguous, rows (e, t, sl) for v-1 <= sl < S
+        sls = np.arange(v-1, S)
+        window = sls[:, None] + np.arange(-v+1, 1)[None, :]
+        cols = np.concatenate([Ud[:, :, window], Ud[:, :, sls, None], Ud[:, :, sls+1, None]], axis=3)
+        rows.add(cols, [1] * v + [-v, v], "G", 0, name="slots are contiguous")
+
+        # rows (e, t, sl) for sl < v
+        sls = np.arange(0, v)
+        cols = np.concatenate([
+            np.broadcast_to(Ud[:, :, None, :v], (E, len(T), v, v)),
+            Ud[:, :, sls, None],
+            Ud[:, :, sls+1, None]], axis=3)
+        rows.add(cols, [1] * v + [-v, v], "G", 0, name="base slots are contiguous")
+
+        # demand/terminal pair path use the same slots, rows ((e, e2), (t, t2), sl) for e and e2 touching s
+        es = np.flatnonzero((tail == s) | (head == s))
+        e1, e2 = np.repeat(es, len(es)), np.tile(es, len(es))
+        t1, t2 = np.nonzero(t_idx[:, None] != t_idx[None, :])
+        shape = (len(e1), len(t1), S)
+        cols = np.concatenate([
+            np.broadcast_to(Ud[e1[:, None], t1[None, :], None, :S], shape + (S,)),
+            Ud[e2[:, None], t2[None, :], :S, None],
+            Ud[e1[:, None], t1[None, :], :S, None]], axis=3)
+        rows.add(cols, [1] * S + [v, -v], "L", v, name="demand/terminal pair path use the same slots")
+
 def to_res(graph, u, demands, S) -> list[tuple[T_graph, tuple[int, int]]]:
     n = len(graph)
     demand_graphs = [[[] for _ in range(n)] for _ in range(len(demands))]
@@ -204,7 +281,7 @@ def filter_graph(u, graph, demands, d_filter, s_filter_from, s_filter_to) -> T_g
                 continue
             # If for all s in the range, there exists a t such that the variable was taken
             if all([
-                any([abs(u[d_filter,i,j,t,s] - 1) < 0.001 for t in demands[d_filter][1]])
+                any([abs(u.get((d_filter,i,j,t,s), 0) - 1) < 0.001 for t in demands[d_filter][1]])
                     for s in range(s_filter_from, s_filter_to)]):
                 demand_graph[i].append(j)
 
@@ -0,0 +1,60 @@
+from docplex.mp.model import Model
+from solvers.solvers import BaseHook, T_graph, Res, solve_hook
+from solvers.heuristic import first_fit, arcs
+
+"""
+heur_ff solves the instance with the first fit heuristic, without an optimization model.
+
+The heuristic solution is loaded in a model with a y_de variable, fixed to 1, per demand and edge
+used, and the number of edges used as objective. Solving it only evaluates the solution, so the
+export has the same fields as the other solvers and objective_value can be compared with them.
+"""
+
+class Solver():
+
+    def __init__(self, graph: T_graph, S: int, demands: list[tuple[int, set[int], int]], name: str = "") -> None:
+        self._graph = graph
+
+        if name != "":
+            self._name = "{}:{}".format("heur_ff", name)
+        else:
+            self._name = "heur_ff"
+
+        self._demands = demands
+        self._S = S
+        self._hook: BaseHook
+
+    def register_hook(self, hook: BaseHook):
+        self._hook = hook
+
+    def solve(self) -> list[tuple[T_graph, tuple[int, int]]]:
+        with Model(name=self._name, ignore_names=self._hook.ignore_names) as m:
+            return self._solve(m)
+
+    @solve_hook
+    def _solve(self, m: Model) -> Res:
+
+        demands = self._demands
+        S = self._S
+        graph = self._graph
+
+        res = first_fit(graph, S, demands, self._hook.occupied)
+
+        # y_de variables, only for the edges used by the heuristic, fixed to 1
+        y = m.binary_var_dict(keys=sorted(arcs(res)) if res is not None else [], lb=1, name="y")
+
+        m.set_objective("min", m.sum_vars(y.values()))
+
+        self._hook.hook_before_solve(m)
+        if res is None:
+            raise AssertionError("Solution not found: first fit could not allocate every demand")
+
+        solution = m.solve()
+
+        if solution == None:
+            raise AssertionError(f"Solution not found: {m.solve_details}")
+
+        return res
+
+    def name(self):
+        return self._name
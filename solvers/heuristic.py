@@ -0,0 +1,212 @@
+from collections import deque
+from docplex.mp.model import Model
+from docplex.mp.solution import SolveSolution
+from typing import Optional
+from solvers.solvers import BaseHook, T_graph, Res
+from solvers.symmetry import identical
+
+"""
+heuristic builds a feasible solution without CPLEX, it is used as a MIP start by every formulation.
+
+Demands are taken from the largest (volume * terminals) to the smallest. For every demand, each
+left slot s is tried in order and the demand is routed with a shortest path arborescence over the
+arcs whose slots [s, s+v) are still free, the arborescence with the least arcs is kept (the first
+one found on ties), and its slots are marked as used on every arc.
+"""
+
+def first_fit(graph: T_graph, S: int, demands: list[tuple[int, set[int], int]], occupied: dict = None) -> Optional[Res]:
+    """
+    first_fit returns a solution in the same format as the solvers, or None if a demand does not fit.
+    occupied maps an arc to the slot ranges already taken on it, see occupancy.
+    """
+    # used[i][j] is a bitmask of the slots taken on arc (i, j)
+    used = [{j: 0 for j in outgoing} for outgoing in graph]
+    for (i, j), ranges in (occupied or {}).items():
+        for l, r in ranges:
+            used[i][j] |= ((1 << (r - l)) - 1) << l
+    res: list = [None for _ in demands]
+
+    order = sorted(range(len(demands)), key=lambda d: (-demands[d][2]*len(demands[d][1]), d))
+    for d in order:
+        s, T, v = demands[d]
+
+        # no arborescence over free arcs can be shorter than the one over the whole graph
+        shortest = arborescence(graph, s, T, lambda i, j: True)
+        if shortest is None:
+            return None
+
+        best = None
+        for sl in range(S - v + 1):
+            mask = ((1 << v) - 1) << sl
+            tree = arborescence(graph, s, T, lambda i, j: used[i][j] & mask == 0)
+            if tree is not None and (best is None or len(tree) < len(best[0])):
+                best = (tree, sl)
+            if best is not None and len(best[0]) == len(shortest):
+                break
+
+        if best is None:
+            return None
+
+        tree, sl = best
+        mask = ((1 << v) - 1) << sl
+        demand_graph = [[] for _ in range(len(graph))]
+        for i, j in tree:
+            used[i][j] |= mask
+            demand_graph[i].append(j)
+        res[d] = (demand_graph, (sl, sl + v))
+
+    return sort_identical(res, demands)
+
+def sort_identical(res: Res, demands: list[tuple[int, set[int], int]]) -> Res:
+    """
+    sort_identical gives identical demands, which are interchangeable, their allocations sorted by left
+    slot, so the solution holds when their symmetry is broken.
+    """
+    res = list(res)
+    for group in identical(demands):
+        for d, allocation in zip(group, sorted((res[d] for d in group), key=lambda a: a[1])):
+            res[d] = allocation
+    return res
+
+def initial_solution(hook: BaseHook, graph: T_graph, S: int, demands: list[tuple[int, set[int], int]]) -> Optional[Res]:
+    """
+    initial_solution returns the MIP start of a solver, the best known solution of the instance when
+    the hook has one, the first fit solution otherwise.
+    """
+    if hook.incumbent is not None:
+        return sort_identical(hook.incumbent, demands)
+    return first_fit(graph, S, demands, hook.occupied)
+
+def arborescence(graph: T_graph, s: int, T: set[int], free) -> Optional[list[tuple[int, int]]]:
+    """
+    arborescence returns the arcs of the shortest paths tree from s to every terminal in T, using only
+    the arcs (i, j) where free(i, j) holds, or None if a terminal cannot be reached.
+    """
+    parent = {s: s}
+    to_visit = deque([s])
+    while len(to_visit) > 0 and not T <= parent.keys():
+        i = to_visit.popleft()
+        for j in graph[i]:
+            if j not in parent and free(i, j):
+                parent[j] = i
+                to_visit.append(j)
+
+    if not T <= parent.keys():
+        return None
+
+    tree = set()
+    for t in T:
+        j = t
+        while j != s and (parent[j], j) not in tree:
+            tree.add((parent[j], j))
+            j = parent[j]
+    return sorted(tree)
+
+# The functions below translate a solution into the values of the variable families used by the
+# formulations, only the non zero values are returned.
+
+def arcs(res: Res) -> dict:
+    # y_dij, arc (i, j) is used by demand d
+    return {(d, i, j): 1
+            for d, (demand_graph, _) in enumerate(res)
+            for i, outgoing in enumerate(demand_graph)
+            for j in outgoing}
+
+def paths(res: Res, demands) -> dict:
+    # y'_dtij, arc (i, j) is on the path from the source of d to terminal t
+    values = {}
+    for d, (demand_graph, _) in enumerate(res):
+        parent = tree_parents(demand_graph, demands[d][0])
+        for t in demands[d][1]:
+            j = t
+            while j != demands[d][0]:
+                values[d, t, parent[j], j] = 1
+                j = parent[j]
+    return values
+
+def flows(res: Res, demands) -> dict:
+    # f_dij, amount of terminals reached through arc (i, j)
+    values = {}
+    for (d, t, i, j) in paths(res, demands):
+        values[d, i, j] = values.get((d, i, j), 0) + 1
+    return values
+
+def slots(res: Res) -> dict:
+    # x_ds, slot s is used by demand d
+    return {(d, s): 1 for d, (_, (l, r)) in enumerate(res) for s in range(l, r)}
+
+def below(res: Res) -> dict:
+    # a_ds, slot s is lower than every slot of d
+    return {(d, s): 1 for d, (_, (l, _)) in enumerate(res) for s in range(l)}
+
+def above(res: Res, S: int) -> dict:
+    # b_ds, slot s is higher than every slot of d
+    return {(d, s): 1 for d, (_, (_, r)) in enumerate(res) for s in range(r, S)}
+
+def left(res: Res) -> dict:
+    return {d: l for d, (_, (l, _)) in enumerate(res)}
+
+def right(res: Res) -> dict:
+    # right is the last slot used, not the end of the range
+    return {d: r - 1 for d, (_, (_, r)) in enumerate(res)}
+
+def starts(res: Res) -> dict:
+    # l_ds, allocation of d starts at slot s
+    return {(d, l): 1 for d, (_, (l, _)) in enumerate(res)}
+
+def ends(res: Res) -> dict:
+    # r_ds, allocation of d ends right before slot s
+    return {(d, r): 1 for d, (_, (_, r)) in enumerate(res)}
+
+def order(res: Res) -> dict:
+    # p_dd', demands are totally ordered by left slot, ties are broken by index
+    return {(d1, d2): 1
+            for d1, (_, (l1, _)) in enumerate(res)
+            for d2, (_, (l2, _)) in enumerate(res)
+            if (l1, d1) < (l2, d2)}
+
+def before(res: Res) -> dict:
+    # n_dd', every slot of d is lower than every slot of d'
+    return {(d1, d2): 1
+            for d1, (_, (_, r1)) in enumerate(res)
+            for d2, (_, (l2, _)) in enumerate(res)
+            if d1 != d2 and r1 <= l2}
+
+def arc_slots(res: Res) -> dict:
+    # u_dijs, arc (i, j) uses slot s for demand d
+    return {(d, i, j, s): 1
+            for d, i, j in arcs(res)
+            for s in range(*res[d][1])}
+
+def arc_starts(res: Res) -> dict:
+    # l_dijs, arc (i, j) is used by demand d starting at slot s
+    return {(d, i, j, res[d][1][0]): 1 for d, i, j in arcs(res)}
+
+def path_starts(res: Res, demands) -> dict:
+    # l_dijts, arc (i, j) is on the path to terminal t starting at slot s
+    return {(d, i, j, t, res[d][1][0]): 1 for d, t, i, j in paths(res, demands)}
+
+def path_slots(res: Res, demands) -> dict:
+    # u_dijts, arc (i, j) uses slot s on the path from the source of d to terminal t
+    return {(d, i, j, t, s): 1
+            for d, t, i, j in paths(res, demands)
+            for s in range(*res[d][1])}
+
+def tree_parents(demand_graph: T_graph, s: int) -> dict:
+    parent = {}
+    to_visit = [s]
+    while len(to_visit) > 0:
+        i = to_visit.pop()
+        for j in demand_graph[i]:
+            if j not in parent and j != s:
+                parent[j] = i
+                to_visit.append(j)
+    return parent
+
+def add_mip_start(m: Model, values: list[tuple[dict, dict]]):
+    """
+    add_mip_start adds a complete MIP start, values pairs a variable dict with the non zero values
+    of its keys, every other variable starts at 0. Keys without a variable, pruned by the solver, are skipped.
+    """
+    solution = SolveSolution(m, {var_dict[k]: value for var_dict, vs in values for k, value in vs.items() if k in var_dict})
+    m.add_mip_start(solution, complete_vars=True)
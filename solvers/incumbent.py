@@ -0,0 +1,73 @@
+import json
+import math
+import os
+from typing import Optional
+from solvers.solvers import Res
+from solvers.heuristic import paths
+
+"""
+incumbent keeps the best known solution of an instance, shared by every model that solves it.
+
+Solutions are kept as arborescences, only the arcs on the path to some terminal, so their objective,
+the arcs used over every demand, is the same for every formulation and they translate into a MIP
+start for any of them.
+"""
+
+class Incumbent:
+    """
+    Incumbent holds the best solution saved in path, if any, and its objective.
+    """
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.objective = math.inf
+        self.solution: Optional[Res] = None
+        self.model = None
+        if path != "" and os.path.exists(path):
+            self.load()
+
+    def update(self, solution: Res, demands, model: str) -> bool:
+        """
+        update keeps solution, pruned to arborescences, if it improves the incumbent and returns
+        whether it did.
+        """
+        solution = prune(solution, demands)
+        objective = sum(len(outgoing) for demand_graph, _ in solution for outgoing in demand_graph)
+        if objective >= self.objective:
+            return False
+        self.objective = objective
+        self.solution = solution
+        self.model = model
+        return True
+
+    def load(self):
+        with open(self.path, "r") as f:
+            incumbent = json.load(f)
+        self.objective = incumbent["objective"]
+        self.model = incumbent["model"]
+        self.solution = [(demand_graph, (l, r)) for demand_graph, (l, r) in incumbent["solution"]]
+
+    def save(self):
+        if self.path == "" or self.solution is None:
+            return
+        # runs of other models may have saved a better one meanwhile
+        if os.path.exists(self.path) and Incumbent(self.path).objective <= self.objective:
+            return
+        partial = f"{self.path}.{os.getpid()}"
+        with open(partial, "w") as f:
+            json.dump({"objective": self.objective, "model": self.model, "solution": self.solution}, f)
+        os.replace(partial, self.path)
+
+def prune(solution: Res, demands) -> Res:
+    """
+    prune keeps only the arcs of each demand that are on the path from its source to a terminal.
+    """
+    used = paths(solution, demands)
+    pruned = []
+    for d, (demand_graph, allocation) in enumerate(solution):
+        tree = [[] for _ in range(len(demand_graph))]
+        for i, outgoing in enumerate(demand_graph):
+            for j in outgoing:
+                if any((d, t, i, j) in used for t in demands[d][1]) and j not in tree[i]:
+                    tree[i].append(j)
+        pruned.append((tree, tuple(allocation)))
+    return pruned
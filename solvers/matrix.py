@@ -0,0 +1,78 @@
+from collections import defaultdict
+import numpy as np
+import scipy.sparse as sp
+from docplex.mp.model import Model
+
+"""
+matrix builds families of constraints as sparse matrices over the model columns and loads them
+directly into the cplex engine behind a docplex model.
+
+Formulations with variables indexed by (demand, arc, slot) create millions of docplex expressions,
+here a family of constraints is a couple of NumPy arrays until it is handed to cplex.
+"""
+
+def columns(m: Model, var_dict: dict, keys, shape) -> np.ndarray:
+    """
+    columns returns the cplex column of every variable in keys, arranged in shape.
+    """
+    cols = np.fromiter((var_dict[k].index for k in keys), dtype=np.int64)
+    return cols.reshape(shape)
+
+def node_arcs(edges: list[tuple[int, int]], n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    node_arcs returns, for every node, the arcs it touches and the flow coefficient of each one
+    (1 for incoming, -1 for outgoing), padded with arc 0 and coefficient 0 to the largest degree.
+    """
+    tail = np.array([i for i, _ in edges], dtype=np.int64)
+    head = np.array([j for _, j in edges], dtype=np.int64)
+    coefs = (head[None, :] == np.arange(n)[:, None]).astype(np.int64) - \
+            (tail[None, :] == np.arange(n)[:, None]).astype(np.int64)
+
+    width = max(1, int((coefs != 0).sum(axis=1).max(initial=0)))
+    arcs = np.zeros((n, width), dtype=np.int64)
+    vals = np.zeros((n, width), dtype=np.int64)
+    for j in range(n):
+        touching = np.flatnonzero(coefs[j])
+        arcs[j, :len(touching)] = touching
+        vals[j, :len(touching)] = coefs[j, touching]
+    return arcs, vals
+
+class Rows:
+    """
+    Rows loads blocks of linear constraints into the cplex engine of a docplex model.
+
+    A block is given by cols, an array of column indices whose last axis holds the terms of a row,
+    vals, the coefficients broadcast to cols, and rhs, broadcast to the rows.
+    Repeated columns in a row are summed and 0 coefficients are dropped, so rows of different length
+    are padded with any column and coefficient 0.
+    Blocks added under the same name are numbered as a single family.
+    """
+    def __init__(self, m: Model):
+        self._m = m
+        self._cpx = m.get_cplex()
+        self._added = defaultdict(int)
+
+    def add(self, cols, vals, sense: str, rhs, name: str = ""):
+        cols = np.asarray(cols, dtype=np.int64)
+        vals = np.broadcast_to(np.asarray(vals, dtype=np.float64), cols.shape)
+        rhs = np.broadcast_to(np.asarray(rhs, dtype=np.float64), cols.shape[:-1]).ravel()
+
+        n, terms = rhs.size, cols.shape[-1]
+        if n == 0:
+            return
+
+        a = sp.csr_matrix(
+            (vals.ravel(), (np.repeat(np.arange(n), terms), cols.ravel())),
+            shape=(n, self._cpx.variables.get_num()))
+        a.eliminate_zeros()
+
+        ptr, ind, data = a.indptr, a.indices.tolist(), a.data.tolist()
+        names = []
+        if name != "" and not self._m.ignore_names:
+            names = [f"{name}_{self._added[name] + r}" for r in range(n)]
+        self._added[name] += n
+        self._cpx.linear_constraints.add(
+            lin_expr=[[ind[ptr[r]:ptr[r+1]], data[ptr[r]:ptr[r+1]]] for r in range(n)],
+            senses=sense * n,
+            rhs=rhs.tolist(),
+            names=names)
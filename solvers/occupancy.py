@@ -0,0 +1,36 @@
+from docplex.mp.model import Model
+
+"""
+occupancy keeps the demands off the slots already taken on each arc before solving, the spectrum of
+the demands assigned by previous solves (see rolling).
+
+occupied maps an arc (i, j) to the list of [l, r) slot ranges taken on it. Models with a slot per
+demand, x_ds, forbid using an occupied arc and slot together, models with a slot per demand and
+arc fix those variables to 0.
+"""
+
+def taken(occupied: dict, i: int, j: int, S: int) -> list[int]:
+    """
+    taken returns the slots lower than S occupied on arc (i, j).
+    """
+    return sorted({s for l, r in occupied.get((i, j), []) for s in range(max(l, 0), min(r, S))})
+
+def forbid_occupied(m: Model, x: dict, y: dict, occupied: dict, S: int):
+    """
+    forbid_occupied adds x_ds + y_dij <= 1 for every slot s occupied on arc (i, j).
+    """
+    m.add_constraints((x[d, s] + y[d, i, j] <= 1
+                       for d, i, j in y
+                       for s in taken(occupied, i, j, S)),
+                      names="occupied slots are not used")
+
+def fix_occupied(m: Model, var_dict: dict, occupied: dict, arc: int = 1, slot: int = -1) -> int:
+    """
+    fix_occupied fixes to 0 the variables of var_dict whose arc, key[arc] and key[arc+1], is occupied
+    at slot key[slot]. It returns how many were fixed.
+    """
+    removed = [var for k, var in var_dict.items()
+               if any(l <= k[slot] < r for l, r in occupied.get((k[arc], k[arc+1]), []))]
+    if len(removed) > 0:
+        m.change_var_upper_bounds(removed, 0)
+    return len(removed)
@@ -0,0 +1,103 @@
+from docplex.mp.model import Model
+from solvers.solvers import T_graph
+
+"""
+reduction removes, for every demand, the arcs that cannot be part of its arborescence before solving.
+
+An arc (i, j) is kept for a demand from s to T if i is reached from s and j is not s and reaches a
+terminal without going through s. Variables indexed by (demand, terminal, arc) keep the arcs for
+that terminal alone.
+The variables of the removed arcs are not created, the key lists are filtered with kept and the
+variable dicts are wrapped in Reduced, where a removed key reads as a variable fixed to 0, so every
+constraint of the formulation is written as it is.
+"""
+
+def useful_arcs(graph: T_graph, s: int, T: set[int]) -> set[tuple[int, int]]:
+    """
+    useful_arcs returns the arcs of graph kept for a demand from s to T.
+    """
+    forward = {s}
+    to_visit = [s]
+    while len(to_visit) > 0:
+        i = to_visit.pop()
+        for j in graph[i]:
+            if j not in forward:
+                forward.add(j)
+                to_visit.append(j)
+
+    incoming = [[] for _ in range(len(graph))]
+    for i, outgoing in enumerate(graph):
+        for j in outgoing:
+            incoming[j].append(i)
+
+    # nodes that reach a terminal without going through s
+    backward = set(T) - {s}
+    to_visit = list(backward)
+    while len(to_visit) > 0:
+        j = to_visit.pop()
+        for i in incoming[j]:
+            if i not in backward and i != s:
+                backward.add(i)
+                to_visit.append(i)
+
+    return {(i, j) for i in forward for j in graph[i] if j != s and j in backward}
+
+def kept(keys: list, graph: T_graph, demands, arc: int = 1, terminal: int = None, routes: list = None) -> list:
+    """
+    kept returns the keys whose arc, key[arc] and key[arc+1], is kept for demand key[0], or for its
+    terminal key[terminal] when given. When routes[d] is a set of arcs, every arc outside it is
+    removed for demand d as well.
+    """
+    useful = {}
+    res = []
+    for k in keys:
+        group = (k[0],) if terminal is None else (k[0], k[terminal])
+        if group not in useful:
+            s, T, _ = demands[k[0]]
+            useful[group] = useful_arcs(graph, s, T if terminal is None else {k[terminal]})
+            if routes is not None and routes[k[0]] is not None:
+                useful[group] &= routes[k[0]]
+        if (k[arc], k[arc+1]) in useful[group]:
+            res.append(k)
+    return res
+
+class Reduced(dict):
+    """
+    Reduced is a variable dict built from the kept keys. Any other key is a removed arc, it reads as
+    a single variable fixed to 0, created on the first lookup, and is not iterated.
+    """
+    def __init__(self, m: Model, var_dict: dict):
+        dict.__init__(self, var_dict)
+        self._m = m
+        self._zero = None
+
+    def __missing__(self, key):
+        if self._zero is None:
+            self._zero = self._m.continuous_var(lb=0, ub=0)
+        return self._zero
+
+def conflicts(graph: T_graph, S: int, demands) -> tuple[dict, dict]:
+    """
+    conflicts returns the pairs of demands that can use a common arc, with the arcs kept for both.
+
+    The first dict has every ordered pair (d1, d2) that needs an order between its allocations. The
+    second one has the pairs d1 > d2 whose slots do not fit together in S, they can only use
+    different arcs and need no order.
+    """
+    kept = [useful_arcs(graph, s, T) for s, T, _ in demands]
+
+    ordered = {}
+    disjoint = {}
+    for d2 in range(len(demands)):
+        for d in range(len(demands)):
+            if d == d2:
+                continue
+            shared = kept[d] & kept[d2]
+            if len(shared) == 0:
+                continue
+            if demands[d][2] + demands[d2][2] <= S:
+                ordered[d, d2] = shared
+            elif d > d2:
+                disjoint[d, d2] = shared
+
+    return ordered, disjoint
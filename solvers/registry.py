@@ -0,0 +1,80 @@
+import importlib
+
+"""
+registry lists the solvers by model name, the name of their module in solvers. A solver module,
+with docplex and its callbacks, is only imported when the model is requested.
+"""
+
+models = [
+    "dr_bf_m",
+    "dr_bf_f",
+    "dr_bf_c",
+
+    "dr_ob_m",
+    "dr_ob_f",
+    "dr_ob_c",
+
+    "dr_bsa_m",
+    "dr_bsa_f",
+    "dr_bsa_c",
+
+    "dr_sc_m",
+    "dr_sc_f",
+    "dr_sc_c",
+
+    "dr_aov_f",
+    "dr_aov_m",
+    "dr_aov_c",
+
+    "ds_bf_f",
+    "ds_bf_m",
+    "ds_bf_c",
+
+    "ds_acc_m",
+    "ds_acc_f",
+    "ds_acc_c",
+
+    "nls_f",
+    "nls_m",
+    "nls_c",
+
+    "dsl_bf_m",
+    "dsl_bf_c",
+    "dsl_ascc_c",
+    "dsl_asb_c",
+
+    "drl_bf_m",
+    "drl_bf_c",
+
+    "cg_pb",
+    "bd_c",
+
+    "heur_ff",
+]
+
+# models whose objective averages the arcs of the path to every terminal, it is not the arcs used
+# and cannot be compared with the rest
+averaged = {"dsl_bf_m", "drl_bf_m"}
+
+# models that build a solution without proving it optimal, cg_pb only searches the columns it generated
+heuristics = {"heur_ff", "cg_pb"}
+
+# models whose constraints leave out some valid solutions, dr_ob never uses the last slot, so the
+# incumbent of the instance may not be a solution of theirs and their optimum does not prove the
+# optimum of the instance
+restricted = {"dr_ob_m", "dr_ob_f", "dr_ob_c"}
+
+# models that keep off the slots occupied on each arc, see solvers.occupancy
+occupancy = {"ds_bf_f", "ds_bf_m", "ds_bf_c", "ds_acc_m", "ds_acc_f", "ds_acc_c", "nls_f", "nls_m", "nls_c",
+             "dsl_bf_m", "dsl_bf_c", "dsl_ascc_c", "dsl_asb_c", "cg_pb", "bd_c", "heur_ff"}
+
+def solver(model: str):
+    """
+    solver imports the module of model and returns its Solver class.
+    """
+    if model not in models:
+        raise KeyError(f"Model {model} not found")
+    return importlib.import_module(f"solvers.{model}").Solver
+
+def solvers() -> list:
+    return [solver(model) for model in models]
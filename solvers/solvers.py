@@ -10,6 +10,27 @@ def solve_hook(func: Callable[[Any, Model], Res]):
     return wrapper
 
 class BaseHook:
+    # ignore_names skips variable and constraint names when building the model
+    ignore_names = False
+    # matrix loads the larger constraint families as sparse matrices, where the solver supports it
+    matrix = False
+    # mip_start adds the first fit heuristic solution as a MIP start
+    mip_start = False
+    # user_cuts separates the cut based constraints on fractional solutions too, where supported
+    user_cuts = False
+    # cut_pool, if set, keeps the cuts found and preloads the ones from previous runs, where supported
+    cut_pool = None
+    # reduce fixes to 0 the arc variables of the arcs that cannot be used by a demand
+    reduce = False
+    # symmetry orders identical demands by their allocation
+    symmetry = False
+    # incumbent, if set, is the best known solution of the instance, used as MIP start
+    incumbent = None
+    # routes, if set, restricts every demand d with routes[d] not None to those arcs, when reducing
+    routes = None
+    # occupied, if set, maps an arc (i, j) to the slot ranges [l, r) already taken on it, where supported
+    occupied = None
+
     def __init__(self):
         return
     
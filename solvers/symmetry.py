@@ -0,0 +1,39 @@
+from collections import defaultdict
+from docplex.mp.model import Model
+
+"""
+symmetry breaks the symmetry between identical demands, those with the same source, terminals and
+slots. Swapping the routing and allocation of two identical demands gives another solution with the
+same objective, so identical demands are ordered by a value of their own allocation, their left
+slot or any expression that depends only on their variables.
+"""
+
+def identical(demands) -> list[list[int]]:
+    """
+    identical returns the groups of two or more identical demands, each one sorted by index.
+    """
+    groups = defaultdict(list)
+    for d, (s, T, v) in enumerate(demands):
+        groups[s, frozenset(T), v].append(d)
+    return [group for group in groups.values() if len(group) > 1]
+
+def break_symmetry(m: Model, demands, left: dict) -> int:
+    """
+    break_symmetry adds left[d] <= left[d'] for every identical demands d < d', consecutive in their
+    group. It returns the number of constraints added.
+    """
+    pairs = [(d1, d2) for group in identical(demands) for d1, d2 in zip(group, group[1:])]
+    m.add_constraints((left[d1] <= left[d2] for d1, d2 in pairs),
+                      names="identical demands are ordered by left slot")
+    return len(pairs)
+
+def weighted_slots(m: Model, var_dict: dict, keep=lambda k: True) -> dict:
+    """
+    weighted_slots returns, per demand, the sum of the variables of var_dict weighted by their slot.
+    Keys are (d, ..., s), only the ones where keep(k) holds are added.
+    """
+    terms = defaultdict(list)
+    for k, var in var_dict.items():
+        if keep(k):
+            terms[k[0]].append((var, k[-1]))
+    return defaultdict(m.linear_expr, {d: m.scal_prod([var for var, _ in t], [s for _, s in t]) for d, t in terms.items()})
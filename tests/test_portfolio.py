@@ -0,0 +1,20 @@
+import portfolio
+
+"""
+test_portfolio races restricted models against exact ones, a restricted model must not stop the race
+with an optimum that is not the optimum of the instance.
+"""
+
+# a ring of 5 nodes, both demands fit on the 2 arc path only if one of them takes the last slot,
+# which dr_ob never uses, so its optimum is 5 while the instance optimum is 4
+RING = {
+    "name": "ring",
+    "graph": [[1, 4], [0, 2], [1, 3], [2, 4], [3, 0]],
+    "S": 2,
+    "demands": [(0, {2}, 1), (0, {2}, 1)],
+}
+
+def test_restricted_model_does_not_prove_optimality():
+    model, objective = portfolio.race(["dr_ob_m", "dr_bf_m"], RING, timeout_seconds=30, export=False)
+    assert model == "dr_bf_m"
+    assert objective == 4
@@ -11,6 +11,7 @@ from typing import Callable,List
 from multiprocessing import Process, Manager
 from cplex import Aborter
 from solvers.solvers import Res
+from docplex.util.status import JobSolveStatus
 import time
 
 class Export:
@@ -20,9 +21,12 @@ class Export:
             exportcall.linear_relaxation = callback.get_best_objective_value()
         return
     
-    def __init__(self, path="export"):
+    def __init__(self, path="export", lower_bound: dict = None):
         self.path = path
         self.linear_relaxation = None
+        self.lower_bound = lower_bound
+        # the objective of the incumbent, when it is proved optimal by the cutoff, see Cutoff
+        self.known_objective = None
 
     def call(self) -> Callable[[MIPInfoCallback], None]:
         return lambda c: Export.callback(c, self)
@@ -43,8 +47,14 @@ class Export:
                     json_export[f"cuts_{k}"] = v
             
                 json_export["objective_value"] = m.solution.objective_value
-
-        json_export["constraints"] = m.number_of_constraints
+            elif self.known_objective is not None:
+                json_export["objective_value"] = self.known_objective
+                json_export["incumbent_optimal"] = True
+
+        # the families loaded as sparse matrices, see solvers.matrix, go straight into cplex and
+        # docplex does not count them
+        json_export["constraints"] = m.number_of_constraints - m.number_of_linear_constraints + \
+            m.get_cplex().linear_constraints.get_num()
         json_export["name"] = m.name
         json_export["variables_binary"] = m.number_of_binary_variables
         json_export["variables_integer"] = m.number_of_integer_variables
@@ -54,6 +64,8 @@ class Export:
         
         json_export["linear_relaxation"] = self.linear_relaxation
 
+        self.export_lower_bound(json_export)
+
         if e is not None:
             json_export["exception"] = f"{e.__class__}:{str(e)}"
 
@@ -63,6 +75,23 @@ class Export:
         #if m.solution is not None:
         #    m.solution.export(f"{self.path}/{m.name}_solution.json")
 
+    def export_progress(self, name: str, objective, progress: list):
+        """
+        export_progress exports a search made of several solves, with the objective of its best
+        solution and the progress of the objective over time.
+        """
+        json_export = {"name": name, "objective_value": objective, "progress": progress}
+        self.export_lower_bound(json_export)
+
+        with open(f"{self.path}/{name}_solution_details.json", "w") as f:
+            json.dump(json_export, f, sort_keys=True)
+
+    def export_lower_bound(self, json_export: dict):
+        if self.lower_bound is not None:
+            # an infinite bound, an infeasible instance, is exported as null
+            json_export["lower_bound"] = self.lower_bound["arcs"] if self.lower_bound["arcs"] != float("inf") else None
+            json_export["lower_bound_violations"] = self.lower_bound["violations"]
+
 
 class Timeout:
     def __init__(self, timeout: timedelta):
@@ -72,20 +101,117 @@ class Timeout:
         m.set_time_limit(self.timeout.seconds)
         return
 
+class Cutoff:
+    """
+    Cutoff keeps the solver off the solutions worse than the incumbent. When the model has no
+    solution under the cutoff, none is better than the incumbent, so it is optimal and returned.
+    """
+    # cplex statuses of a model proved infeasible
+    INFEASIBLE = {3, 4, 103, 119}
+
+    def __init__(self, cutoff: float, incumbent: Res = None):
+        self.cutoff = cutoff
+        self.incumbent = incumbent
+        self.proved = False
+        self.objective = None
+        if incumbent is not None:
+            self.objective = sum(len(outgoing) for demand_graph, _ in incumbent for outgoing in demand_graph)
+
+    def hook_before_solve(self, m: Model):
+        m.parameters.mip.tolerances.uppercutoff = self.cutoff
+        return
+
+    def wrap(self, m: Model, f: Callable[[], Res]) -> Res:
+        try:
+            return f()
+        except AssertionError:
+            if self.incumbent is None or m.solve_details is None or m.solve_details.status_code not in Cutoff.INFEASIBLE:
+                raise
+        print(f"cutoff: no solution under {self.cutoff}, the incumbent is optimal")
+        self.proved = True
+        return self.incumbent
+
+class Threads:
+    def __init__(self, threads: int):
+        self.threads = threads
+
+    def hook_before_solve(self, m: Model):
+        m.parameters.threads = self.threads
+        return
+
+class Portfolio:
+    """
+    Portfolio shares the best objective among solvers racing on the same instance in different
+    processes. A solver stops when its bound cannot improve the shared incumbent or when another
+    one proved optimality.
+
+    incumbent and winner are multiprocessing values, optimal a multiprocessing event. Solvers whose
+    objective is not the arcs used (share=False) do not take part in the incumbent, and solvers whose
+    optimal status does not prove optimality of the instance, as heuristics or restricted models,
+    have prove=False.
+    """
+    def __init__(self, index: int, incumbent, winner, optimal, share: bool = True, prove: bool = True):
+        self.index = index
+        self.incumbent = incumbent
+        self.winner = winner
+        self.optimal = optimal
+        self.share = share
+        self.prove = prove
+
+    @staticmethod
+    def callback(callback: MIPInfoCallback, portfolio: 'Portfolio'):
+        if portfolio.optimal.is_set():
+            callback.abort()
+            return
+        if not portfolio.share:
+            return
+
+        own = callback.get_incumbent_objective_value() if callback.has_incumbent() else float("inf")
+        with portfolio.incumbent.get_lock():
+            if own < portfolio.incumbent.value:
+                portfolio.incumbent.value = own
+                portfolio.winner.value = portfolio.index
+            best = portfolio.incumbent.value
+
+        # another solver found a solution this one cannot improve
+        if own > best + 1e-6 and callback.get_best_objective_value() >= best - 1e-6:
+            callback.abort()
+
+    def call(self) -> Callable[[MIPInfoCallback], None]:
+        return lambda c: Portfolio.callback(c, self)
+
+    def solved(self, m: Model):
+        if not self.share or m.solution is None:
+            return
+        with self.incumbent.get_lock():
+            if m.solution.objective_value < self.incumbent.value:
+                self.incumbent.value = m.solution.objective_value
+                self.winner.value = self.index
+        if self.prove and m.solve_status == JobSolveStatus.OPTIMAL_SOLUTION:
+            self.optimal.set()
+
 class HookMIPInfoCallback:
-    calls : List[Callable[[MIPInfoCallback], None]] = []
+    def __init__(self):
+        # calls are kept per hook, a process solving several instances does not accumulate them
+        self.calls: List[Callable[[MIPInfoCallback], None]] = []
+        self._models = set()
 
     def register_call(self, call: Callable[[MIPInfoCallback], None]):
         self.calls.append(call)
 
     def hook_before_solve(self, m):
+        # the callback is registered once per model, even if it is solved more than once
+        if id(m) in self._models:
+            return
+        self._models.add(id(m))
         cb = m.register_callback(_HookMIPInfoCallback)
-        for c in self.calls:
-            cb._calls.append(c)
+        cb._calls = list(self.calls)
 
 class _HookMIPInfoCallback(MIPInfoCallback):
 
-    _calls : List[Callable[[MIPInfoCallback], None]] = []
+    def __init__(self, env):
+        self._calls: List[Callable[[MIPInfoCallback], None]] = []
+        MIPInfoCallback.__init__(self, env)
 
     def __call__(self):
         for c in self._calls: